@@ -1,2 +1,2 @@
 from demeter_fetch.common._typing import *
-from demeter_fetch.core import download_by_config
+from demeter_fetch.core import download_by_config, download_by_configs, fetch_frames, iter_frames
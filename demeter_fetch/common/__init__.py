@@ -1,3 +1,6 @@
 from ._typing import *
 from .utils import *
-from .nodes import Node, DailyNode, EmptyNamedTuple, DailyParam, AaveDailyNode
+from .nodes import Node, DailyNode, EmptyNamedTuple, DailyParam, AaveDailyNode, is_daily_node, WorkEstimate
+from .result_cache import ResultCache
+from .file_cache import FileCache
+from .manifest import RunManifest, get_manifest
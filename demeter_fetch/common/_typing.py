@@ -28,6 +28,9 @@ ChainTypeConfig = {
         "uniswap_proxy_addr": "0xc36442b4a4522e871399cd717abdd847ab11fe88",
         "aave_v3_pool_addr": "0x87870bca3f3fd6335c3f4ce8392d69350b4fa4e2",
         "squeeth_controller": "0x64187ae08781b09368e6253f9e94951243a493d5",
+        # blocks are produced in slots of fixed seconds since block_interval_since(the merge), slots might be skipped
+        "block_interval": 12,
+        "block_interval_since": 15537394,
     },
     ChainType.polygon: {
         "allow": [DataSource.big_query, DataSource.rpc, DataSource.chifra],
@@ -39,6 +42,8 @@ ChainTypeConfig = {
         "allow": [DataSource.rpc, DataSource.chifra],
         "query_height_api": "https://api-optimistic.etherscan.io/api?module=block&action=getblocknobytime&timestamp=%1&closest=%2",
         "uniswap_proxy_addr": "0xc36442b4a4522e871399cd717abdd847ab11fe88",
+        "block_interval": 2,
+        "block_interval_since": 105235063,
     },
     ChainType.arbitrum: {
         "allow": [DataSource.rpc, DataSource.chifra],
@@ -59,6 +64,8 @@ ChainTypeConfig = {
         "allow": [DataSource.rpc, DataSource.chifra],
         "query_height_api": "https://api.basescan.org/api?module=block&action=getblocknobytime&timestamp=%1&closest=%2",
         "uniswap_proxy_addr": "0x03a520b32c04bf3beef7beb72e919cf822ed34f1",
+        "block_interval": 2,
+        "block_interval_since": 0,
     },
 }
 
@@ -88,14 +95,62 @@ class BigQueryConfig:
     auth_file: str
 
 
+@dataclass
+class RpcEndpoint:
+    url: str
+    weight: float = 1  # share of requests, compared with other end points
+    rate_limit: float = 0  # max requests per second, 0 means no limit
+    auth_string: str | None = None
+
+
+@dataclass
+class RetryPolicy:
+    retries: int = 3
+    base_delay: float = 1  # seconds, the n-th retry waits base_delay * 2 ** n with jitter
+    max_delay: float = 60
+
+
+# retry policies of error classes, errors of other classes are raised at once
+DEFAULT_RETRY_POLICIES = {
+    "rate_limit": RetryPolicy(6, 1, 60),  # http 429, or json rpc error about rate limit
+    "server_error": RetryPolicy(3, 1, 30),  # http 5xx
+    "timeout": RetryPolicy(2, 1, 10),  # not for eth_getLogs, its block range is split instead
+    "connection": RetryPolicy(3, 1, 30),
+    "rpc_error": RetryPolicy(0),  # other json rpc errors, they are usually caused by request
+}
+
+# compute units of methods, used by rate limiter
+DEFAULT_COMPUTE_UNIT = 20
+DEFAULT_COMPUTE_UNITS = {
+    "eth_blockNumber": 10,
+    "eth_getBlockByNumber": 16,
+    "eth_getTransactionByHash": 17,
+    "eth_getTransactionReceipt": 15,
+    "eth_getLogs": 75,
+}
+
+
 @dataclass
 class RpcConfig:
-    end_point: str
+    end_point: str  # the first end point if there are more than one
     batch_size: int = 500
     auth_string: str | None = None
     keep_tmp_files: bool = False
     etherscan_api_key: str = None
     force_no_proxy: bool = False  # if set to true, will ignore proxy setting
+    async_client: bool = False  # use asyncio client, which can keep more requests in flight, aiohttp is required
+    concurrency: int = 10  # max requests in flight, e.g. block timestamps, transactions and get_logs in a tmp file
+    json_rpc_batch_size: int = 1  # max requests in a json rpc batch(an array in one post), 1 means no batch
+    end_points: List[RpcEndpoint] = field(default_factory=list)  # requests are spread among end points
+    hedge: bool = True  # if a request is slow, send it to another end point too, and take the faster response
+    retry: Dict[str, RetryPolicy] = field(default_factory=lambda: dict(DEFAULT_RETRY_POLICIES))
+    requests_per_second: float = 0  # limit of all end points in a process, 0 means no limit
+    compute_units_per_second: float = 0
+    compute_units: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_COMPUTE_UNITS))
+    sweep_range: bool = False  # query logs of consecutive days in one sweep, and split them by day
+    proxy_lp_by_pool: bool = False  # query proxy lp logs from receipts of lp transactions of the pool
+    interpolate_timestamp: bool = True  # compute timestamps of blocks in consecutive slots instead of querying them
+    etherscan_fallback: bool = True  # query height range of days from etherscan if searching them by rpc failed
 
 
 @dataclass
@@ -151,6 +206,15 @@ class ToConfig:
     skip_existed: bool = False
     keep_raw: bool = False
     to_file_type: ToFileType = ToFileType.csv
+    process_count: int | None = None  # worker count when multi_process is enabled, default is cpu count
+    node_workers: int = 1  # how many nodes can run at the same time, 1 means run nodes one by one
+    node_concurrency: Dict[str, int] = field(default_factory=dict)  # max running count of nodes with the same name
+    pipeline: bool = False  # process day by day through all nodes, instead of node by node
+    memory_cache: bool = False  # pass results between daily nodes in memory instead of files, only in pipeline mode
+    cache_path: str | None = None  # folder of persistent cache for raw data, shared by configs and runs
+    cache_max_size: int = 10240  # max size of cache folder in MB
+    report_path: str | None = None  # save time and size of work to this file, csv if ends with .csv, otherwise json
+    prometheus_path: str | None = None  # save metrics in prometheus text format, for node_exporter textfile collector
 
 
 class KECCAK(str, Enum):
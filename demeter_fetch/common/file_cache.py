@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2024-03-22 11:05
+# @Author  : 32ethers
+# @Description: Persistent cache of node results, shared by different configs and runs
+import hashlib
+import os
+import pickle
+import threading
+
+from .utils import print_log
+
+CACHE_VERSION = "1"  # change this if format of cached data is changed
+
+
+class FileCache:
+    """
+    Content addressed cache in a folder. Key is a string describing the data, e.g. chain, source, contract, topics and day,
+    value is saved as a pickle file named by the hash of key.
+
+    When total size exceeds max_size, least recently used files will be removed.
+    It's safe to share the folder between processes, files are written to a temporary file and then renamed.
+    """
+
+    file_ext = ".cache.pkl"
+
+    def __init__(self, path: str, max_size: int):
+        """
+        :param path: cache folder
+        :param max_size: max size of cache folder in bytes
+        """
+        self.path = path
+        self.max_size = max_size
+        if not os.path.exists(path):
+            os.makedirs(path, exist_ok=True)
+
+    def _get_file_path(self, key: str) -> str:
+        key_hash = hashlib.sha1(f"{CACHE_VERSION}:{key}".encode()).hexdigest()
+        return os.path.join(self.path, key_hash + FileCache.file_ext)
+
+    def get(self, key: str):
+        """
+        :return: cached object, None if not found
+        """
+        file_path = self._get_file_path(key)
+        try:
+            with open(file_path, "rb") as f:
+                data = pickle.load(f)
+            os.utime(file_path)  # mark as recently used
+            return data
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError) as e:
+            print_log(f"Cache file {file_path} is broken, will ignore it, error: {e}")
+            return None
+
+    def has(self, key: str) -> bool:
+        return os.path.exists(self._get_file_path(key))
+
+    def put(self, key: str, data):
+        file_path = self._get_file_path(key)
+        tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(data, f)
+        os.replace(tmp_path, file_path)
+        self.evict()
+
+    def evict(self):
+        files = []
+        total_size = 0
+        for file_name in os.listdir(self.path):
+            if not file_name.endswith(FileCache.file_ext):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, file_name))
+            except FileNotFoundError:  # removed by other process
+                continue
+            files.append((stat.st_mtime, stat.st_size, file_name))
+            total_size += stat.st_size
+        if total_size <= self.max_size:
+            return
+        files.sort()
+        for mtime, size, file_name in files:
+            try:
+                os.remove(os.path.join(self.path, file_name))
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            if total_size <= self.max_size:
+                break
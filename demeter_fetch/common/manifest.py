@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2024-03-25 10:30
+# @Author  : 32ethers
+# @Description: Record state of generated files, so re-runs only process stale or missing files
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, NamedTuple
+
+MANIFEST_FILE_NAME = "manifest.jsonl"
+CODE_VERSION = "1.1.2"  # keep the same as setup.py
+
+
+class ManifestRecord(NamedTuple):
+    node: str
+    file: str  # file name, relative to save path
+    param: str
+    status: str  # done
+    rows: int
+    size: int
+    md5: str
+    source: str
+    version: str
+    time: str
+    mtime: float = 0  # modified time of file when recorded, 0 for lines of former versions
+
+
+def get_file_md5(path: str) -> str:
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+class RunManifest:
+    """
+    A json-lines file in save path, every line records a file generated by a node,
+    including row count, size, md5, data source and code version. Later lines override former lines of the same file.
+
+    A file is done only if it's recorded as done, with the same data source and code version, and the file is not
+    modified. A file with the recorded size and modified time is not read again, otherwise its md5 is compared.
+    Files are saved to a temporary file and renamed before recorded, so a half-written file won't be taken as done.
+    Appending lines is safe for threads and processes, as every line is written with one call in append mode.
+    """
+
+    STATUS_DONE = "done"
+
+    def __init__(self, path: str):
+        """
+        :param path: save path of files
+        """
+        self.path = path
+        self.file_path = os.path.join(path, MANIFEST_FILE_NAME)
+        self._lock = threading.Lock()
+        self._records: Dict[str, ManifestRecord] = {}
+        self._offset = 0  # lines before offset have been loaded
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        """
+        Load lines appended since last loading, they might be written by other processes.
+        """
+        if not os.path.exists(self.file_path):
+            return
+        with open(self.file_path, "rb") as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b"\n"):  # being written
+                    break
+                self._offset += len(line)
+                try:
+                    record = ManifestRecord(**json.loads(line))
+                except (ValueError, TypeError):  # broken if crashed while writing
+                    continue
+                self._records[record.file] = record
+
+    def get(self, file_path: str) -> ManifestRecord | None:
+        file_name = os.path.basename(file_path)
+        with self._lock:
+            if file_name not in self._records:
+                self._load()
+            return self._records.get(file_name)
+
+    def add(self, node: str, file_path: str, param: str, rows: int, source: str):
+        record = ManifestRecord(
+            node=node,
+            file=os.path.basename(file_path),
+            param=param,
+            status=RunManifest.STATUS_DONE,
+            rows=rows,
+            size=os.path.getsize(file_path),
+            md5=get_file_md5(file_path),
+            source=source,
+            version=CODE_VERSION,
+            time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            mtime=os.path.getmtime(file_path),
+        )
+        line = json.dumps(record._asdict()) + "\n"
+        with self._lock:
+            with open(self.file_path, "a") as f:
+                f.write(line)
+            self._records[record.file] = record
+
+    def is_done(self, file_path: str, source: str) -> bool:
+        record = self.get(file_path)
+        if record is None or record.status != RunManifest.STATUS_DONE or record.source != source:
+            return False
+        if record.version != CODE_VERSION:  # generated by other versions
+            return False
+        try:
+            if os.path.getsize(file_path) != record.size:
+                return False
+            if os.path.getmtime(file_path) == record.mtime:
+                return True
+            return get_file_md5(file_path) == record.md5  # e.g. touched or copied, but content is the same
+        except FileNotFoundError:  # e.g. removed because keep_raw is false
+            return False
+
+
+_manifests: Dict[str, RunManifest] = {}
+_manifests_lock = threading.Lock()
+
+
+def get_manifest(path: str) -> RunManifest:
+    """
+    Get manifest of a save path, manifest of the same path is shared by nodes in the same process.
+    """
+    key = os.path.abspath(path)
+    with _manifests_lock:
+        if key not in _manifests:
+            _manifests[key] = RunManifest(path)
+        return _manifests[key]
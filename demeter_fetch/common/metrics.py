@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2024-03-27 10:05
+# @Author  : 32ethers
+# @Description: Time and size of work done by nodes
+import csv
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List
+
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+
+
+def get_peak_rss() -> int:
+    """
+    :return: peak resident memory of current process in bytes, 0 if not available
+    """
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # kilobytes on linux
+
+
+@dataclass
+class WorkRecord:
+    """
+    Metrics of a node processing one param, e.g. a day
+    """
+
+    node: str
+    param: str
+    pid: int = 0
+    seconds: float = 0
+    sections: Dict[str, float] = field(default_factory=dict)  # seconds spent in read, process, save and so on
+    rows_in: int = 0
+    rows_out: int = 0
+    bytes_read: int = 0
+    bytes_written: int = 0
+    peak_rss: int = 0
+
+
+def _empty_summary(seconds: float) -> Dict:
+    return {
+        "seconds": seconds,  # wall time, it's sum of work_seconds if node runs day by day in pipeline mode
+        "work_seconds": 0,
+        "count": 0,
+        "sections": {},
+        "rows_in": 0,
+        "rows_out": 0,
+        "bytes_read": 0,
+        "bytes_written": 0,
+        "peak_rss": 0,
+    }
+
+
+class MetricsCollector:
+    """
+    Collect work records and running time of nodes in a run
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records: List[WorkRecord] = []
+        self.node_seconds: Dict[str, float] = {}  # wall time of nodes
+
+    def add(self, record: WorkRecord):
+        with self._lock:
+            self.records.append(record)
+
+    def add_node_seconds(self, node: str, seconds: float):
+        with self._lock:
+            self.node_seconds[node] = self.node_seconds.get(node, 0) + seconds
+
+    def summary(self) -> Dict[str, Dict]:
+        """
+        Sum records of every node
+        """
+        nodes: Dict[str, Dict] = {}
+        with self._lock:
+            for record in self.records:
+                if record.node not in nodes:
+                    nodes[record.node] = _empty_summary(self.node_seconds.get(record.node, 0))
+                item = nodes[record.node]
+                item["count"] += 1
+                item["work_seconds"] += record.seconds
+                for name, seconds in record.sections.items():
+                    item["sections"][name] = item["sections"].get(name, 0) + seconds
+                for key in ["rows_in", "rows_out", "bytes_read", "bytes_written"]:
+                    item[key] += getattr(record, key)
+                item["peak_rss"] = max(item["peak_rss"], record.peak_rss)
+            for node, seconds in self.node_seconds.items():
+                if node not in nodes:  # e.g. all days have existed
+                    nodes[node] = _empty_summary(seconds)
+            for node, item in nodes.items():
+                if node not in self.node_seconds:
+                    item["seconds"] = item["work_seconds"]
+        return nodes
+
+    def save_report(self, path: str):
+        """
+        Save records to a csv file if path ends with .csv, otherwise to a json file with summary of nodes
+        """
+        if path.endswith(".csv"):
+            with self._lock:
+                records = list(self.records)
+            section_names = sorted({name for r in records for name in r.sections.keys()})
+            columns = ["node", "param", "pid", "seconds", "rows_in", "rows_out", "bytes_read", "bytes_written"]
+            columns += ["peak_rss"] + [f"{name}_seconds" for name in section_names]
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f, lineterminator="\n")
+                writer.writerow(columns)
+                for r in records:
+                    row = [getattr(r, c) for c in columns[:9]] + [r.sections.get(n, 0) for n in section_names]
+                    writer.writerow(row)
+        else:
+            report = {"nodes": self.summary(), "records": [asdict(r) for r in self.records]}
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+
+    def save_prometheus(self, path: str):
+        """
+        Save summary of nodes in prometheus text format, for node_exporter textfile collector.
+        File is written to a temporary file and renamed, so collector won't read a half-written file.
+        """
+        lines = []
+
+        def add_metric(name: str, help_text: str, values: List):
+            lines.append(f"# HELP demeter_fetch_{name} {help_text}")
+            lines.append(f"# TYPE demeter_fetch_{name} gauge")
+            for labels, value in values:
+                label_str = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"demeter_fetch_{name}{{{label_str}}} {value}")
+
+        nodes = self.summary()
+        add_metric("node_seconds", "Wall time of node", [({"node": n}, v["seconds"]) for n, v in nodes.items()])
+        add_metric(
+            "node_section_seconds",
+            "Time spent in sections of node",
+            [({"node": n, "section": s}, t) for n, v in nodes.items() for s, t in v["sections"].items()],
+        )
+        for key, help_text in [
+            ("rows_in", "Rows read from depends"),
+            ("rows_out", "Rows generated"),
+            ("bytes_read", "Bytes of files read from depends"),
+            ("bytes_written", "Bytes of files written"),
+            ("peak_rss", "Peak resident memory in bytes"),
+        ]:
+            add_metric(f"node_{key}", help_text, [({"node": n}, v[key]) for n, v in nodes.items()])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+
+_collector = MetricsCollector()
+_local = threading.local()  # record of the work running in current thread
+
+
+def get_metrics() -> MetricsCollector:
+    return _collector
+
+
+def set_metrics(collector: MetricsCollector):
+    global _collector
+    _collector = collector
+
+
+def _current_record() -> WorkRecord | None:
+    return getattr(_local, "record", None)
+
+
+@contextmanager
+def record_work(node: str, param: str):
+    """
+    Record metrics of work in this context, record will be added to collector if work is finished
+    """
+    record = WorkRecord(node, param, pid=os.getpid())
+    previous = _current_record()
+    _local.record = record
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        _local.record = previous
+    record.seconds = time.perf_counter() - start
+    record.peak_rss = get_peak_rss()
+    get_metrics().add(record)
+
+
+@contextmanager
+def section(name: str):
+    """
+    Time a section of current work, e.g. section("query_event_by_height").
+    Time of sections with the same name will be summed
+    """
+    record = _current_record()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if record is not None:
+            record.sections[name] = record.sections.get(name, 0) + time.perf_counter() - start
+
+
+@contextmanager
+def record_node(node: str):
+    """
+    Record wall time of a node
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:  # time of a failed node is recorded too
+        get_metrics().add_node_seconds(node, time.perf_counter() - start)
+
+
+def add_rows_in(rows: int):
+    record = _current_record()
+    if record is not None:
+        record.rows_in += rows
+
+
+def add_rows_out(rows: int):
+    record = _current_record()
+    if record is not None:
+        record.rows_out += rows
+
+
+def add_bytes_read(size: int):
+    record = _current_record()
+    if record is not None:
+        record.bytes_read += size
+
+
+def add_bytes_written(size: int):
+    record = _current_record()
+    if record is not None:
+        record.bytes_written += size
+
+
+def run_and_collect(func, param) -> List[WorkRecord]:
+    """
+    Call func(param) in a child process, and return records, so they can be added to collector of main process
+    """
+    collector = MetricsCollector()
+    set_metrics(collector)
+    func(param)
+    return collector.records
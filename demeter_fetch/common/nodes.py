@@ -3,21 +3,77 @@
 # @Time    : 2024-01-09 11:21
 # @Author  : 32ethers
 # @Description:
+import multiprocessing
 from collections import namedtuple
-from datetime import timedelta, date
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
 
 import os
-from typing import List, Dict, Callable, Tuple
+import threading
+from typing import List, Dict, Callable, Tuple, NamedTuple
 
 import pandas as pd
 from tqdm import tqdm
 
-from ._typing import Config, FromConfig, ToFileType
+from . import metrics
+from ._typing import Config, FromConfig, ToFileType, ToConfig
+from .file_cache import FileCache
+from .manifest import get_manifest
+from .result_cache import ResultCache
 from .utils import TimeUtil, set_global_pbar, get_depend_name
 
 EmptyNamedTuple = namedtuple("EmptyNamedTuple", [])
 
 
+class WorkEstimate(NamedTuple):
+    """
+    Requests a node will send to data source, None means unknown
+    """
+
+    get_logs_calls: int | None = None  # eth_getLogs requests
+    timestamp_lookups: int | None = None  # max count of block timestamp requests, blocks in height cache are excluded
+    bytes_scanned: int | None = None  # bytes processed by BigQuery
+
+
+# processes of day pools are spawned instead of forked. The caller might be a worker thread of scheduler, or there are
+# threads of rpc clients, forking while other threads hold locks (e.g. of sqlite, logging or connection pools)
+# can deadlock the child.
+_PROCESS_CONTEXT = multiprocessing.get_context("spawn")
+
+_worker_func: Callable[[date], None] | None = None  # func of days in a child process of _run_by_day
+
+
+def _init_day_worker(func: Callable[[date], None]):
+    global _worker_func
+    set_global_pbar(None)
+    _worker_func = func
+
+
+def _run_day_in_worker(day: date) -> List[metrics.WorkRecord]:
+    return metrics.run_and_collect(_worker_func, day)
+
+
+def _run_by_day(func: Callable[[date], None], days: List[date], to_config: ToConfig, pbar: tqdm):
+    """
+    Call func for every day. If multi_process is enabled, days will be dispatched to a process pool,
+    and process bar will be updated in the order of days. Metrics recorded in child processes are sent back.
+    func(e.g. a bound method of node) is sent to every child process once, then only days are sent.
+    """
+    if to_config.multi_process and len(days) > 1:
+        max_workers = min(to_config.process_count or os.cpu_count(), len(days))
+        with ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=_PROCESS_CONTEXT, initializer=_init_day_worker, initargs=(func,)
+        ) as executor:
+            for records in executor.map(_run_day_in_worker, days):
+                for record in records:
+                    metrics.get_metrics().add(record)
+                pbar.update()
+    else:
+        for day in days:
+            func(day)
+            pbar.update()
+
+
 class Node:
 
     name = "ParentNode"
@@ -29,9 +85,20 @@ class Node:
         self.config: Config | None = None
         self.from_config: FromConfig | None = None
         self.to_path: str | None = None
+        # if result_cache is set, result will be passed to consumers in memory
+        self.result_cache: ResultCache | None = None
+        self.consumer_count = 0
+        self.persist = True  # if false, result will not be saved to file, only kept in result_cache
+        self.file_cache: FileCache | None = None  # persistent cache shared by configs and runs
 
     depend = []
 
+    def get_depend_classes(self) -> List:
+        """
+        Classes of depends, they are the same for all instances unless a node overrides this, e.g. by config
+        """
+        return self.__class__.depend
+
     def __eq__(self, other):
         if not isinstance(other, Node):
             return False
@@ -55,24 +122,31 @@ class Node:
         self.to_path = config.to_config.save_path
 
     def work(self):
+        with metrics.record_node(self.name):
+            self._work()
+
+    def _work(self):
         set_global_pbar(None)
-        missing_params: List[EmptyNamedTuple] = []
-        if self.config.to_config.skip_existed:
-            step_file_names = self.get_file_paths
-            for key, fn in step_file_names.items():
-                if not os.path.exists(fn):
-                    missing_params.append(key)
-                    break
-            if len(missing_params) < 1:
-                return
+        missing_params: List[namedtuple] = [
+            param
+            for param, fn in self.get_file_paths.items()
+            if not (self.config.to_config.skip_existed and self._is_file_done(fn))
+        ]
+        if len(missing_params) < 1:
+            return
         data = {}
         for depend in self.depend_instance:
             data[get_depend_name(depend.name, depend.id)] = list(depend.get_file_paths.values())
         pbar = tqdm(total=len(missing_params), ncols=80, position=0, leave=False)
         set_global_pbar(pbar)
         for param in missing_params:
-            df = self._process_one(data, param)
-            self.save_file(df, self.get_file_path(param))
+            with metrics.record_work(self.name, str(param)):
+                with metrics.section("process"):
+                    df = self._process_one(data, param)
+                with metrics.section("save"):
+                    self.save_file(df, self.get_file_path(param))
+                    self._record_file(df, param)
+                metrics.add_rows_out(len(df))
             pbar.update()
 
     def _process_one(self, data: Dict[str, List[str]], param: namedtuple) -> pd.DataFrame:
@@ -114,15 +188,32 @@ class Node:
                 raise RuntimeError(f"{self.config.to_config.to_file_type.name} not supported")
 
     def save_file(self, df: pd.DataFrame, path: str):
+        # write to a temporary file then rename, so a crash will not leave a half-written file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
         match self.config.to_config.to_file_type:
             case ToFileType.csv:
-                df.to_csv(path, index=False, lineterminator="\n",date_format='%Y-%m-%d %H:%M:%S')
+                df.to_csv(tmp_path, index=False, lineterminator="\n",date_format='%Y-%m-%d %H:%M:%S')
             case ToFileType.feather:
-                df.to_feather(path)
+                df.to_feather(tmp_path)
             case _:
                 raise RuntimeError(f"{self.config.to_config.to_file_type.name} not supported")
+        os.replace(tmp_path, path)
+        metrics.add_bytes_written(os.path.getsize(path))
+
+    def _record_file(self, df: pd.DataFrame, param: namedtuple):
+        """
+        Record a saved file in manifest of save path
+        """
+        get_manifest(self.to_path).add(
+            self.name, self.get_file_path(param), str(param), len(df), self.from_config.data_source.name
+        )
+
+    def _is_file_done(self, path: str) -> bool:
+        return get_manifest(self.to_path).is_done(path, self.from_config.data_source.name)
 
     def read_file(self, path: str):
+        # bytes are counted when a file is read, depend files are read in _process_one or _read_depend
+        metrics.add_bytes_read(os.path.getsize(path))
         match self.config.to_config.to_file_type:
             case ToFileType.csv:
                 return pd.read_csv(path, converters=self._load_csv_converter, parse_dates=self._parse_date_column)
@@ -134,6 +225,81 @@ class Node:
     def get_depend_by_name(self, depend_name: str, depend_id=""):
         return self.depends_dict[get_depend_name(depend_name, depend_id)]
 
+    @property
+    def output_key(self) -> Tuple:
+        """
+        Nodes with the same output key will generate the same files, so they only need to run once,
+        even if their configs are different (e.g. proxy logs are the same for all pools in a chain).
+        """
+        return type(self).__name__, tuple(sorted(os.path.abspath(p) for p in self.get_file_paths.values()))
+
+    def _save_result(self, df: pd.DataFrame, param: namedtuple):
+        path = self.get_file_path(param)
+        metrics.add_rows_out(len(df))
+        if self.result_cache is not None and self.consumer_count > 0:
+            self.result_cache.put(path, df, self.consumer_count)
+            if not self.persist:
+                return
+        self.save_file(df, path)
+        self._record_file(df, param)
+
+    def _get_cache_key(self, day: date) -> str | None:
+        """
+        Key in file cache for result of one day, it should describe everything that decides the result.
+        Return None if result of this node should not be cached.
+        """
+        return None
+
+    def _process_with_cache(self, day: date, process: Callable):
+        cache_key = self._get_cache_key(day) if self.file_cache is not None else None
+        if cache_key is not None:
+            result = self.file_cache.get(cache_key)
+            if result is not None:
+                return result
+        result = process()
+        if cache_key is not None:
+            self.file_cache.put(cache_key, result)
+        return result
+
+    def _prepare_days(self, days: List[date]):
+        """
+        Called with days to process before processing any of them, in main process.
+        e.g. a source can download the whole date range at once, and split it into days.
+        """
+        pass
+
+    def _prepare_estimate(self, days: List[date]):
+        """
+        Called with pending days before estimating them, used by planner.
+        e.g. a source can find block range of all days at once.
+        """
+        pass
+
+    def _estimate_one_day(self, day: date) -> WorkEstimate | None:
+        """
+        Estimate requests to data source for one day without sending them, used by planner.
+        Return None if this node doesn't query data source, or requests can not be estimated.
+        """
+        return None
+
+    def _read_depend(self, depend: "Node", param: namedtuple) -> pd.DataFrame:
+        """
+        Read result of depend, take it from result cache if possible
+        """
+        path = depend.get_file_path(param)
+        if self.result_cache is not None:
+            df = self.result_cache.take(path)
+            if df is not None:
+                # keep the same type as reading from file
+                for column in depend._parse_date_column:
+                    if column in df.columns:
+                        df[column] = pd.to_datetime(df[column])
+                metrics.add_rows_in(len(df))
+                return df
+        df = depend.read_file(path)
+        metrics.add_rows_in(len(df))
+        return df
+
     # endregion
 
     def __str__(self):
@@ -155,27 +321,39 @@ class DailyNode(Node):
         super().__init__()
 
     def work(self):
+        with metrics.record_node(self.name):
+            self._work()
+
+    def _work(self):
         set_global_pbar(None)
         # if daily, global loop will handle processbar, outfile existence, gather param
-        day_idx = self.from_config.start
-        pbar = tqdm(total=(self.from_config.end - self.from_config.start).days + 1, ncols=80, position=0, leave=False)
+        days = TimeUtil.get_date_array(self.from_config.start, self.from_config.end)
+        pbar = tqdm(total=len(days), ncols=80, position=0, leave=False)
         set_global_pbar(pbar)
-        while day_idx <= self.from_config.end:
-            # day_str = day_idx.strftime("%Y-%m-%d")
-            day_param = DailyParam(day_idx)
-            step_file_name = self.get_file_path(day_param)
-            if self.config.to_config.skip_existed and os.path.exists(step_file_name):
-                day_idx += timedelta(days=1)
+        days_to_process = []
+        for day in days:
+            if self.config.to_config.skip_existed and self._day_existed(day):
                 pbar.update()
-                continue
+            else:
+                days_to_process.append(day)
+        if len(days_to_process) > 0:
+            self._prepare_days(days_to_process)
+        _run_by_day(self._work_one_day, days_to_process, self.config.to_config, pbar)
+
+    def _day_existed(self, day: date) -> bool:
+        return self._is_file_done(self.get_file_path(DailyParam(day)))
+
+    def _work_one_day(self, day: date):
+        with metrics.record_work(self.name, str(day)):
+            day_param = DailyParam(day)
             param = {}
-            for depend in self.depend_instance:
-                depend_file_path = depend.get_file_path(day_param)
-                param[get_depend_name(depend.name, depend.id)] = depend.read_file(depend_file_path)
-            df = self._process_one_day(param, day_idx)
-            self.save_file(df, self.get_file_path(day_param))
-            day_idx += timedelta(days=1)
-            pbar.update()
+            with metrics.section("read"):
+                for depend in self.depend_instance:
+                    param[get_depend_name(depend.name, depend.id)] = self._read_depend(depend, day_param)
+            with metrics.section("process"):
+                df = self._process_with_cache(day, lambda: self._process_one_day(param, day))
+            with metrics.section("save"):
+                self._save_result(df, day_param)
 
     def _process_one_day(self, data: Dict[str, pd.DataFrame], day: date) -> pd.DataFrame:
         return pd.DataFrame()
@@ -211,41 +389,58 @@ class AaveDailyNode(Node):
         return ret
 
     def work(self):
+        with metrics.record_node(self.name):
+            self._work()
+
+    def _work(self):
         set_global_pbar(None)
         # if daily, global loop will handle processbar, outfile existence, gather param
-        day_idx = self.from_config.start
-        pbar = tqdm(total=(self.from_config.end - self.from_config.start).days + 1, ncols=80, position=0, leave=False)
+        days = TimeUtil.get_date_array(self.from_config.start, self.from_config.end)
+        pbar = tqdm(total=len(days), ncols=80, position=0, leave=False)
         set_global_pbar(pbar)
-        while day_idx <= self.from_config.end:
-            # check file exist
-            if self.config.to_config.skip_existed:
-                all_exist = True
-                for token in self.from_config.aave_config.tokens:
-                    data_depends = AaveDailyParam(day_idx, token)
-                    step_file_name = self.get_file_path(data_depends)
-                    if not os.path.exists(step_file_name):
-                        all_exist = False
-                        break
-                if all_exist:
-                    day_idx += timedelta(days=1)
-                    pbar.update()
-                    continue
-
+        days_to_process = []
+        for day in days:
+            if self.config.to_config.skip_existed and self._day_existed(day):
+                pbar.update()
+            else:
+                days_to_process.append(day)
+        if len(days_to_process) > 0:
+            self._prepare_days(days_to_process)
+        _run_by_day(self._work_one_day, days_to_process, self.config.to_config, pbar)
+
+    def _day_existed(self, day: date) -> bool:
+        # files of all tokens should exist
+        return all(
+            self._is_file_done(self.get_file_path(AaveDailyParam(day, token)))
+            for token in self.from_config.aave_config.tokens
+        )
+
+    def _work_one_day(self, day: date):
+        with metrics.record_work(self.name, str(day)):
             data_depends = {}
-            for depend in self.depend_instance:
-                token_data = {}
-                for token in self.from_config.aave_config.tokens:
-                    path = depend.get_file_path(AaveDailyParam(day_idx, token))
-                    token_data[token] = depend.read_file(path)
-                data_depends[get_depend_name(depend.name, depend.id)] = token_data
-
-            token_dfs = self._process_one_day(data_depends, day_idx, self.from_config.aave_config.tokens)
-            for token, df in token_dfs.items():
-                self.save_file(df, self.get_file_path(AaveDailyParam(day_idx, token)))
-            day_idx += timedelta(days=1)
-            pbar.update()
+            with metrics.section("read"):
+                for depend in self.depend_instance:
+                    token_data = {}
+                    for token in self.from_config.aave_config.tokens:
+                        token_data[token] = self._read_depend(depend, AaveDailyParam(day, token))
+                    data_depends[get_depend_name(depend.name, depend.id)] = token_data
+
+            with metrics.section("process"):
+                token_dfs = self._process_with_cache(
+                    day, lambda: self._process_one_day(data_depends, day, self.from_config.aave_config.tokens)
+                )
+            with metrics.section("save"):
+                for token, df in token_dfs.items():
+                    self._save_result(df, AaveDailyParam(day, token))
 
     def _process_one_day(
         self, data: Dict[str, Dict[str, pd.DataFrame]], day: date, tokens: List[str]
     ) -> Dict[str, pd.DataFrame]:
         return {}
+
+
+def is_daily_node(node: Node) -> bool:
+    """
+    Daily nodes can be processed day by day, and read depends by day.
+    """
+    return isinstance(node, DailyNode) or isinstance(node, AaveDailyNode)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2024-03-21 15:40
+# @Author  : 32ethers
+# @Description: Pass dataframes between nodes in memory
+import threading
+from typing import Dict, Tuple
+
+import pandas as pd
+
+
+class ResultCache:
+    """
+    Keep results of nodes in memory, so dependents can take them without parsing files again.
+
+    Entries are keyed by the output file path of the node, and an entry is removed
+    as soon as all its consumers have taken it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[str, Tuple[pd.DataFrame, int]] = {}
+
+    def put(self, key: str, df: pd.DataFrame, consumer_count: int):
+        if consumer_count < 1:
+            return
+        with self._lock:
+            self._data[key] = (df, consumer_count)
+
+    def take(self, key: str) -> pd.DataFrame | None:
+        """
+        Take a copy of cached dataframe, consumers may change it.
+
+        :return: None if key is not cached
+        """
+        with self._lock:
+            if key not in self._data:
+                return None
+            df, remain = self._data[key]
+            if remain <= 1:
+                del self._data[key]
+            else:
+                self._data[key] = (df, remain - 1)
+        return df.copy()
+
+    def release(self, key: str):
+        """
+        Give up a share of cached dataframe without taking it, e.g. the consumer doesn't need to process the day
+        """
+        with self._lock:
+            if key not in self._data:
+                return
+            df, remain = self._data[key]
+            if remain <= 1:
+                del self._data[key]
+            else:
+                self._data[key] = (df, remain - 1)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
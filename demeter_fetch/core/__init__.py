@@ -5,5 +5,8 @@
 # @Description:
 
 from .commands import get_commend_args
-from .downloader import download,download_by_config
-from .engine import get_relative_nodes
+from .downloader import download, download_by_config, download_by_configs
+from .engine import get_relative_nodes, merge_nodes
+from .frames import fetch_frames, iter_frames
+from .planner import plan, plan_by_configs, print_plan
+from .scheduler import NodeScheduler, PipelineScheduler
@@ -13,5 +13,8 @@ def get_commend_args():
     parser_tool_chifra.add_argument("-p", "--http_proxy", help="proxy, eg: https://localhost:7890, optional", default="")
     parser_tool_chifra.add_argument("-k", "--key", help="key in etherscan, optional", default="")
 
+    parser_tool_plan = parser_tool_sub.add_parser("plan", help="Print steps, pending days and estimated requests of a config without downloading")
+    parser_tool_plan.add_argument("-c", "--config", help="Path of config file", dest="plan_config", metavar="CONFIG", required=True)
+
     args = argParser.parse_args()
     return args
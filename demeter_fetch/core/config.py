@@ -44,6 +44,70 @@ def get_item_with_default_4(cfg: Dict, key1: str, key2: str, key3: str, key4: st
     return get_item_with_default(cfg, [key1, key2, key3, key4], default_val, converter)
 
 
+def _get_end_points(end_point, auth_string: str | None) -> List[RpcEndpoint]:
+    """
+    end_point can be an url, a list of urls, or a list of tables like {url = "...", weight = 2, rate_limit = 20}
+    """
+    items = end_point if isinstance(end_point, list) else [end_point]
+    end_points = []
+    for item in items:
+        if isinstance(item, str):
+            end_points.append(RpcEndpoint(item, auth_string=auth_string))
+        elif isinstance(item, dict) and "url" in item:
+            end_points.append(
+                RpcEndpoint(
+                    item["url"],
+                    item.get("weight", 1),
+                    item.get("rate_limit", 0),
+                    item.get("auth_string", auth_string),
+                )
+            )
+        else:
+            raise RuntimeError(f"end_point should be an url or a table with url, but got {item}")
+    if len(end_points) < 1:
+        raise RuntimeError("end_point should not be empty")
+    for e in end_points:
+        if e.weight <= 0 or e.rate_limit < 0:
+            raise RuntimeError("weight of end point should be greater than 0, and rate_limit can not be negative")
+    return end_points
+
+
+def _get_retry_policies(retry: Dict) -> Dict[str, RetryPolicy]:
+    """
+    Override default retry policies, e.g. {"rate_limit": {"retries": 10}, "timeout": {"retries": 0}}
+    """
+    policies = dict(DEFAULT_RETRY_POLICIES)
+    for error_class, item in retry.items():
+        if error_class not in policies:
+            raise RuntimeError(f"Unknown error class {error_class} in retry, should be one of {list(policies.keys())}")
+        default = policies[error_class]
+        policies[error_class] = RetryPolicy(
+            item.get("retries", default.retries),
+            item.get("base_delay", default.base_delay),
+            item.get("max_delay", default.max_delay),
+        )
+    return policies
+
+
+def _merge_dict(base: Dict, override: Dict) -> Dict:
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge_dict(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def convert_to_configs(job_file: dict) -> List[Config]:
+    """
+    Convert a job file to configs. A job file is a config file with a list of [[jobs]],
+    every job overrides items in the config, e.g. from.uniswap.pool_address, from.start
+    """
+    base = {k: v for k, v in job_file.items() if k != "jobs"}
+    return [convert_to_config(_merge_dict(base, job)) for job in job_file["jobs"]]
+
+
 def convert_to_config(conf_file: dict) -> Config:
     to_type = ToType[conf_file["to"]["type"]]
     save_path = get_item_with_default_2(conf_file, "to", "save_path", "../")
@@ -51,7 +115,36 @@ def convert_to_config(conf_file: dict) -> Config:
     skip_existed = get_item_with_default_2(conf_file, "to", "skip_existed", False)
     keep_raw = get_item_with_default_2(conf_file, "to", "keep_raw", False)
     to_file_type = get_item_with_default_2(conf_file, "to", "file_type", ToFileType.csv, lambda x: ToFileType[x])
-    to_config = ToConfig(to_type, save_path, multi_process, skip_existed, keep_raw, to_file_type)
+    process_count = get_item_with_default_2(conf_file, "to", "process_count", None)
+    if process_count is not None and process_count < 1:
+        raise RuntimeError("process_count should be greater than 0")
+    node_workers = get_item_with_default_2(conf_file, "to", "node_workers", 1)
+    if node_workers < 1:
+        raise RuntimeError("node_workers should be greater than 0")
+    node_concurrency = get_item_with_default_2(conf_file, "to", "node_concurrency", {})
+    pipeline = get_item_with_default_2(conf_file, "to", "pipeline", False)
+    memory_cache = get_item_with_default_2(conf_file, "to", "memory_cache", False)
+    cache_path = get_item_with_default_2(conf_file, "to", "cache_path", None)
+    cache_max_size = get_item_with_default_2(conf_file, "to", "cache_max_size", 10240)
+    report_path = get_item_with_default_2(conf_file, "to", "report_path", None)
+    prometheus_path = get_item_with_default_2(conf_file, "to", "prometheus_path", None)
+    to_config = ToConfig(
+        to_type,
+        save_path,
+        multi_process,
+        skip_existed,
+        keep_raw,
+        to_file_type,
+        process_count,
+        node_workers,
+        node_concurrency,
+        pipeline,
+        memory_cache,
+        cache_path,
+        cache_max_size,
+        report_path,
+        prometheus_path,
+    )
 
     chain = ChainType[conf_file["from"]["chain"]]
     data_source = DataSource[conf_file["from"]["datasource"]]
@@ -100,16 +193,46 @@ def convert_to_config(conf_file: dict) -> Config:
             if keep_raw == False and keep_tmp_files is None:
                 keep_tmp_files = False
             etherscan_api_key = get_item_with_default_3(conf_file, "from", "rpc", "etherscan_api_key", None)
-            end_point = conf_file["from"]["rpc"]["end_point"]
+            end_points = _get_end_points(conf_file["from"]["rpc"]["end_point"], auth_string)
+            hedge = get_item_with_default_3(conf_file, "from", "rpc", "hedge", True)
+            sweep_range = get_item_with_default_3(conf_file, "from", "rpc", "sweep_range", False)
+            proxy_lp_by_pool = get_item_with_default_3(conf_file, "from", "rpc", "proxy_lp_by_pool", False)
+            interpolate_timestamp = get_item_with_default_3(conf_file, "from", "rpc", "interpolate_timestamp", True)
+            etherscan_fallback = get_item_with_default_3(conf_file, "from", "rpc", "etherscan_fallback", True)
+            retry = _get_retry_policies(get_item_with_default_3(conf_file, "from", "rpc", "retry", {}))
+            requests_per_second = get_item_with_default_3(conf_file, "from", "rpc", "requests_per_second", 0)
+            compute_units_per_second = get_item_with_default_3(conf_file, "from", "rpc", "compute_units_per_second", 0)
+            compute_units = dict(DEFAULT_COMPUTE_UNITS)
+            compute_units.update(get_item_with_default_3(conf_file, "from", "rpc", "compute_units", {}))
             batch_size = get_item_with_default_3(conf_file, "from", "rpc", "batch_size", 500)
             force_no_proxy = get_item_with_default_3(conf_file, "from", "rpc", "force_no_proxy", False)
+            async_client = get_item_with_default_3(conf_file, "from", "rpc", "async_client", False)
+            concurrency = get_item_with_default_3(conf_file, "from", "rpc", "concurrency", 10)
+            if concurrency < 1:
+                raise RuntimeError("concurrency should be greater than 0")
+            json_rpc_batch_size = get_item_with_default_3(conf_file, "from", "rpc", "json_rpc_batch_size", 1)
+            if json_rpc_batch_size < 1:
+                raise RuntimeError("json_rpc_batch_size should be greater than 0")
             from_config.rpc = RpcConfig(
-                end_point=end_point,
+                end_point=end_points[0].url,
                 batch_size=batch_size,
                 auth_string=auth_string,
                 keep_tmp_files=keep_tmp_files,
                 etherscan_api_key=etherscan_api_key,
                 force_no_proxy=force_no_proxy,
+                async_client=async_client,
+                concurrency=concurrency,
+                json_rpc_batch_size=json_rpc_batch_size,
+                end_points=end_points,
+                hedge=hedge,
+                retry=retry,
+                requests_per_second=requests_per_second,
+                compute_units_per_second=compute_units_per_second,
+                compute_units=compute_units,
+                sweep_range=sweep_range,
+                proxy_lp_by_pool=proxy_lp_by_pool,
+                interpolate_timestamp=interpolate_timestamp,
+                etherscan_fallback=etherscan_fallback,
             )
         case DataSource.big_query:
             if "big_query" not in conf_file["from"]:
@@ -7,35 +7,91 @@
 import dataclasses
 import json
 import os
-from typing import List
+from typing import List, Tuple, Dict
 
 import toml
 
 import demeter_fetch.common as utils
 from . import engine
-from .config import convert_to_config
-from .. import Config
-from ..common import print_log, set_global_pbar, Node
+from .config import convert_to_config, convert_to_configs
+from .scheduler import NodeScheduler, PipelineScheduler, get_depend_indexes
+from .. import Config, ToConfig
+from ..common import print_log, set_global_pbar, Node, ResultCache, is_daily_node, FileCache, metrics
 
 
-def download_by_config(config: Config) -> List[str]:
+def _set_result_cache(steps: List[Node], root_steps: List[Node], to_config: ToConfig):
+    """
+    Results will be kept in memory if all consumers are daily nodes,
+    non-daily nodes like uni_positions still read files by path.
+    """
+    result_cache = ResultCache()
+    consumers: List[List[Node]] = [[] for _ in steps]
+    for step, depend_indexes in zip(steps, get_depend_indexes(steps)):
+        for index in depend_indexes:
+            consumers[index].append(step)
+    for step, step_consumers in zip(steps, consumers):
+        step.result_cache = result_cache
+        if len(step_consumers) > 0 and all(is_daily_node(c) for c in step_consumers):
+            step.consumer_count = len(step_consumers)
+            step.persist = to_config.keep_raw or any(step is r for r in root_steps)
+
+
+def _get_steps(config: Config, create_path: bool = True) -> Tuple[Node, List[Node]]:
     ignore_pos = False
     if config.from_config.uniswap_config is not None:
         ignore_pos = config.from_config.uniswap_config.ignore_position_id
-    if not os.path.exists(config.to_config.save_path):
+    if create_path and not os.path.exists(config.to_config.save_path):
         print_log(f"Creating path {config.to_config.save_path}")
         os.mkdir(config.to_config.save_path)
     root_step = engine.get_root_node(config.from_config.dapp_type, config.to_config.type, ignore_pos)
     root_step.set_config(config)
     steps: List[Node] = engine.get_relative_nodes(root_step)
+    return root_step, steps
+
+
+def _save_metrics(to_config: ToConfig):
+    collector = metrics.get_metrics()
+    for name, item in collector.summary().items():
+        sections = ", ".join(f"{k}: {v:.1f}s" for k, v in item["sections"].items())
+        print_log(f"Step {name} finished {item['count']} works in {item['seconds']:.1f}s, {sections}")
+    if to_config.report_path is not None:
+        collector.save_report(to_config.report_path)
+        print_log(f"Report has been saved to {to_config.report_path}")
+    if to_config.prometheus_path is not None:
+        collector.save_prometheus(to_config.prometheus_path)
+
+
+def _run_steps(steps: List[Node], root_steps: List[Node], to_config: ToConfig) -> List[str]:
+    """
+    Run steps with settings in to_config, and return generated files.
+    """
     utils.print_log("Will execute the following steps: " + str(steps))
-    # [step.set_config(config) for step in steps]
+    if to_config.memory_cache:
+        if not to_config.pipeline:
+            # otherwise a step keeps results of all days in memory before its consumers start
+            print_log("memory_cache is only available in pipeline mode, will pass results by files")
+        else:
+            _set_result_cache(steps, root_steps, to_config)
+    if to_config.cache_path is not None:
+        file_cache = FileCache(to_config.cache_path, to_config.cache_max_size * 1024 * 1024)
+        for step in steps:
+            step.file_cache = file_cache
 
-    for step in steps:
-        set_global_pbar(None)
-        print_log(f"Current step: {step.name}")
-        step.work()
-    if config.to_config.keep_raw:
+    metrics.set_metrics(metrics.MetricsCollector())
+    try:
+        if to_config.pipeline:
+            PipelineScheduler(steps, to_config.node_workers, to_config.node_concurrency).run()
+        elif to_config.node_workers > 1:
+            NodeScheduler(steps, to_config.node_workers, to_config.node_concurrency).run()
+        else:
+            for step in steps:
+                set_global_pbar(None)
+                print_log(f"Current step: {step.name}")
+                step.work()
+    finally:
+        _save_metrics(to_config)
+
+    if to_config.keep_raw:
         generated_files = []
         for step in steps:
             generated_files.extend(list(step.get_file_paths.values()))
@@ -43,10 +99,76 @@ def download_by_config(config: Config) -> List[str]:
     else:
         # remove raw files
         for step in steps:
-            if step != root_step:
+            if not any(step is r for r in root_steps):
                 for param, sf in step.get_file_paths.items():
-                    os.remove(sf)
-        return list(root_step.get_file_paths.values())
+                    if os.path.exists(sf):
+                        os.remove(sf)
+        generated_files = []
+        for root_step in root_steps:
+            generated_files.extend(list(root_step.get_file_paths.values()))
+        return generated_files
+
+
+def download_by_config(config: Config) -> List[str]:
+    root_step, steps = _get_steps(config)
+    return _run_steps(steps, [root_step], config.to_config)
+
+
+def _get_merged_steps(configs: List[Config], create_path: bool = True) -> Tuple[List[Node], List[Node]]:
+    """
+    Merge steps of all configs into one graph, steps which generate the same files will be kept only once.
+
+    :return: root steps, all steps
+    """
+    root_steps, step_lists = [], []
+    for config in configs:
+        root_step, steps = _get_steps(config, create_path)
+        root_steps.append(root_step)
+        step_lists.append(steps)
+    steps = engine.merge_nodes(step_lists)
+    # root of a config might be replaced by the same step in another config
+    merged = {s.output_key: s for s in steps}
+    root_steps = list({id(merged[r.output_key]): merged[r.output_key] for r in root_steps}.values())
+    return root_steps, steps
+
+
+# settings in [to] about how to run, they are shared by all configs in one run
+RUN_SETTINGS = [
+    "skip_existed",
+    "keep_raw",
+    "node_workers",
+    "node_concurrency",
+    "pipeline",
+    "memory_cache",
+    "cache_path",
+    "cache_max_size",
+    "report_path",
+    "prometheus_path",
+]
+
+
+def _check_run_settings(configs: List[Config]):
+    differences = []
+    for name in RUN_SETTINGS:
+        values = [getattr(c.to_config, name) for c in configs]
+        if any(v != values[0] for v in values[1:]):
+            differences.append(f"{name}: {values}")
+    if len(differences) > 0:
+        raise RuntimeError("Jobs should have the same settings in [to] about how to run, " + ", ".join(differences))
+
+
+def download_by_configs(configs: List[Config]) -> List[str]:
+    """
+    Download with many configs in one run. Steps of all configs are merged into one graph,
+    steps which generate the same files (e.g. proxy logs of the same chain and day) will run only once.
+    Settings about how to run (e.g. node_workers, pipeline, keep_raw) are shared by all configs,
+    a RuntimeError is raised if configs have different values of them.
+    """
+    if len(configs) < 1:
+        return []
+    _check_run_settings(configs)
+    root_steps, steps = _get_merged_steps(configs)
+    return _run_steps(steps, root_steps, configs[0].to_config)
 
 
 def download(cfg_path):
@@ -54,6 +176,9 @@ def download(cfg_path):
         utils.print_log("config file not found,")
         exit(1)
     config_file = toml.load(cfg_path)
+    if "jobs" in config_file:
+        download_jobs(config_file)
+        return
     try:
         config = convert_to_config(config_file)
     except RuntimeError as e:
@@ -65,3 +190,14 @@ def download(cfg_path):
     )
 
     download_by_config(config)
+
+
+def download_jobs(job_file: Dict):
+    try:
+        configs = convert_to_configs(job_file)
+        _check_run_settings(configs)
+    except RuntimeError as e:
+        utils.print_log(e)
+        exit(1)
+    utils.print_log(f"Will download {len(configs)} jobs")
+    download_by_configs(configs)
@@ -3,7 +3,7 @@
 # @Time    : 2024-01-08 14:22
 # @Author  : 32ethers
 # @Description:
-from typing import List
+from typing import List, Dict, Tuple
 
 from .. import DappType, ToType, Config
 from ..common import Node
@@ -27,7 +27,7 @@ def get_relative_nodes(root: Node) -> List[Node]:
         current_node: Node = stack.pop()
         depth_first_array.append(current_node)
         current_node_depends = []
-        for depend_class in current_node.__class__.depend:
+        for depend_class in current_node.get_depend_classes():
             depend_configs: List = current_node.get_config_for_depend(depend_class.name)
             for depend_config in depend_configs:
                 depend_instance = depend_class()
@@ -41,6 +41,25 @@ def get_relative_nodes(root: Node) -> List[Node]:
     return depth_first_array
 
 
+def merge_nodes(node_lists: List[List[Node]]) -> List[Node]:
+    """
+    Merge node lists generated by get_relative_nodes into one list.
+    Nodes with the same output will be kept only once, and depends will be pointed to the kept node.
+    As every list is in dependency order, the merged list is still in dependency order.
+    """
+    merged: List[Node] = []
+    kept: Dict[Tuple, Node] = {}
+    for nodes in node_lists:
+        for node in nodes:
+            key = node.output_key
+            if key not in kept:
+                kept[key] = node
+                merged.append(node)
+    for node in merged:
+        node.set_depend_instance([kept[d.output_key] for d in node.depend_instance])
+    return merged
+
+
 # region depends
 
 # uniswap
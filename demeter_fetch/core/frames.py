@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2024-03-28 15:30
+# @Author  : 32ethers
+# @Description: Get results as dataframes instead of files
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from itertools import islice
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+import pandas as pd
+
+from .downloader import _get_steps
+from .scheduler import get_depend_indexes
+from .. import Config
+from ..common import Node, ResultCache, TimeUtil, is_daily_node, FileCache, set_global_pbar, metrics
+from ..common.nodes import _PROCESS_CONTEXT
+
+
+def _process_day(steps: List[Node], day: date) -> List[Tuple[NamedTuple, pd.DataFrame]]:
+    """
+    Run all steps for one day, results are passed between steps in memory, and results of root step are returned.
+    Root step is the last one of steps.
+    """
+    result_cache = ResultCache()
+    consumer_count = [0] * len(steps)
+    for depend_indexes in get_depend_indexes(steps):
+        for index in depend_indexes:
+            consumer_count[index] += 1
+    consumer_count[-1] += 1  # caller of this function is the consumer of root step
+    for step, count in zip(steps, consumer_count):
+        step.result_cache = result_cache
+        step.consumer_count = count
+        step.persist = False
+    for step in steps:
+        step._work_one_day(day)
+
+    root = steps[-1]
+    frames = []
+    for param, path in root.get_file_paths.items():
+        if param.day == day:
+            frames.append((param, result_cache.take(path)))
+    return frames
+
+
+_child_steps: List[Node] | None = None  # steps of a child process, they are sent once when the process starts
+
+
+def _init_child(steps: List[Node]):
+    global _child_steps
+    set_global_pbar(None)
+    _child_steps = steps
+
+
+def _process_day_in_child(day: date) -> Tuple[List[Tuple[NamedTuple, pd.DataFrame]], List]:
+    """
+    Process a day in child process, and return metric records with frames
+    """
+    metrics.set_metrics(metrics.MetricsCollector())
+    frames = _process_day(_child_steps, day)
+    return frames, metrics.get_metrics().records
+
+
+def iter_frames(config: Config) -> Iterator[Tuple[NamedTuple, pd.DataFrame]]:
+    """
+    Run steps of config day by day, and yield results of root step as dataframes, without saving and reading files.
+    Days are yielded in order, a day is processed only when the caller asks for it.
+    If multi_process is enabled, days are processed in a process pool ahead of the caller, and still yielded in order.
+    At most process_count days are processed ahead, the next day is submitted when a day is yielded.
+
+    Only daily steps are supported. Sources might still use temporary files, e.g. rpc source.
+    skip_existed and keep_raw are ignored, as no file is generated.
+
+    :return: iterator of (param, dataframe), param is DailyParam, or AaveDailyParam for aave
+    """
+    root_step, steps = _get_steps(config)
+    return _iter_step_frames(root_step, steps, config)
+
+
+def _iter_step_frames(root_step: Node, steps: List[Node], config: Config) -> Iterator[Tuple[NamedTuple, pd.DataFrame]]:
+    if not all(is_daily_node(s) for s in steps):
+        raise RuntimeError(f"{root_step.name} is not a daily step, please use download_by_config instead")
+    # keep root step at the end, steps are sorted by dependency
+    steps = [s for s in steps if s is not root_step] + [root_step]
+    if config.to_config.cache_path is not None:
+        file_cache = FileCache(config.to_config.cache_path, config.to_config.cache_max_size * 1024 * 1024)
+        for step in steps:
+            step.file_cache = file_cache
+
+    set_global_pbar(None)
+    days = TimeUtil.get_date_array(config.from_config.start, config.from_config.end)
+    for step in steps:
+        step._prepare_days(days)
+    if config.to_config.multi_process and len(days) > 1:
+        max_workers = min(config.to_config.process_count or os.cpu_count(), len(days))
+        with ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=_PROCESS_CONTEXT, initializer=_init_child, initargs=(steps,)
+        ) as executor:
+            # at most max_workers days are in flight, so results won't pile up ahead of a slow caller
+            pending_days = iter(days)
+            futures = deque(executor.submit(_process_day_in_child, d) for d in islice(pending_days, max_workers))
+            while len(futures) > 0:
+                frames, records = futures.popleft().result()
+                next_day = next(pending_days, None)
+                if next_day is not None:
+                    futures.append(executor.submit(_process_day_in_child, next_day))
+                for record in records:
+                    metrics.get_metrics().add(record)
+                yield from frames
+    else:
+        for day in days:
+            yield from _process_day(steps, day)
+
+
+def fetch_frames(config: Config) -> Dict[NamedTuple, pd.DataFrame]:
+    """
+    Get results of root step as dataframes, without saving and reading files. See iter_frames.
+
+    :return: dataframes keyed by param, e.g. DailyParam(day=date(2024, 1, 1))
+    """
+    return dict(iter_frames(config))
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2024-03-26 14:20
+# @Author  : 32ethers
+# @Description: Report work and requests of a download before executing it
+import os
+from datetime import date
+from typing import List, NamedTuple
+
+import toml
+
+from .config import convert_to_config, convert_to_configs
+from .downloader import _get_merged_steps
+from .. import Config
+from ..common import Node, WorkEstimate, TimeUtil, is_daily_node, get_depend_name, print_log, set_global_pbar
+
+
+class NodePlan(NamedTuple):
+    node: Node
+    depends: List[str]
+    days: List[date]  # days to process, empty for non-daily nodes
+    pending: bool  # if this node has any work to do
+    estimate: WorkEstimate | None  # requests of all pending days, None if the node doesn't query data source
+
+
+def _add_value(a: int | None, b: int | None) -> int | None:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return a + b
+
+
+def _add_estimate(a: WorkEstimate | None, b: WorkEstimate | None) -> WorkEstimate | None:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return WorkEstimate(*[_add_value(x, y) for x, y in zip(a, b)])
+
+
+def _get_pending_days(node: Node) -> List[date]:
+    days = TimeUtil.get_date_array(node.from_config.start, node.from_config.end)
+    if not node.config.to_config.skip_existed:
+        return days
+    return [d for d in days if not node._day_existed(d)]
+
+
+def plan_node(node: Node, estimate: bool = True) -> NodePlan:
+    depends = [get_depend_name(d.name, d.id) for d in node.depend_instance]
+    if not is_daily_node(node):
+        pending = not node.config.to_config.skip_existed or not all(
+            node._is_file_done(p) for p in node.get_file_paths.values()
+        )
+        return NodePlan(node, depends, [], pending, None)
+    days = _get_pending_days(node)
+    node_estimate = None
+    if estimate and len(days) > 0:
+        node._prepare_estimate(days)
+        for day in days:
+            node_estimate = _add_estimate(node_estimate, node._estimate_one_day(day))
+    return NodePlan(node, depends, days, len(days) > 0, node_estimate)
+
+
+def plan_by_configs(configs: List[Config], estimate: bool = True) -> List[NodePlan]:
+    """
+    Find steps of configs and work they have to do, nothing will be downloaded.
+    Estimating RPC requests needs block heights of every day, they are resolved over rpc and saved in height cache.
+    Estimating BigQuery bytes sends dry-run jobs, which are free.
+
+    :param configs: configs to download, steps of them are merged like download_by_configs
+    :param estimate: estimate requests to data source
+    """
+    if len(configs) < 1:
+        return []
+    root_steps, steps = _get_merged_steps(configs, create_path=False)
+    return [plan_node(step, estimate) for step in steps]
+
+
+def _format_days(days: List[date]) -> str:
+    if len(days) < 1:
+        return "no day"
+    return f"{len(days)} days, {days[0]} ~ {days[-1]}"
+
+
+def _format_bytes(size: int) -> str:
+    for unit in ["B", "KB", "MB", "GB", "TB"]:
+        if size < 1024 or unit == "TB":
+            return f"{size:.2f} {unit}" if unit != "B" else f"{size} B"
+        size /= 1024
+
+
+def print_plan(plans: List[NodePlan]):
+    set_global_pbar(None)  # estimating might leave a progress bar, plan is printed as plain lines
+    print_log("Steps:")
+    for plan in plans:
+        depends = ", ".join(plan.depends) if len(plan.depends) > 0 else "-"
+        print_log(f"  {plan.node.name} <- {depends}")
+
+    print_log("Pending work:")
+    for plan in plans:
+        if is_daily_node(plan.node):
+            print_log(f"  {plan.node.name}: {_format_days(plan.days)}")
+        else:
+            print_log(f"  {plan.node.name}: {'will run' if plan.pending else 'done'}")
+
+    print_log("Estimated requests:")
+    total = None
+    for plan in plans:
+        if plan.estimate is None:
+            continue
+        total = _add_estimate(total, plan.estimate)
+        print_log(f"  {plan.node.name}: {_format_estimate(plan.estimate)}")
+    if total is None:
+        print_log("  no estimation available")
+    else:
+        print_log(f"  total: {_format_estimate(total)}")
+
+
+def _format_estimate(estimate: WorkEstimate) -> str:
+    items = []
+    if estimate.get_logs_calls is not None:
+        items.append(f"eth_getLogs calls: {estimate.get_logs_calls}")
+    if estimate.timestamp_lookups is not None:
+        # only blocks with logs need a timestamp, and interpolation saves more, so this is an upper bound
+        items.append(f"block timestamp lookups (worst case, every block has logs): {estimate.timestamp_lookups}")
+    if estimate.bytes_scanned is not None:
+        items.append(f"BigQuery bytes scanned: {_format_bytes(estimate.bytes_scanned)}")
+    return ", ".join(items)
+
+
+def plan(cfg_path: str):
+    if not os.path.exists(cfg_path):
+        print_log("config file not found,")
+        exit(1)
+    config_file = toml.load(cfg_path)
+    try:
+        configs = convert_to_configs(config_file) if "jobs" in config_file else [convert_to_config(config_file)]
+    except RuntimeError as e:
+        print_log(e)
+        exit(1)
+    print_plan(plan_by_configs(configs))
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2024-03-20 10:12
+# @Author  : 32ethers
+# @Description: Run independent nodes of the dependency graph at the same time
+import heapq
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, Future
+from datetime import date
+from typing import List, Dict, NamedTuple
+
+from tqdm import tqdm
+
+from ..common import Node, print_log, set_global_pbar, TimeUtil, is_daily_node
+
+
+def get_depend_indexes(nodes: List[Node]) -> List[List[int]]:
+    """
+    Find depends of every node in the node list.
+    Depend instances are compared by config, because the same depend might be instanced more than once.
+
+    :return: index of depends in node list, for every node
+    """
+    depend_indexes = []
+    for node in nodes:
+        indexes = []
+        for depend in node.depend_instance:
+            if depend not in nodes:
+                raise RuntimeError(f"Depend {depend.name} of {node.name} is not in node list")
+            indexes.append(nodes.index(depend))
+        depend_indexes.append(indexes)
+    return depend_indexes
+
+
+class NodeScheduler:
+    """
+    Run nodes with a thread pool, a node will start as soon as all of its depends have finished,
+    so nodes without dependency between each other(e.g. uni_pool and uni_proxy_LP) will run at the same time.
+    """
+
+    def __init__(self, nodes: List[Node], max_workers: int, node_concurrency: Dict[str, int] | None = None):
+        """
+        :param nodes: nodes to run, result of engine.get_relative_nodes
+        :param max_workers: how many nodes can run at the same time
+        :param node_concurrency: max running count of nodes with the same name, e.g. {"uni_pool": 1}, 0 means no limit
+        """
+        self.nodes = nodes
+        self.max_workers = max_workers
+        self.node_concurrency = node_concurrency if node_concurrency is not None else {}
+        self.depend_indexes = get_depend_indexes(nodes)
+
+    def _is_limited(self, node: Node, running_count: Dict[str, int]) -> bool:
+        limit = self.node_concurrency.get(node.name, 0)
+        return 0 < limit <= running_count[node.name]
+
+    @staticmethod
+    def _run_node(node: Node):
+        print_log(f"Start step: {node.name}")
+        node.work()
+        print_log(f"Finish step: {node.name}")
+
+    def run(self):
+        pending: List[int] = list(range(len(self.nodes)))
+        finished = set()
+        running: Dict[Future, int] = {}
+        running_count: Dict[str, int] = defaultdict(int)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while len(pending) > 0 or len(running) > 0:
+                for index in list(pending):
+                    if len(running) >= self.max_workers:
+                        break
+                    node = self.nodes[index]
+                    if not all(d in finished for d in self.depend_indexes[index]):
+                        continue
+                    if self._is_limited(node, running_count):
+                        continue
+                    pending.remove(index)
+                    running[executor.submit(NodeScheduler._run_node, node)] = index
+                    running_count[node.name] += 1
+                if len(running) < 1:
+                    raise RuntimeError("Can not find any node to run, please check dependency of nodes")
+                done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    running_count[self.nodes[index].name] -= 1
+                    future.result()  # raise if node failed
+                    finished.add(index)
+
+
+class WorkUnit(NamedTuple):
+    node_index: int
+    day: date | None  # None means the whole node
+
+
+class PipelineScheduler(NodeScheduler):
+    """
+    Run nodes day by day, instead of waiting for the whole date range of depends.
+    Day N of a daily node will start as soon as day N of all its depends have been saved,
+    so downloading and processing can overlap. Non-daily nodes (e.g. uni_positions) still wait for all days of depends.
+    Work units of earlier days run first.
+    _prepare_days of a daily node is called with its pending days, before its first day runs.
+    If results of a node are only passed in memory, its day is skipped when all consumers have finished the day.
+    """
+
+    def __init__(self, nodes: List[Node], max_workers: int, node_concurrency: Dict[str, int] | None = None):
+        super().__init__(nodes, max_workers, node_concurrency)
+        self.units: List[WorkUnit] = []
+        node_units: List[List[int]] = []
+        for index, node in enumerate(nodes):
+            days = (
+                TimeUtil.get_date_array(node.from_config.start, node.from_config.end) if is_daily_node(node) else [None]
+            )
+            node_units.append(list(range(len(self.units), len(self.units) + len(days))))
+            self.units.extend([WorkUnit(index, d) for d in days])
+
+        unit_index = {u: i for i, u in enumerate(self.units)}
+        self._unit_index = unit_index
+        self.consumers: List[List[int]] = [[] for _ in nodes]
+        for index, depend_indexes in enumerate(self.depend_indexes):
+            for depend_index in depend_indexes:
+                self.consumers[depend_index].append(index)
+        self.unit_depends: List[List[int]] = []
+        for unit in self.units:
+            depends = []
+            for depend_index in self.depend_indexes[unit.node_index]:
+                same_day = WorkUnit(depend_index, unit.day)
+                if unit.day is not None and same_day in unit_index:
+                    depends.append(unit_index[same_day])
+                else:
+                    depends.extend(node_units[depend_index])
+            self.unit_depends.append(depends)
+        self._prepared = [False] * len(nodes)
+        self._prepare_locks = [threading.Lock() for _ in nodes]
+
+    def _prepare(self, node_index: int):
+        with self._prepare_locks[node_index]:
+            if self._prepared[node_index]:
+                return
+            node = self.nodes[node_index]
+            days = [u.day for u in self.units if u.node_index == node_index and not self._is_existed(u)]
+            if len(days) > 0:
+                node._prepare_days(days)
+            self._prepared[node_index] = True
+
+    def _run_unit(self, unit: WorkUnit):
+        node = self.nodes[unit.node_index]
+        if unit.day is None:
+            node.work()
+        else:
+            self._prepare(unit.node_index)
+            node._work_one_day(unit.day)
+
+    def _is_existed(self, unit: WorkUnit) -> bool:
+        node = self.nodes[unit.node_index]
+        if not node.config.to_config.skip_existed or unit.day is None:
+            return False
+        if node.result_cache is not None and node.consumer_count > 0 and not node.persist:
+            # there is no file, the day is needed only if a consumer will process it
+            consumer_units = [WorkUnit(c, unit.day) for c in self.consumers[unit.node_index]]
+            return all(self._is_existed(u) for u in consumer_units if u in self._unit_index)
+        return node._day_existed(unit.day)
+
+    def _release_depends(self, unit: WorkUnit):
+        """
+        A skipped unit won't take results of its depends, so give up its share in result cache
+        """
+        for depend_index in self.depend_indexes[unit.node_index]:
+            depend = self.nodes[depend_index]
+            if depend.result_cache is None or depend.consumer_count < 1:
+                continue
+            for param, path in depend.get_file_paths.items():
+                if param.day == unit.day:
+                    depend.result_cache.release(path)
+
+    def _priority(self, unit_index: int):
+        unit = self.units[unit_index]
+        return (unit.day if unit.day is not None else date.max), unit.node_index
+
+    def run(self):
+        remain_count = [len(d) for d in self.unit_depends]
+        dependents: List[List[int]] = [[] for _ in self.units]
+        for index, depends in enumerate(self.unit_depends):
+            for d in depends:
+                dependents[d].append(index)
+
+        ready = []  # heap of (priority, unit index)
+        running: Dict[Future, int] = {}
+        running_count: Dict[str, int] = defaultdict(int)
+        pbar = tqdm(total=len(self.units), ncols=80, position=0, leave=False)
+        set_global_pbar(pbar)
+
+        def finish(index):
+            pbar.update()
+            for dependent in dependents[index]:
+                remain_count[dependent] -= 1
+                if remain_count[dependent] == 0:
+                    heapq.heappush(ready, (self._priority(dependent), dependent))
+
+        for index, count in enumerate(remain_count):
+            if count == 0:
+                heapq.heappush(ready, (self._priority(index), index))
+        finished_count = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while finished_count < len(self.units):
+                skipped = []
+                while len(ready) > 0 and len(running) < self.max_workers:
+                    item = heapq.heappop(ready)
+                    unit = self.units[item[1]]
+                    node = self.nodes[unit.node_index]
+                    if self._is_existed(unit):
+                        self._release_depends(unit)
+                        finished_count += 1
+                        finish(item[1])
+                        continue
+                    if self._is_limited(node, running_count):
+                        skipped.append(item)
+                        continue
+                    running[executor.submit(self._run_unit, unit)] = item[1]
+                    running_count[node.name] += 1
+                for item in skipped:
+                    heapq.heappush(ready, item)
+                if finished_count >= len(self.units):
+                    break
+                if len(running) < 1:
+                    raise RuntimeError("Can not find any node to run, please check dependency of nodes")
+                done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    running_count[self.nodes[self.units[index].node_index].name] -= 1
+                    future.result()  # raise if node failed
+                    finished_count += 1
+                    finish(index)
+        set_global_pbar(None)
@@ -1,10 +1,11 @@
 import sys
 
 import demeter_fetch.common.utils as utils
-from demeter_fetch.core import download, get_commend_args
+from demeter_fetch.core import download, get_commend_args, plan
 from demeter_fetch.tools import date_to_height
 
-if __name__ == "__main__":
+
+def main():
     if len(sys.argv) == 1:
         utils.print_log("use parameter -h for help")
         exit(1)
@@ -18,4 +19,9 @@ if __name__ == "__main__":
     elif args.tools is not None:
         if args.tools == "date_to_height":
             date_to_height(args)
-        pass
+        elif args.tools == "plan":
+            plan(args.plan_config)
+
+
+if __name__ == "__main__":
+    main()
@@ -41,7 +41,7 @@ class SqueethMinute(DailyNode):
             df["WETH"] = eth_price_df["weth"]
             df["OSQTH"] = squeeth_price_df["osqth"]
             return df
-        raw_df["block_timestamp"] = pd.to_datetime(raw_df["block_timestamp"].apply(lambda x: x[0:19]))
+        raw_df["block_timestamp"] = pd.to_datetime(raw_df["block_timestamp"].apply(lambda x: str(x)[0:19]))
         raw_df = raw_df.set_index(["block_timestamp"])
         raw_df["oldNormFactor"] = raw_df["data"].apply(lambda x: Decimal(int(x[2 : 2 + 64], 16)) / Decimal(1e18))
         raw_df["newNormFactor"] = raw_df["data"].apply(
@@ -6,7 +6,7 @@ from typing import Dict, Callable, List
 import pandas as pd
 
 from .uniswap_utils import match_proxy_log, handle_event, handle_proxy_event
-from ..common import to_decimal, DailyNode, NodeNames, DailyParam, get_tx_type, get_depend_name
+from ..common import to_decimal, DailyNode, NodeNames, DailyParam, get_tx_type, get_depend_name, metrics
 
 tick_file_columns = [
     "block_number",
@@ -127,10 +127,12 @@ class UniTick(DailyNode):
     def _process_one_day(self, data: Dict[str, pd.DataFrame], day: datetime.date) -> pd.DataFrame:
         pool_df = data[get_depend_name(NodeNames.uni_pool, self.id)]
         proxy_df = data[get_depend_name(NodeNames.uni_proxy_lp, self.id)]
-        match_proxy_log(pool_df, proxy_df)
+        with metrics.section("match_proxy_log"):
+            match_proxy_log(pool_df, proxy_df)
         pool_df = pool_df.sort_values(["block_number", "log_index"], ascending=[True, True])
 
-        merged_df = convert_pool_tick_df(pool_df)
+        with metrics.section("convert_pool_tick_df"):
+            merged_df = convert_pool_tick_df(pool_df)
         merged_df[["proxy_topics", "proxy_data", "proxy_log_index"]] = pool_df[
             ["proxy_topics", "proxy_data", "proxy_log_index"]
         ]
@@ -187,7 +189,8 @@ class UniTickNoPos(DailyNode):
 
     def _process_one_day(self, data: Dict[str, pd.DataFrame], day: datetime.date) -> pd.DataFrame:
         input_param = data[get_depend_name(NodeNames.uni_pool, self.id)]
-        df = convert_pool_tick_df(input_param)
+        with metrics.section("convert_pool_tick_df"):
+            df = convert_pool_tick_df(input_param)
         return df
 
 
@@ -8,7 +8,7 @@ from typing import List
 
 import pandas as pd
 
-from .big_query_utils import BigQueryChain, query_by_sql
+from .big_query_utils import BigQueryChain, query_by_sql, dry_run_by_sql
 from .. import ChainTypeConfig
 from ..common import FromConfig, utils, KECCAK
 
@@ -37,41 +37,50 @@ def _update_df(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def bigquery_pool(config: FromConfig, day: date):
+def get_pool_sql(config: FromConfig, day: date) -> str:
     day_str = day.strftime("%Y-%m-%d")
-    sql = f"""
+    return f"""
     SELECT block_number,block_timestamp, transaction_hash , transaction_index , log_index, topics , DATA as data
         FROM {BigQueryChain[config.chain.value].value["table_name"]}
         WHERE  topics[SAFE_OFFSET(0)] in {KECCAK.SWAP.value, KECCAK.BURN.value, KECCAK.COLLECT.value, KECCAK.MINT.value}
             AND DATE(block_timestamp) =  DATE("{day_str}") AND address = "{config.uniswap_config.pool_address}"
     """
-    df = query_by_sql(sql, config.big_query.auth_file, config.http_proxy)
+
+
+def bigquery_pool(config: FromConfig, day: date):
+    df = query_by_sql(get_pool_sql(config, day), config.big_query.auth_file, config.http_proxy)
     df = _update_df(df)
     return df
 
 
-def bigquery_proxy_lp(config: FromConfig, day: date):
+def get_proxy_lp_sql(config: FromConfig, day: date) -> str:
     day_str = day.strftime("%Y-%m-%d")
-    sql = f"""
+    return f"""
     SELECT block_number,block_timestamp, transaction_hash , transaction_index , log_index, topics , DATA as data
         FROM {BigQueryChain[config.chain.value].value["table_name"]}
         WHERE  topics[SAFE_OFFSET(0)] in {KECCAK.UNI_PROXY_INCREASE.value, KECCAK.UNI_PROXY_DECREASE.value, KECCAK.UNI_PROXY_COLLECT.value}
             AND DATE(block_timestamp) =  DATE("{day_str}") AND address = "{ChainTypeConfig[config.chain]["uniswap_proxy_addr"]}"
     """
-    df = query_by_sql(sql, config.big_query.auth_file, config.http_proxy)
+
+
+def bigquery_proxy_lp(config: FromConfig, day: date):
+    df = query_by_sql(get_proxy_lp_sql(config, day), config.big_query.auth_file, config.http_proxy)
     df = _update_df(df)
     return df
 
 
-def bigquery_proxy_transfer(config: FromConfig, day: date):
+def get_proxy_transfer_sql(config: FromConfig, day: date) -> str:
     day_str = day.strftime("%Y-%m-%d")
-    sql = f"""
+    return f"""
     SELECT block_number,block_timestamp, transaction_hash , transaction_index , log_index, topics , DATA as data
         FROM {BigQueryChain[config.chain.value].value["table_name"]}
         WHERE  topics[SAFE_OFFSET(0)] in ('{KECCAK.TRANSFER.value}')
             AND DATE(block_timestamp) =  DATE("{day_str}") AND address = "{ChainTypeConfig[config.chain]["uniswap_proxy_addr"]}"
     """
-    df = query_by_sql(sql, config.big_query.auth_file, config.http_proxy)
+
+
+def bigquery_proxy_transfer(config: FromConfig, day: date):
+    df = query_by_sql(get_proxy_transfer_sql(config, day), config.big_query.auth_file, config.http_proxy)
     df["topics"] = df["topics"].apply(lambda x: x.tolist())
     return df
 
@@ -90,7 +99,7 @@ def bigquery_transaction(config: FromConfig, day: date, tx: List[str]):
     return df
 
 
-def bigquery_aave(config: FromConfig, day: date, tokens: List[str]):
+def get_aave_sql(config: FromConfig, day: date, tokens: List[str]) -> str:
     day_str = day.strftime("%Y-%m-%d")
     token_str = ",".join(['"' + utils.hex_to_length(x, 64) + '"' for x in tokens])
     keccak_str = ",".join(
@@ -106,7 +115,7 @@ def bigquery_aave(config: FromConfig, day: date, tokens: List[str]):
             ]
         ]
     )
-    sql = f"""
+    return f"""
             SELECT block_number,block_timestamp,transaction_hash,transaction_index,log_index,topics,DATA as data
             FROM {BigQueryChain[config.chain.value].value["table_name"]}
             WHERE
@@ -116,6 +125,16 @@ def bigquery_aave(config: FromConfig, day: date, tokens: List[str]):
               AND DATE(block_timestamp) <= DATE("{day_str}")
               AND address = "{ChainTypeConfig[config.chain]['aave_v3_pool_addr']}"
         """
-    df = query_by_sql(sql, config.big_query.auth_file, config.http_proxy)
+
+
+def bigquery_aave(config: FromConfig, day: date, tokens: List[str]):
+    df = query_by_sql(get_aave_sql(config, day, tokens), config.big_query.auth_file, config.http_proxy)
     df = _update_df(df)
     return df
+
+
+def bigquery_estimate(config: FromConfig, sql: str) -> int:
+    """
+    :return: bytes will be scanned by the query
+    """
+    return dry_run_by_sql(sql, config.big_query.auth_file, config.http_proxy)
@@ -5,7 +5,7 @@ from typing import List
 from google.cloud import bigquery
 from google.cloud.bigquery import Client
 
-from demeter_fetch.common import print_log
+from demeter_fetch.common import print_log, metrics
 
 global_client: Client | None = None
 
@@ -37,11 +37,27 @@ def query_by_sql(query: str, auth_file: str, http_proxy: str | None = None):
     global global_client
     if global_client is None:
         global_client = bigquery.Client()
-    query_job = global_client.query(query)  # Make an API request.
-    result = query_job.to_dataframe(create_bqstorage_client=False)
+    with metrics.section("query_by_sql"):
+        query_job = global_client.query(query)  # Make an API request.
+        result = query_job.to_dataframe(create_bqstorage_client=False)
     return result
 
 
+def dry_run_by_sql(query: str, auth_file: str, http_proxy: str | None = None) -> int:
+    """
+    Validate the query without running it.
+
+    :return: bytes will be processed by the query
+    """
+    _set_environment(auth_file, http_proxy)
+    global global_client
+    if global_client is None:
+        global_client = bigquery.Client()
+    job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+    query_job = global_client.query(query, job_config=job_config)
+    return query_job.total_bytes_processed
+
+
 def close_client():
     global global_client
     if global_client is not None:
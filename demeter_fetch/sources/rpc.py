@@ -1,19 +1,33 @@
+import hashlib
 import os
+import threading
 from datetime import date, timezone, datetime
-from typing import List, Dict
+from typing import List, Dict, Tuple, Iterable
 
+import numpy as np
 import pandas as pd
 
 import demeter_fetch.sources.rpc_utils as rpc_utils
+from .rpc_pool import RpcClientPool, PoolEndpoint
 from .source_utils import get_height_from_date
 from .. import ChainType, ChainTypeConfig
-from ..common import FromConfig, KECCAK, utils, split_topic, hex_to_length
+from ..common import (
+    DataSource,
+    FromConfig,
+    RpcEndpoint,
+    KECCAK,
+    utils,
+    split_topic,
+    hex_to_length,
+    WorkEstimate,
+    metrics,
+)
 from .source_utils import ContractConfig
 
 
 def _update_df(df: pd.DataFrame) -> pd.DataFrame:
     if "block_timestamp" in df.columns:
-        df["block_timestamp"] = df["block_timestamp"].apply(lambda x: x.replace("T", " "))
+        df["block_timestamp"] = df["block_timestamp"].str.replace("T", " ", regex=False)
 
         columns = [
             "block_number",
@@ -50,23 +64,82 @@ def query_tx_logs(
     pass
 
 
+_clients: Dict[Tuple, rpc_utils.BaseRpcClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(config: FromConfig) -> rpc_utils.BaseRpcClient:
+    """
+    Get rpc client of config, clients are shared by nodes and days in a process, so connections can be kept alive.
+    If there are more than one end point, or end point has a rate limit, a pool of end points is returned.
+    """
+    http_proxy = config.http_proxy if not config.rpc.force_no_proxy else None
+    end_points = config.rpc.end_points
+    if len(end_points) < 1:
+        end_points = [RpcEndpoint(config.rpc.end_point, auth_string=config.rpc.auth_string)]
+    key = (
+        os.getpid(),  # clients can not be shared with child processes
+        tuple((e.url, e.weight, e.rate_limit, e.auth_string) for e in end_points),
+        http_proxy,
+        config.rpc.async_client,
+        config.rpc.concurrency,
+        config.rpc.json_rpc_batch_size,
+        config.rpc.hedge,
+        str(config.rpc.retry),
+        config.rpc.requests_per_second,
+        config.rpc.compute_units_per_second,
+        str(config.rpc.compute_units),
+    )
+    with _clients_lock:
+        if key not in _clients:
+            if config.rpc.async_client:
+                client_class = rpc_utils.AsyncEthRpcClient
+            else:
+                client_class = rpc_utils.EthRpcClient
+            rate_limiter = None
+            if config.rpc.requests_per_second > 0 or config.rpc.compute_units_per_second > 0:
+                rate_limiter = rpc_utils.RateLimiter(
+                    config.rpc.requests_per_second, config.rpc.compute_units_per_second, config.rpc.compute_units
+                )
+            clients = [
+                client_class(
+                    e.url,
+                    http_proxy,
+                    e.auth_string,
+                    config.rpc.concurrency,
+                    config.rpc.json_rpc_batch_size,
+                    config.rpc.retry,
+                    rate_limiter,  # shared by all end points
+                )
+                for e in end_points
+            ]
+            if len(end_points) == 1 and end_points[0].rate_limit <= 0:
+                _clients[key] = clients[0]
+            else:
+                _clients[key] = RpcClientPool(
+                    [PoolEndpoint(c, e.weight, e.rate_limit, e.url) for c, e in zip(clients, end_points)],
+                    config.rpc.concurrency,
+                    config.rpc.json_rpc_batch_size,
+                    config.rpc.hedge,
+                )
+        return _clients[key]
+
+
 def query_logs(
     chain: ChainType,
-    end_point: str,
+    client: rpc_utils.BaseRpcClient,
     save_path: str,
     start_height: int,
     end_height: int,
     contract: ContractConfig,
     batch_size: int = 500,
-    auth_string: str | None = None,
-    http_proxy: str | None = None,
     keep_tmp_files: bool = False,
     one_by_one: bool = False,
     skip_timestamp: bool = False,
+    interpolate_timestamp: bool = False,
 ) -> pd.DataFrame:
-    client = rpc_utils.EthRpcClient(end_point, http_proxy, auth_string)
     utils.print_log(f"Will download from height {start_height} to {end_height}")
-    try:
+    with metrics.section("query_event_by_height"):
         tmp_files_paths: List[str] = rpc_utils.query_event_by_height(
             chain,
             client,
@@ -77,24 +150,99 @@ def query_logs(
             batch_size=batch_size,
             one_by_one=one_by_one,
             skip_timestamp=skip_timestamp,
+            interpolate_timestamp=interpolate_timestamp,
         )
+
+    # Load temporary files based on height one by one, and assemble logs of the day
+    # Note: The logs in the tmp file have been sorted, and tmp files are in order, so they are not sorted again.
+    with metrics.section("load_tmp_file"):
+        df = _logs_to_df(rpc_utils.load_tmp_files(tmp_files_paths))
+    # remove tmp files
+    if not keep_tmp_files:
+        for f in tmp_files_paths:
+            if os.path.exists(f):
+                os.remove(f)
+    return df
+
+
+def get_day_heights(config: FromConfig, save_path: str, days: List[date]) -> Dict[date, Tuple[int, int]]:
+    """
+    Height range of days. They are found by searching block timestamps over rpc, and saved in height cache of
+    save path. If the search failed and etherscan_fallback is set, they are queried from etherscan.
+    """
+    height_cache = rpc_utils.get_height_cache(config.chain, save_path)
+    day_heights = height_cache.get_day_heights(days)
+    days = [d for d in days if d not in day_heights]
+    if len(days) < 1:
+        return day_heights
+    utils.print_log(f"Resolve height range from {min(days)} to {max(days)}")
+    try:
+        day_heights.update(rpc_utils.resolve_day_heights(get_client(config), days, height_cache))
     except Exception as e:
-        print(e)
-        import traceback
-
-        print(traceback.format_exc())
-        exit(1)
-
-    current_day_logs = []
-    # Load temporary files based on height, then reorganize into raw files by day
-    # Note: The logs in the tmp file have been sorted
-    # utils.print_log("Generating daily files")
-    for tmp_file in tmp_files_paths:
-        logs: List[Dict] = rpc_utils.load_tmp_file(tmp_file)
-        current_day_logs.extend(logs)
-    df = pd.DataFrame(current_day_logs)
-    if "block_dt" in df.columns:
-        df = df.drop(columns=["block_dt"])
+        if not config.rpc.etherscan_fallback:
+            raise
+        utils.print_log(f"Resolve height range by rpc failed, query etherscan instead, error: {e}")
+        for day in days:
+            day_heights[day] = get_height_from_date(day, config.chain, config.http_proxy, config.rpc.etherscan_api_key)
+        today = datetime.now(timezone.utc).date()
+        height_cache.set_day_heights({d: day_heights[d] for d in days if d < today})
+    return day_heights
+
+
+def get_day_height(config: FromConfig, save_path: str, day: date) -> Tuple[int, int]:
+    return get_day_heights(config, save_path, [day])[day]
+
+
+def is_day_finished(config: FromConfig, save_path: str, day: date) -> bool:
+    """
+    If all blocks of a day have been produced. For rpc source, only finished days are saved in height cache.
+    """
+    if config.data_source == DataSource.rpc:
+        return len(rpc_utils.get_height_cache(config.chain, save_path).get_day_heights([day])) > 0
+    return day < datetime.now(timezone.utc).date()
+
+
+def _is_sorted(df: pd.DataFrame) -> bool:
+    block_diff = np.diff(df["block_number"].to_numpy())
+    log_diff = np.diff(df["log_index"].to_numpy())
+    return bool(np.all((block_diff > 0) | ((block_diff == 0) & (log_diff > 0))))
+
+
+def _logs_to_df(frames: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Assemble logs loaded from temporary files into one dataframe.
+    Frames are taken one by one and only their columns are kept, so if frames is an iterator, a frame is released
+    once it's taken. Columns are concatenated and released one by one, and a single frame is used without copy,
+    so the peak memory is about the size of the day, instead of all frames plus a copy of them.
+    Logs in a temporary file are sorted, and files are in order of height, so logs are sorted after assembling.
+    They are only sorted again if they are not, e.g. logs of receipts.
+    """
+    single: pd.DataFrame | None = None
+    chunks: Dict[str, List[pd.Series]] | None = None
+    for frame in frames:
+        if len(frame.index) < 1:
+            continue
+        if "block_dt" in frame.columns:  # temporary files of former versions
+            frame = frame.drop(columns=["block_dt"])
+        if single is None and chunks is None:
+            single = frame
+            continue
+        if chunks is None:
+            chunks = {name: [single[name]] for name in single.columns}
+            single = None
+        for name in list(chunks.keys()):
+            if name in frame.columns:
+                chunks[name].append(frame[name])
+            else:  # files with and without timestamp
+                del chunks[name]
+    if chunks is not None:
+        columns = {name: pd.concat(chunks.pop(name), ignore_index=True) for name in list(chunks.keys())}
+        df = pd.DataFrame(columns, copy=False)
+    elif single is not None:
+        df = single.copy(deep=False)  # data is not copied
+        df.index = pd.RangeIndex(len(df.index))
+    else:
+        df = pd.DataFrame()
     if len(df.index) < 1:
         df = pd.DataFrame(
             columns=[
@@ -107,71 +255,198 @@ def query_logs(
                 "data",
             ]
         )
-    else:
+    elif not _is_sorted(df):
         df = df.sort_values(["block_number", "log_index"], ascending=[True, True])
-    # remove tmp files
-    if not keep_tmp_files:
-        for f in tmp_files_paths:
-            if os.path.exists(f):
-                os.remove(f)
     return df
 
 
+SWEEP_SAVE_EVERY_QUERY = 100  # temporary files of a sweep cover more blocks, so ranges of eth_getLogs can grow more
+
+
+def get_swept_day_path(save_path: str, chain: ChainType, contract: ContractConfig, day: date) -> str:
+    topics_hash = hashlib.md5(",".join(sorted(contract.topics)).encode()).hexdigest()[:8]
+    return os.path.join(
+        save_path,
+        f"{chain.name}-{contract.name}-{topics_hash}-{day.strftime('%Y-%m-%d')}.sweep{rpc_utils.LOGS_FILE_EXT}",
+    )
+
+
+def _split_consecutive_days(days: List[date]) -> List[List[date]]:
+    groups = []
+    for day in sorted(days):
+        if len(groups) > 0 and (day - groups[-1][-1]).days == 1:
+            groups[-1].append(day)
+        else:
+            groups.append([day])
+    return groups
+
+
+def _save_swept_day(save_path: str, chain: ChainType, contract: ContractConfig, day: date, frames: List[pd.DataFrame]):
+    rpc_utils.save_logs_file(get_swept_day_path(save_path, chain, contract, day), _logs_to_df(frames))
+
+
+def sweep_logs(config: FromConfig, save_path: str, days: List[date], contract: ContractConfig):
+    """
+    Query logs of days with one sweep over heights instead of day by day, then split logs into daily files by
+    block timestamp, so sparse contracts need much fewer eth_getLogs calls.
+    Consecutive days are swept together, and days which have been swept are skipped.
+    Only for logs with block timestamp.
+    """
+    days = [
+        d for d in days if rpc_utils.find_logs_file(get_swept_day_path(save_path, config.chain, contract, d)) is None
+    ]
+    for group in _split_consecutive_days(days):
+        day_heights = get_day_heights(config, save_path, group)
+        start_height, end_height = day_heights[group[0]][0], day_heights[group[-1]][1]
+        utils.print_log(f"Sweep logs from {group[0]} to {group[-1]}, height {start_height} to {end_height}")
+        with metrics.section("query_event_by_height"):
+            tmp_files_paths = rpc_utils.query_event_by_height(
+                config.chain,
+                get_client(config),
+                contract,
+                start_height,
+                end_height,
+                save_path=save_path,
+                save_every_query=SWEEP_SAVE_EVERY_QUERY,
+                batch_size=config.rpc.batch_size,
+                interpolate_timestamp=config.rpc.interpolate_timestamp,
+            )
+        # temporary files are sorted by height, so logs of a day are continuous
+        with metrics.section("split_by_day"):
+            day_index, current_frames = 0, []
+            for tmp_file in tmp_files_paths:
+                tmp_df = rpc_utils.load_tmp_file(tmp_file)
+                if len(tmp_df.index) < 1:
+                    continue
+                for day_str, day_df in tmp_df.groupby(tmp_df["block_timestamp"].str[:10], sort=True):
+                    log_day = date.fromisoformat(day_str)
+                    while log_day > group[day_index] and day_index < len(group) - 1:
+                        _save_swept_day(save_path, config.chain, contract, group[day_index], current_frames)
+                        day_index, current_frames = day_index + 1, []
+                    current_frames.append(day_df)
+            for day in group[day_index:]:
+                _save_swept_day(save_path, config.chain, contract, day, current_frames)
+                current_frames = []
+        if not config.rpc.keep_tmp_files:
+            for f in tmp_files_paths:
+                if os.path.exists(f):
+                    os.remove(f)
+
+
+def load_swept_day(config: FromConfig, save_path: str, day: date, contract: ContractConfig) -> pd.DataFrame:
+    """
+    Load logs of a day from swept file, the day will be swept if it hasn't been.
+    """
+    path = rpc_utils.find_logs_file(get_swept_day_path(save_path, config.chain, contract, day))
+    if path is None:
+        sweep_logs(config, save_path, [day], contract)
+        path = get_swept_day_path(save_path, config.chain, contract, day)
+    with metrics.section("load_tmp_file"):
+        df = _logs_to_df([rpc_utils.load_tmp_file(path)])
+    if not config.rpc.keep_tmp_files:
+        os.remove(path)
+    return df
+
+
+def remove_swept_day(config: FromConfig, save_path: str, day: date, contract: ContractConfig):
+    """
+    Remove swept file of a day which won't be loaded, e.g. it's in file cache
+    """
+    path = rpc_utils.find_logs_file(get_swept_day_path(save_path, config.chain, contract, day))
+    if path is not None:
+        os.remove(path)
+
+
 def rpc_pool(config: FromConfig, save_path: str, day: date) -> pd.DataFrame:
-    start_height, end_height = get_height_from_date(day, config.chain, config.http_proxy, config.rpc.etherscan_api_key)
-    daily_df = query_logs(
-        chain=config.chain,
-        end_point=config.rpc.end_point,
-        save_path=save_path,
-        start_height=start_height,
-        end_height=end_height,
-        contract=ContractConfig(
-            config.uniswap_config.pool_address,
-            [KECCAK.SWAP.value, KECCAK.BURN.value, KECCAK.COLLECT.value, KECCAK.MINT.value],
-        ),
-        batch_size=config.rpc.batch_size,
-        auth_string=config.rpc.auth_string,
-        http_proxy=config.http_proxy if not config.rpc.force_no_proxy else None,
-        keep_tmp_files=config.rpc.keep_tmp_files,
-        one_by_one=False,
-        skip_timestamp=False,
+    contract = ContractConfig(
+        config.uniswap_config.pool_address,
+        [KECCAK.SWAP.value, KECCAK.BURN.value, KECCAK.COLLECT.value, KECCAK.MINT.value],
     )
+    if config.rpc.sweep_range:
+        daily_df = load_swept_day(config, save_path, day, contract)
+    else:
+        start_height, end_height = get_day_height(config, save_path, day)
+        daily_df = query_logs(
+            chain=config.chain,
+            client=get_client(config),
+            save_path=save_path,
+            start_height=start_height,
+            end_height=end_height,
+            contract=contract,
+            batch_size=config.rpc.batch_size,
+            keep_tmp_files=config.rpc.keep_tmp_files,
+            one_by_one=False,
+            skip_timestamp=False,
+            interpolate_timestamp=config.rpc.interpolate_timestamp,
+        )
     daily_df = _update_df(daily_df)
     return daily_df
 
 
 def rpc_proxy_lp(config: FromConfig, save_path: str, day: date) -> pd.DataFrame:
-    start_height, end_height = get_height_from_date(day, config.chain, config.http_proxy, config.rpc.etherscan_api_key)
-    daily_df = query_logs(
-        chain=config.chain,
-        end_point=config.rpc.end_point,
-        save_path=save_path,
-        start_height=start_height,
-        end_height=end_height,
-        contract=ContractConfig(
-            ChainTypeConfig[config.chain]["uniswap_proxy_addr"],
-            [
-                KECCAK.UNI_PROXY_DECREASE.value,
-                KECCAK.UNI_PROXY_INCREASE.value,
-                KECCAK.UNI_PROXY_COLLECT.value,
-            ],
-        ),
-        batch_size=config.rpc.batch_size,
-        auth_string=config.rpc.auth_string,
-        http_proxy=config.http_proxy if not config.rpc.force_no_proxy else None,
-        keep_tmp_files=config.rpc.keep_tmp_files,
-        one_by_one=False,
-        skip_timestamp=False,
+    contract = ContractConfig(
+        ChainTypeConfig[config.chain]["uniswap_proxy_addr"],
+        [
+            KECCAK.UNI_PROXY_DECREASE.value,
+            KECCAK.UNI_PROXY_INCREASE.value,
+            KECCAK.UNI_PROXY_COLLECT.value,
+        ],
     )
+    if config.rpc.sweep_range:
+        daily_df = load_swept_day(config, save_path, day, contract)
+    else:
+        start_height, end_height = get_day_height(config, save_path, day)
+        daily_df = query_logs(
+            chain=config.chain,
+            client=get_client(config),
+            save_path=save_path,
+            start_height=start_height,
+            end_height=end_height,
+            contract=contract,
+            batch_size=config.rpc.batch_size,
+            keep_tmp_files=config.rpc.keep_tmp_files,
+            one_by_one=False,
+            skip_timestamp=False,
+            interpolate_timestamp=config.rpc.interpolate_timestamp,
+        )
     daily_df = _update_df(daily_df)
     return daily_df
 
 
+def rpc_proxy_lp_by_pool(config: FromConfig, pool_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Get proxy lp logs from receipts of transactions which have mint, burn or collect logs of the pool.
+    Only these proxy logs can be matched to pool logs, so logs of other pools are not queried.
+    Block timestamps are taken from pool logs of the same transaction.
+
+    :param pool_df: pool logs of the day
+    """
+    contract = ContractConfig(
+        ChainTypeConfig[config.chain]["uniswap_proxy_addr"],
+        [
+            KECCAK.UNI_PROXY_DECREASE.value,
+            KECCAK.UNI_PROXY_INCREASE.value,
+            KECCAK.UNI_PROXY_COLLECT.value,
+        ],
+    )
+    is_lp = pool_df["topics"].apply(lambda x: split_topic(x)[0] != KECCAK.SWAP.value).astype(bool)
+    lp_df = pool_df[is_lp]
+    if len(lp_df.index) < 1:  # no lp transaction in the day
+        return _update_df(_logs_to_df([]))
+    timestamps = {}
+    for tx_hash, block_timestamp in zip(lp_df["transaction_hash"], lp_df["block_timestamp"]):
+        timestamps[tx_hash] = pd.Timestamp(block_timestamp).strftime("%Y-%m-%d %H:%M:%S")
+    with metrics.section("query_receipts"):
+        df = rpc_utils.query_contract_event_by_tx(get_client(config), list(timestamps.keys()), contract)
+    df["block_timestamp"] = df["transaction_hash"].map(timestamps)
+    return _update_df(_logs_to_df([df]))
+
+
 def rpc_proxy_transfer(config: FromConfig, save_path: str, day: date) -> pd.DataFrame:
-    start_height, end_height = get_height_from_date(day, config.chain, config.http_proxy, config.rpc.etherscan_api_key)
+    start_height, end_height = get_day_height(config, save_path, day)
     daily_df = query_logs(
         chain=config.chain,
-        end_point=config.rpc.end_point,
+        client=get_client(config),
         save_path=save_path,
         start_height=start_height,
         end_height=end_height,
@@ -180,8 +455,6 @@ def rpc_proxy_transfer(config: FromConfig, save_path: str, day: date) -> pd.Data
             [KECCAK.TRANSFER.value],
         ),
         batch_size=config.rpc.batch_size,
-        auth_string=config.rpc.auth_string,
-        http_proxy=config.http_proxy if not config.rpc.force_no_proxy else None,
         keep_tmp_files=config.rpc.keep_tmp_files,
         one_by_one=True,
         skip_timestamp=True,
@@ -191,39 +464,42 @@ def rpc_proxy_transfer(config: FromConfig, save_path: str, day: date) -> pd.Data
 
 
 def rpc_uni_tx(config: FromConfig, tx_hashes: pd.Series) -> pd.DataFrame:
-    http_proxy = config.http_proxy if not config.rpc.force_no_proxy else None
-    client = rpc_utils.EthRpcClient(config.rpc.end_point, http_proxy, config.rpc.auth_string)
-    df = rpc_utils.query_tx(client, tx_hashes)
+    client = get_client(config)
+    with metrics.section("query_tx"):
+        df = rpc_utils.query_tx(client, tx_hashes)
     # df = df.drop(columns=["from", "to"])
     return df
 
 
 def rpc_aave(config: FromConfig, save_path: str, day: date, tokens):
-    start_height, end_height = get_height_from_date(day, config.chain, config.http_proxy, config.rpc.etherscan_api_key)
-    daily_df = query_logs(
-        chain=config.chain,
-        end_point=config.rpc.end_point,
-        save_path=save_path,
-        start_height=start_height,
-        end_height=end_height,
-        contract=ContractConfig(
-            ChainTypeConfig[config.chain]["aave_v3_pool_addr"],
-            [
-                KECCAK.AAVE_REPAY.value,
-                KECCAK.AAVE_BORROW.value,
-                KECCAK.AAVE_SUPPLY.value,
-                KECCAK.AAVE_WITHDRAW.value,
-                KECCAK.AAVE_UPDATED.value,
-                KECCAK.AAVE_LIQUIDATION.value,
-            ],
-        ),
-        batch_size=config.rpc.batch_size,
-        auth_string=config.rpc.auth_string,
-        http_proxy=config.http_proxy if not config.rpc.force_no_proxy else None,
-        keep_tmp_files=config.rpc.keep_tmp_files,
-        one_by_one=False,
-        skip_timestamp=False,
+    contract = ContractConfig(
+        ChainTypeConfig[config.chain]["aave_v3_pool_addr"],
+        [
+            KECCAK.AAVE_REPAY.value,
+            KECCAK.AAVE_BORROW.value,
+            KECCAK.AAVE_SUPPLY.value,
+            KECCAK.AAVE_WITHDRAW.value,
+            KECCAK.AAVE_UPDATED.value,
+            KECCAK.AAVE_LIQUIDATION.value,
+        ],
     )
+    if config.rpc.sweep_range:
+        daily_df = load_swept_day(config, save_path, day, contract)
+    else:
+        start_height, end_height = get_day_height(config, save_path, day)
+        daily_df = query_logs(
+            chain=config.chain,
+            client=get_client(config),
+            save_path=save_path,
+            start_height=start_height,
+            end_height=end_height,
+            contract=contract,
+            batch_size=config.rpc.batch_size,
+            keep_tmp_files=config.rpc.keep_tmp_files,
+            one_by_one=False,
+            skip_timestamp=False,
+            interpolate_timestamp=config.rpc.interpolate_timestamp,
+        )
     daily_df = _update_df(daily_df)
     daily_df["topics"] = daily_df["topics"].apply(lambda x: split_topic(x))
     daily_df["token"] = daily_df["topics"].apply(lambda r: hex_to_length(r[1], 40))
@@ -234,10 +510,10 @@ def rpc_aave(config: FromConfig, save_path: str, day: date, tokens):
 def rpc_squeeth(config: FromConfig, save_path: str, day: date) -> pd.DataFrame:
     if "squeeth_controller" not in ChainTypeConfig[config.chain]:
         raise RuntimeError(f"Squeeth does not exist in chain {config.chain.name}")
-    start_height, end_height = get_height_from_date(day, config.chain, config.http_proxy, config.rpc.etherscan_api_key)
+    start_height, end_height = get_day_height(config, save_path, day)
     daily_df = query_logs(
         chain=config.chain,
-        end_point=config.rpc.end_point,
+        client=get_client(config),
         save_path=save_path,
         start_height=start_height,
         end_height=end_height,
@@ -246,8 +522,6 @@ def rpc_squeeth(config: FromConfig, save_path: str, day: date) -> pd.DataFrame:
             [KECCAK.SQUEETH_NORM_FACTOR_UPDATED.value],
         ),
         batch_size=config.rpc.batch_size,
-        auth_string=config.rpc.auth_string,
-        http_proxy=config.http_proxy if not config.rpc.force_no_proxy else None,
         keep_tmp_files=config.rpc.keep_tmp_files,
         one_by_one=True,
         skip_timestamp=True,
@@ -258,3 +532,24 @@ def rpc_squeeth(config: FromConfig, save_path: str, day: date) -> pd.DataFrame:
     )
 
     return daily_df
+
+
+def rpc_estimate(
+    config: FromConfig, save_path: str, day: date, contract: ContractConfig, one_by_one: bool, skip_timestamp: bool
+) -> WorkEstimate:
+    """
+    Estimate requests of query_logs for one day, parameters should be the same as query_logs
+    """
+    start_height, end_height = get_day_height(config, save_path, day)
+    get_logs_calls, timestamp_lookups = rpc_utils.estimate_event_by_height(
+        config.chain,
+        contract,
+        start_height,
+        end_height,
+        rpc_utils.get_height_cache(config.chain, save_path),
+        save_path=save_path,
+        batch_size=config.rpc.batch_size,
+        one_by_one=one_by_one,
+        skip_timestamp=skip_timestamp,
+    )
+    return WorkEstimate(get_logs_calls=get_logs_calls, timestamp_lookups=timestamp_lookups)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2024-03-30 11:20
+# @Author  : 32ethers
+# @Description: Spread requests among rpc end points, and fail over if an end point is unhealthy
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeoutError
+from typing import List, Dict
+
+from demeter_fetch.common._typing import EthError
+from .rpc_utils import BaseRpcClient, TokenBucket
+
+
+class PoolEndpoint:
+    """
+    An end point in pool, with its health state.
+    Latency and error rate are exponentially weighted moving averages, latency is tracked for every method.
+    """
+
+    def __init__(self, client: BaseRpcClient, weight: float = 1, rate_limit: float = 0, name: str = ""):
+        """
+        :param client: client of end point
+        :param weight: share of requests, compared with other end points
+        :param rate_limit: max requests per second, 0 means no limit
+        :param name: name in logs, e.g. url
+        """
+        self.client = client
+        self.weight = weight
+        self.name = name
+        self.bucket = TokenBucket(rate_limit) if rate_limit > 0 else None
+        self.latency: Dict[str, float] = {}
+        self.error_rate = 0.0
+        self.consecutive_errors = 0
+        self.ejected_until = 0.0
+        self.ejection_count = 0
+        self.request_count = 0
+        self.error_count = 0
+
+
+class RpcClientPool(BaseRpcClient):
+    """
+    Send requests to several end points.
+
+    * End points are picked randomly, chance is weight / latency of the method, lowered by error rate.
+    * If an end point failed(connection error, timeout, bad http status), requests are sent to another one.
+      Errors returned by json rpc (EthError) are raised to caller, as other end points will return the same.
+    * An end point is ejected after continuous errors, or if its error rate is too high.
+      It will be picked again after cooldown, cooldown doubles if it's ejected again.
+    * If a request is slower than usual, it will be sent to another end point too, and the faster response is taken.
+      Hedged requests share the in-flight budget with other requests, a request is not hedged if the budget is used up.
+    """
+
+    alpha = 0.2  # weight of the latest sample in moving averages
+    eject_errors = 3  # eject after this many continuous errors
+    eject_error_rate = 0.5
+    cooldown = 10  # seconds
+    max_cooldown = 300
+    hedge_min_delay = 1  # seconds
+    hedge_latency_factor = 3  # hedge if a request is slower than latency * factor
+    default_latency = 1  # latency of a method which hasn't been sent to an end point
+
+    def __init__(self, endpoints: List[PoolEndpoint], concurrency: int = 10, batch_size: int = 1, hedge: bool = True):
+        """
+        :param endpoints: end points, clients of them should support return_exceptions in send_many
+        :param concurrency: max requests in flight to end points, shared by all callers and hedged requests
+        :param batch_size: requests sent to an end point together, should be json_rpc_batch_size of clients
+        :param hedge: send slow requests to another end point
+        """
+        if len(endpoints) < 1:
+            raise RuntimeError("Rpc client pool should have at least one end point")
+        self.endpoints = endpoints
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.hedge = hedge and len(endpoints) > 1
+        self._lock = threading.Lock()
+        # a request to an end point holds a slot until it's finished, so requests never wait for a thread in executor,
+        # and time before hedging is spent on the request only
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="rpc-pool")
+
+    def _score(self, endpoint: PoolEndpoint, commend: str) -> float:
+        latency = endpoint.latency.get(commend, RpcClientPool.default_latency)
+        return endpoint.weight * max(1 - endpoint.error_rate, 0.05) / max(latency, 0.001)
+
+    def _select(self, commend: str, exclude: List[PoolEndpoint]) -> PoolEndpoint | None:
+        with self._lock:
+            now = time.monotonic()
+            candidates = [e for e in self.endpoints if e not in exclude]
+            if len(candidates) < 1:
+                return None
+            healthy = [e for e in candidates if e.ejected_until <= now]
+            if len(healthy) < 1:  # all are ejected, try the one which will come back first
+                return min(candidates, key=lambda e: e.ejected_until)
+            return random.choices(healthy, weights=[self._score(e, commend) for e in healthy])[0]
+
+    def _hedge_delay(self, endpoint: PoolEndpoint, commend: str) -> float:
+        with self._lock:
+            latency = endpoint.latency.get(commend, RpcClientPool.default_latency)
+        return max(RpcClientPool.hedge_min_delay, latency * RpcClientPool.hedge_latency_factor)
+
+    def _update_health(self, endpoint: PoolEndpoint, commend: str, seconds: float, failed: bool):
+        alpha = RpcClientPool.alpha
+        with self._lock:
+            endpoint.request_count += 1
+            endpoint.error_rate = endpoint.error_rate * (1 - alpha) + (alpha if failed else 0)
+            if not failed:
+                last = endpoint.latency.get(commend, seconds)
+                endpoint.latency[commend] = last * (1 - alpha) + seconds * alpha
+                endpoint.consecutive_errors = 0
+                if endpoint.ejected_until <= time.monotonic():
+                    endpoint.ejection_count = 0
+                return
+            endpoint.error_count += 1
+            endpoint.consecutive_errors += 1
+            if (
+                endpoint.consecutive_errors >= RpcClientPool.eject_errors
+                or endpoint.error_rate > RpcClientPool.eject_error_rate
+            ):
+                cooldown = min(RpcClientPool.cooldown * 2**endpoint.ejection_count, RpcClientPool.max_cooldown)
+                endpoint.ejected_until = time.monotonic() + cooldown
+                endpoint.ejection_count += 1
+                endpoint.consecutive_errors = 0
+
+    @staticmethod
+    def _is_endpoint_error(result) -> bool:
+        return isinstance(result, Exception) and not isinstance(result, EthError)
+
+    def _call_endpoint(self, endpoint: PoolEndpoint, commend: str, params_list: List[List]) -> List:
+        if endpoint.bucket is not None:
+            endpoint.bucket.acquire(len(params_list))
+        start = time.monotonic()
+        try:
+            # requests of a call are sent to an end point together, concurrency is managed by pool
+            results = endpoint.client.send_many(commend, params_list, concurrency=1, return_exceptions=True)
+        except Exception as e:
+            results = [e] * len(params_list)
+        failed = any(RpcClientPool._is_endpoint_error(r) for r in results)
+        self._update_health(endpoint, commend, time.monotonic() - start, failed)
+        return results
+
+    def _call_in_slot(self, endpoint: PoolEndpoint, commend: str, params_list: List[List]) -> List:
+        try:
+            return self._call_endpoint(endpoint, commend, params_list)
+        finally:
+            self._slots.release()
+
+    def _call_hedged(self, endpoint: PoolEndpoint, commend: str, params_list: List[List], tried: List) -> List:
+        self._slots.acquire()
+        if not self.hedge:
+            return self._call_in_slot(endpoint, commend, params_list)  # in caller's thread
+        future = self._executor.submit(self._call_in_slot, endpoint, commend, params_list)
+        try:
+            return future.result(timeout=self._hedge_delay(endpoint, commend))
+        except FutureTimeoutError:
+            pass
+        backup = self._select(commend, tried)
+        if backup is None or not self._slots.acquire(blocking=False):
+            return future.result()
+        tried.append(backup)
+        backup_future = self._executor.submit(self._call_in_slot, backup, commend, params_list)
+        done, not_done = wait([future, backup_future], return_when=FIRST_COMPLETED)
+        results = done.pop().result()
+        if any(RpcClientPool._is_endpoint_error(r) for r in results) and len(not_done) > 0:
+            other = not_done.pop().result()
+            results = [o if RpcClientPool._is_endpoint_error(r) else r for r, o in zip(results, other)]
+        return results
+
+    def _call(self, commend: str, params_list: List[List]) -> List:
+        """
+        Send requests to end points until they succeed or all end points have been tried.
+
+        :return: results, or exceptions of failed requests
+        """
+        results = [None] * len(params_list)
+        pending = list(range(len(params_list)))
+        tried = []
+        while len(pending) > 0:
+            endpoint = self._select(commend, tried)
+            if endpoint is None:
+                break
+            tried.append(endpoint)
+            call_results = self._call_hedged(endpoint, commend, [params_list[i] for i in pending], tried)
+            failed = []
+            for index, result in zip(pending, call_results):
+                results[index] = result
+                if RpcClientPool._is_endpoint_error(result):
+                    failed.append(index)
+            pending = failed
+        return results
+
+    def send(self, commend: str, params: List):
+        result = self._call(commend, [params])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def send_many(
+        self, commend: str, params_list: List[List], concurrency: int | None = None, return_exceptions: bool = False
+    ) -> List:
+        if len(params_list) < 1:
+            return []
+        chunks = [params_list[i : i + self.batch_size] for i in range(0, len(params_list), self.batch_size)]
+        with ThreadPoolExecutor(max_workers=min(concurrency or self.concurrency, len(chunks))) as executor:
+            results = [
+                r for chunk_results in executor.map(lambda c: self._call(commend, c), chunks) for r in chunk_results
+            ]
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        for endpoint in self.endpoints:
+            endpoint.client.close()
@@ -1,73 +1,283 @@
+import asyncio
+import bisect
 import json
+import math
 import os.path
 import pickle
 import random
+import sqlite3
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from datetime import datetime, UTC, timezone
-from operator import itemgetter
-from typing import List, Dict
+from datetime import date, datetime, timedelta, UTC
+from typing import List, Dict, Tuple, Iterable, Iterator
 
 import numpy as np
 import pandas as pd
 import requests
 from tqdm import tqdm  # process bar
 
+try:
+    import orjson
+except ImportError:  # optional, install it by pip install demeter-fetch[fast]
+    orjson = None
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # optional, temporary files are pickled without it
+    pa = feather = None
+
 import demeter_fetch.common.utils as utils
-from demeter_fetch.common._typing import ChainType
-from demeter_fetch.common._typing import EthError
+from demeter_fetch.common._typing import ChainType, ChainTypeConfig
+from demeter_fetch.common._typing import EthError, RetryPolicy, DEFAULT_RETRY_POLICIES
+from demeter_fetch.common._typing import DEFAULT_COMPUTE_UNIT, DEFAULT_COMPUTE_UNITS
 from .source_utils import ContractConfig
 
 
 @dataclass
 class GetLogsParam:
-    address: str
+    address: str | List[str]  # node returns logs of any address in the list
     fromBlock: int
     toBlock: int
-    topics: List[str] | None
+    topics: List[str | List[str] | None] | None  # a list in a position means any topic in it
 
 
-class EthRpcClient:
-    def __init__(self, endpoint: str, proxy="", auth=""):
-        self.session = requests.Session()
-        adapter = requests.adapters.HTTPAdapter(pool_connections=5, pool_maxsize=20)
-        self.session.mount("https://", adapter)
-        self.session.mount("http://", adapter)
-        self.headers = {}
-        self.endpoint = endpoint
-        if auth:
-            self.headers["Authorization"] = auth
-        self.proxies = (
-            {
-                "http": proxy,
-                "https": proxy,
-            }
-            if proxy
-            else {}
-        )
+def _encode_json_rpc(method: str, params: list):
+    return {"jsonrpc": "2.0", "method": method, "params": params, "id": random.randint(1, 2147483648)}
 
-    def __del__(self):
-        self.session.close()
 
-    @staticmethod
-    def __encode_json_rpc(method: str, params: list):
-        return {"jsonrpc": "2.0", "method": method, "params": params, "id": random.randint(1, 2147483648)}
+def json_loads(content: bytes | str):
+    """
+    Decode json of response, orjson is used if it has been installed
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
 
-    @staticmethod
-    def __decode_json_rpc(response: requests.Response):
+
+def _decode_json_rpc(content: Dict):
+    if "error" in content:
+        raise EthError(content["error"]["code"], content["error"]["message"])
+    return content["result"]
+
+
+BATCH_RETRY = 3  # max times failed items in a json rpc batch will be sent again, if their errors can be retried
+REQUEST_TIMEOUT = 120  # seconds
+
+
+def _split_batches(params_list: List[List], batch_size: int) -> List[List[Tuple[int, List]]]:
+    """
+    Split params into batches, item in batch is (index, params), index is used as id of request
+    """
+    items = list(enumerate(params_list))
+    return [items[i : i + batch_size] for i in range(0, len(items), max(batch_size, 1))]
+
+
+def _encode_batch(method: str, items: List[Tuple[int, List]]) -> List[Dict]:
+    return [{"jsonrpc": "2.0", "method": method, "params": params, "id": index} for index, params in items]
+
+
+def _decode_batch(content, items: List[Tuple[int, List]], results: Dict) -> Dict[int, Exception]:
+    """
+    Map responses of a batch back to requests by id, results of succeeded requests are saved to results.
+
+    :return: errors of failed items, by index
+    """
+    if not isinstance(content, list):  # the whole batch is rejected, e.g. batch is not supported by end point
+        _decode_json_rpc(content)
+        raise RuntimeError(f"Response of json rpc batch should be a list, but got {content}")
+    responses = {r.get("id"): r for r in content}
+    errors = {}
+    for index, params in items:
+        response = responses.get(index)
+        if response is None:
+            errors[index] = RuntimeError(f"Response of request {index} in json rpc batch is missing")
+        elif "error" in response:
+            errors[index] = EthError(response["error"]["code"], response["error"]["message"])
+        else:
+            results[index] = response["result"]
+    return errors
+
+
+def _split_failed_items(
+    policies: Dict[str, RetryPolicy], commend: str, items: List[Tuple[int, List]], errors: Dict, attempt: int
+) -> Tuple[List[Tuple[int, List]], float, Dict[int, Exception]]:
+    """
+    Find failed items of a batch which can be sent again, by retry policy of their errors.
+
+    :param attempt: how many times the items have been sent again
+    :return: items to send again, seconds to wait before sending them, errors of items which won't be sent again
+    """
+    retry_items, delay, given_up = [], 0, {}
+    for index, params in items:
+        if index not in errors:
+            continue
+        item_delay = get_retry_delay(policies, errors[index], attempt, commend) if attempt < BATCH_RETRY else None
+        if item_delay is None:
+            given_up[index] = errors[index]
+        else:
+            retry_items.append((index, params))
+            delay = max(delay, item_delay)
+    return retry_items, delay, given_up
+
+
+def get_logs_param(param: GetLogsParam) -> Dict:
+    """
+    Convert to params of eth_getLogs, heights are encoded as hex
+    """
+    ret = dict(vars(param))
+    if param.toBlock:
+        ret["toBlock"] = hex(param.toBlock)
+    if param.fromBlock:
+        ret["fromBlock"] = hex(param.fromBlock)
+    return ret
+
+
+class TokenBucket:
+    """
+    Limit rate of requests, shared by all threads.
+    Tokens are refilled at rate per second up to capacity, a caller waits if there are not enough tokens.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        """
+        :param rate: tokens per second
+        :param capacity: max tokens can be used in a burst, default is rate
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1) -> float:
+        """
+        Take tokens in advance, so callers wait in order.
+
+        :return: seconds caller should wait before sending
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._time) * self.rate)
+            self._time = now
+            self._tokens -= tokens
+            return -self._tokens / self.rate if self._tokens < 0 else 0
+
+    def acquire(self, tokens: float = 1):
+        wait_seconds = self.reserve(tokens)
+        if wait_seconds > 0:
+            time.sleep(wait_seconds)
+
+
+class RateLimiter:
+    """
+    Limit requests per second and compute units per second of clients, a limiter can be shared by clients.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: float = 0,
+        compute_units_per_second: float = 0,
+        compute_units: Dict[str, float] | None = None,
+    ):
+        """
+        :param requests_per_second: 0 means no limit, a request in json rpc batch is counted as one
+        :param compute_units_per_second: 0 means no limit
+        :param compute_units: compute units of methods, default is DEFAULT_COMPUTE_UNITS
+        """
+        self.request_bucket = TokenBucket(requests_per_second) if requests_per_second > 0 else None
+        self.compute_unit_bucket = TokenBucket(compute_units_per_second) if compute_units_per_second > 0 else None
+        self.compute_units = compute_units if compute_units is not None else DEFAULT_COMPUTE_UNITS
+
+    def reserve(self, method: str, count: int = 1) -> float:
+        wait_seconds = 0
+        if self.request_bucket is not None:
+            wait_seconds = max(wait_seconds, self.request_bucket.reserve(count))
+        if self.compute_unit_bucket is not None:
+            compute_units = self.compute_units.get(method, DEFAULT_COMPUTE_UNIT) * count
+            wait_seconds = max(wait_seconds, self.compute_unit_bucket.reserve(compute_units))
+        return wait_seconds
+
+
+class RpcHttpError(RuntimeError):
+    def __init__(self, status: int, retry_after: str | None = None):
+        super().__init__("Request rpc return error with code {}".format(status))
+        self.status = status
+        self.retry_after = retry_after  # value of Retry-After header
+
+
+RATE_LIMIT_KEYWORDS = ["rate limit", "too many requests", "exceeded its compute units", "capacity"]
+
+
+def classify_error(e: Exception) -> str | None:
+    """
+    :return: class of error, which is a key of retry policies, None if the error should not be retried
+    """
+    if isinstance(e, RpcHttpError):
+        if e.status == 429:
+            return "rate_limit"
+        return "server_error" if e.status >= 500 else None
+    if isinstance(e, (requests.exceptions.Timeout, TimeoutError)):
+        return "timeout"
+    if isinstance(e, (requests.exceptions.ConnectionError, ConnectionError)):
+        return "connection"
+    if isinstance(e, EthError):
+        message = str(e.message).lower()
+        if e.code == 429 or any(k in message for k in RATE_LIMIT_KEYWORDS):
+            return "rate_limit"
+        return "rpc_error"
+    return None
+
+
+def get_retry_delay(
+    policies: Dict[str, RetryPolicy], e: Exception, attempt: int, commend: str | None = None
+) -> float | None:
+    """
+    :param attempt: how many times the request has been retried
+    :param commend: method of the request
+    :return: seconds to wait before retrying, None if it should not be retried
+    """
+    if commend == "eth_getLogs" and is_log_range_error(e):
+        return None  # block range will be split by query_event_by_height, sending it again won't help
+    policy = policies.get(classify_error(e))
+    if policy is None or attempt >= policy.retries:
+        return None
+    delay = min(policy.base_delay * 2**attempt, policy.max_delay) * random.uniform(0.5, 1)
+    if isinstance(e, RpcHttpError) and e.retry_after is not None:
         try:
-            content = response.json()
-        except Exception as e:
-            print(f"Decode rpc response failed, error: {e}")
-            raise e
+            delay = max(delay, float(e.retry_after))
+        except ValueError:  # it's a http date, which is rarely used by rpc providers
+            pass
+    return delay
 
-        if "error" in content:
-            raise EthError(content["error"]["code"], content["error"]["message"])
-        return content["result"]
 
-    def do_post(self, param):
-        return self.session.post(self.endpoint, json=param, proxies=self.proxies, headers=self.headers)
+class BaseRpcClient:
+    """
+    Methods of ethereum json rpc, subclass should implement send and send_many
+    """
+
+    concurrency = 10  # max requests in flight of send_many
+
+    def send(self, commend: str, params: List):
+        raise NotImplementedError()
+
+    def send_many(
+        self, commend: str, params_list: List[List], concurrency: int | None = None, return_exceptions: bool = False
+    ) -> List:
+        """
+        Send requests of the same method at the same time
+
+        :param commend: method
+        :param params_list: params of every request
+        :param concurrency: max requests in flight of this call, default is concurrency of client
+        :param return_exceptions: put exception of a failed request in results, instead of raising it
+        :return: results in the same order as params_list
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        pass
 
     def get_block(self, height):
         return self.send("eth_getBlockByNumber", [hex(height), False])
@@ -101,70 +311,539 @@ class EthRpcClient:
         return self.send("eth_getTransactionByHash", [tx_hash])
 
     def get_logs(self, param: GetLogsParam):
-        if param.toBlock:
-            param.toBlock = hex(param.toBlock)
-        if param.fromBlock:
-            param.fromBlock = hex(param.fromBlock)
-        return self.send("eth_getLogs", [vars(param)])
+        return self.send("eth_getLogs", [get_logs_param(param)])
+
+
+class EthRpcClient(BaseRpcClient):
+    def __init__(
+        self,
+        endpoint: str,
+        proxy="",
+        auth="",
+        concurrency: int = 10,
+        batch_size: int = 1,
+        retry_policies: Dict[str, RetryPolicy] | None = None,
+        rate_limiter: RateLimiter | None = None,
+    ):
+        """
+        :param concurrency: thread count of send_many
+        :param batch_size: max requests in a json rpc batch of send_many, 1 means no batch
+        :param retry_policies: retry policies of error classes, default is DEFAULT_RETRY_POLICIES, {} means no retry
+        :param rate_limiter: limiter shared by all threads, it can be shared with other clients
+        """
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=5, pool_maxsize=max(20, concurrency))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.headers = {}
+        self.endpoint = endpoint
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.retry_policies = retry_policies if retry_policies is not None else DEFAULT_RETRY_POLICIES
+        self.rate_limiter = rate_limiter
+        if auth:
+            self.headers["Authorization"] = auth
+        self.proxies = (
+            {
+                "http": proxy,
+                "https": proxy,
+            }
+            if proxy
+            else {}
+        )
+
+    def __del__(self):
+        self.session.close()
+
+    @staticmethod
+    def __decode_json_rpc(response: requests.Response):
+        try:
+            content = json_loads(response.content)
+        except Exception as e:
+            print(f"Decode rpc response failed, error: {e}")
+            raise e
+        return _decode_json_rpc(content)
+
+    def do_post(self, param):
+        return self.session.post(
+            self.endpoint, json=param, proxies=self.proxies, headers=self.headers, timeout=REQUEST_TIMEOUT
+        )
+
+    def _post(self, commend: str, payload, count: int = 1):
+        """
+        Post with rate limit, and retry by policies if failed.
+
+        :param count: how many requests in payload
+        :return: json content of response
+        """
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                time.sleep(self.rate_limiter.reserve(commend, count))
+            try:
+                response = self.do_post(payload)
+                if response.status_code != 200:
+                    raise RpcHttpError(response.status_code, response.headers.get("Retry-After"))
+                if isinstance(payload, list):
+                    return json_loads(response.content)
+                return EthRpcClient.__decode_json_rpc(response)
+            except Exception as e:
+                delay = get_retry_delay(self.retry_policies, e, attempt, commend)
+                if delay is None:
+                    raise e
+                time.sleep(delay)
+                attempt += 1
+
+    def send(self, commend: str, params: List):
+        return self._post(commend, _encode_json_rpc(commend, params))
+
+    def _send_batch(self, commend: str, items: List[Tuple[int, List]], return_exceptions: bool) -> Dict:
+        results = {}
+        try:
+            if len(items) == 1:
+                results[items[0][0]] = self.send(commend, items[0][1])
+                return results
+            attempt = 0
+            while True:
+                content = self._post(commend, _encode_batch(commend, items), len(items))
+                errors = _decode_batch(content, items, results)
+                items, delay, given_up = _split_failed_items(self.retry_policies, commend, items, errors, attempt)
+                if len(given_up) > 0:
+                    if not return_exceptions:
+                        raise next(iter(given_up.values()))
+                    results.update(given_up)
+                if len(items) < 1:
+                    return results
+                time.sleep(delay)
+                attempt += 1
+        except Exception as e:
+            if not return_exceptions:
+                raise e
+            results.update({index: e for index, params in items})
+            return results
+
+    def send_many(
+        self, commend: str, params_list: List[List], concurrency: int | None = None, return_exceptions: bool = False
+    ) -> List:
+        if len(params_list) < 1:
+            return []
+        batches = _split_batches(params_list, self.batch_size)
+        results = {}
+        with ThreadPoolExecutor(max_workers=min(concurrency or self.concurrency, len(batches))) as executor:
+            for batch_result in executor.map(lambda b: self._send_batch(commend, b, return_exceptions), batches):
+                results.update(batch_result)
+        return [results[i] for i in range(len(params_list))]
+
+
+class AsyncEthRpcClient(BaseRpcClient):
+    """
+    Json rpc client based on aiohttp, it can keep a lot of requests in flight with a few connections.
+
+    An event loop runs in a background thread, so it can be called by blocking code in any thread,
+    and all threads share the same connections (kept alive) and the same in-flight window.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        proxy="",
+        auth="",
+        concurrency: int = 100,
+        batch_size: int = 1,
+        retry_policies: Dict[str, RetryPolicy] | None = None,
+        rate_limiter: RateLimiter | None = None,
+    ):
+        """
+        :param concurrency: max requests in flight
+        :param batch_size: max requests in a json rpc batch of send_many, 1 means no batch
+        :param retry_policies: retry policies of error classes, default is DEFAULT_RETRY_POLICIES, {} means no retry
+        :param rate_limiter: limiter shared by all tasks, it can be shared with other clients
+        """
+        try:
+            import aiohttp
+        except ImportError:
+            raise RuntimeError("aiohttp is required by async client, install it by pip install demeter-fetch[async]")
+        self._aiohttp = aiohttp
+        self.endpoint = endpoint
+        self.proxy = proxy if proxy else None
+        self.headers = {"Authorization": auth} if auth else {}
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.retry_policies = retry_policies if retry_policies is not None else DEFAULT_RETRY_POLICIES
+        self.rate_limiter = rate_limiter
+        self._session = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="rpc-client", daemon=True)
+        self._thread.start()
+        self._run(self._open())
+
+    async def _open(self):
+        connector = self._aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+        self._session = self._aiohttp.ClientSession(
+            connector=connector, headers=self.headers, timeout=self._aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+        )
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def _post_once_async(self, payload):
+        async with self._semaphore:
+            try:
+                async with self._session.post(self.endpoint, json=payload, proxy=self.proxy) as response:
+                    if response.status != 200:
+                        raise RpcHttpError(response.status, response.headers.get("Retry-After"))
+                    content = json_loads(await response.read())
+            except TimeoutError:  # some timeout errors of aiohttp are connection errors too
+                raise
+            except self._aiohttp.ClientConnectionError as e:
+                raise ConnectionError(str(e)) from e
+        return content if isinstance(payload, list) else _decode_json_rpc(content)
+
+    async def _post_async(self, commend: str, payload, count: int = 1):
+        """
+        Post with rate limit, and retry by policies if failed. Waiting won't block other tasks.
+        """
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                await asyncio.sleep(self.rate_limiter.reserve(commend, count))
+            try:
+                return await self._post_once_async(payload)
+            except Exception as e:
+                delay = get_retry_delay(self.retry_policies, e, attempt, commend)
+                if delay is None:
+                    raise e
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def send_async(self, commend: str, params: List):
+        return await self._post_async(commend, _encode_json_rpc(commend, params))
+
+    async def _send_batch_async(self, commend: str, items: List[Tuple[int, List]], return_exceptions: bool) -> Dict:
+        results = {}
+        try:
+            if len(items) == 1:
+                results[items[0][0]] = await self.send_async(commend, items[0][1])
+                return results
+            attempt = 0
+            while True:
+                content = await self._post_async(commend, _encode_batch(commend, items), len(items))
+                errors = _decode_batch(content, items, results)
+                items, delay, given_up = _split_failed_items(self.retry_policies, commend, items, errors, attempt)
+                if len(given_up) > 0:
+                    if not return_exceptions:
+                        raise next(iter(given_up.values()))
+                    results.update(given_up)
+                if len(items) < 1:
+                    return results
+                await asyncio.sleep(delay)
+                attempt += 1
+        except Exception as e:
+            if not return_exceptions:
+                raise e
+            results.update({index: e for index, params in items})
+            return results
+
+    async def _send_many_async(
+        self, commend: str, params_list: List[List], concurrency: int | None, return_exceptions: bool
+    ):
+        batches = _split_batches(params_list, self.batch_size)
+        call_semaphore = asyncio.Semaphore(concurrency) if concurrency is not None else None
+
+        async def send_batch(batch):
+            if call_semaphore is None:
+                return await self._send_batch_async(commend, batch, return_exceptions)
+            async with call_semaphore:
+                return await self._send_batch_async(commend, batch, return_exceptions)
+
+        results = {}
+        for batch_result in await asyncio.gather(*[send_batch(b) for b in batches]):
+            results.update(batch_result)
+        return [results[i] for i in range(len(params_list))]
 
     def send(self, commend: str, params: List):
-        response = self.do_post(EthRpcClient.__encode_json_rpc(commend, params))
-        if response.status_code!=200:
-            raise RuntimeError("Request rpc return error with code {}".format(response.status_code))
-        return EthRpcClient.__decode_json_rpc(response)
+        return self._run(self.send_async(commend, params))
+
+    def send_many(
+        self, commend: str, params_list: List[List], concurrency: int | None = None, return_exceptions: bool = False
+    ) -> List:
+        if len(params_list) < 1:
+            return []
+        return list(self._run(self._send_many_async(commend, params_list, concurrency, return_exceptions)))
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+        self._run(self._session.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
 
 
 class HeightCacheManager:
     """
-    高度缓存
+    高度缓存, block timestamps of a chain are saved in a sqlite table in save path.
+
+    Rows are only appended, and heights are looked up by primary key, so the cache is not loaded into memory.
+    New timestamps are kept in memory until save() is called.
+    Height ranges of finished days are saved in another table, they are written at once.
+    Database is in WAL mode, so processes can read and write it at the same time.
+    Cache of former versions(a pickled dict) will be imported when it's found.
+    If save path doesn't exist, e.g. when planning a download, the cache is kept in memory and nothing is saved.
     """
 
-    height_cache_file_name = "_height_timestamp.pkl"
+    height_cache_file_name = "_height_timestamp.db"
+    legacy_file_name = "_height_timestamp.pkl"
+    query_chunk_size = 500  # heights in a query, sqlite limits count of parameters
 
     def __init__(self, chain: ChainType, save_path: str):
         self.height_cache_path = os.path.join(save_path, chain.value + HeightCacheManager.height_cache_file_name)
-        if os.path.exists(self.height_cache_path):
-            with open(self.height_cache_path, "rb") as f:
-                self.block_dict = pickle.load(f)
-                utils.print_log(f"Height cache has loaded, length: {len(self.block_dict)}")
-        else:
-            self.block_dict: Dict[int, datetime] = {}
-            utils.print_log("Can not find a height cache, will generate one")
+        self._lock = threading.Lock()
+        self._pending: Dict[int, int] = {}  # timestamps which haven't been saved
+        database = self.height_cache_path if os.path.isdir(save_path) else ":memory:"
+        self._conn = sqlite3.connect(database, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS block_time (height INTEGER PRIMARY KEY, timestamp INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS day_height (day TEXT PRIMARY KEY, start_height INTEGER, end_height INTEGER)"
+        )
+        self._conn.commit()
+        legacy_path = os.path.join(save_path, chain.value + HeightCacheManager.legacy_file_name)
+        if os.path.exists(legacy_path):
+            self._import_legacy(legacy_path)
 
-    def has(self, height: int):
-        return height in self.block_dict
+    def _import_legacy(self, legacy_path: str):
+        with open(legacy_path, "rb") as f:
+            block_dict: Dict[int, datetime] = pickle.load(f)
+        self._write({height: int(dt.timestamp()) for height, dt in block_dict.items()})
+        try:
+            os.remove(legacy_path)
+        except FileNotFoundError:  # imported by another process
+            pass
+        utils.print_log(f"Height cache has been imported from {legacy_path}, length: {len(block_dict)}")
 
-    def get(self, height: int):
-        if height in self.block_dict:
-            return self.block_dict[height]
-        else:
-            return None
+    def _write(self, timestamps: Dict[int, int]):
+        with self._lock:
+            with self._conn:
+                self._conn.executemany("INSERT OR IGNORE INTO block_time VALUES (?, ?)", timestamps.items())
+
+    def get_timestamps(self, heights: Iterable[int]) -> Dict[int, int]:
+        """
+        :return: unix timestamps of heights which are in cache
+        """
+        heights = heights if isinstance(heights, (range, set)) else set(heights)
+        if len(heights) < 1:
+            return {}
+        with self._lock:
+            if isinstance(heights, range):  # a range is scanned, other heights are looked up one by one
+                rows = self._conn.execute(
+                    "SELECT height, timestamp FROM block_time WHERE height BETWEEN ? AND ?",
+                    (min(heights), max(heights)),
+                ).fetchall()
+            else:
+                rows = []
+                sorted_heights = sorted(heights)
+                for i in range(0, len(sorted_heights), HeightCacheManager.query_chunk_size):
+                    chunk = sorted_heights[i : i + HeightCacheManager.query_chunk_size]
+                    rows.extend(
+                        self._conn.execute(
+                            f"SELECT height, timestamp FROM block_time WHERE height IN ({','.join('?' * len(chunk))})",
+                            chunk,
+                        ).fetchall()
+                    )
+            result = {h: t for h, t in rows if h in heights}
+            if len(self._pending) > len(heights):
+                result.update({h: self._pending[h] for h in heights if h in self._pending})
+            else:
+                result.update({h: t for h, t in self._pending.items() if h in heights})
+        return result
+
+    def set_timestamps(self, timestamps: Dict[int, int]):
+        with self._lock:
+            self._pending.update(timestamps)
+
+    def get_day_heights(self, days: Iterable[date]) -> Dict[date, Tuple[int, int]]:
+        """
+        :return: height range of days which are in cache
+        """
+        days = set(days)
+        if len(days) < 1:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT day, start_height, end_height FROM day_height WHERE day BETWEEN ? AND ?",
+                (min(days).isoformat(), max(days).isoformat()),
+            ).fetchall()
+        result = {date.fromisoformat(d): (start, end) for d, start, end in rows}
+        return {d: heights for d, heights in result.items() if d in days}
+
+    def set_day_heights(self, day_heights: Dict[date, Tuple[int, int]]):
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO day_height VALUES (?, ?, ?)",
+                    [(d.isoformat(), start, end) for d, (start, end) in day_heights.items()],
+                )
+
+    def has(self, height: int) -> bool:
+        return height in self.get_timestamps([height])
+
+    def get(self, height: int) -> datetime | None:
+        timestamp = self.get_timestamps([height]).get(height)
+        return None if timestamp is None else datetime.fromtimestamp(timestamp, UTC)
 
     def set(self, height: int, timestamp: datetime):
-        self.block_dict[height] = timestamp
+        self.set_timestamps({height: int(timestamp.timestamp())})
 
     def save(self):
-        with open(self.height_cache_path, "wb") as f:
-            pickle.dump(self.block_dict, f)
-        # utils.print_log(f"Save block timestamp cache to {self.height_cache_path}, length: {len(self.block_dict)}")
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if len(pending) > 0:
+            self._write(pending)
+
+    def close(self):
+        self.save()
+        self._conn.close()
+
+
+_height_caches: Dict[Tuple, HeightCacheManager] = {}
+_height_caches_lock = threading.Lock()
+
+
+def get_height_cache(chain: ChainType, save_path: str) -> HeightCacheManager:
+    """
+    Get height cache of a chain in save path, it's shared by nodes in the same process.
+    """
+    key = (os.getpid(), chain, os.path.abspath(save_path))  # connections can not be shared with child processes
+    with _height_caches_lock:
+        if key not in _height_caches:
+            _height_caches[key] = HeightCacheManager(chain, save_path)
+        return _height_caches[key]
+
+
+# errors which can be resolved by querying fewer blocks, e.g. "query returned more than 10000 results"
+LOG_RANGE_ERROR_KEYWORDS = [
+    "more than",  # query returned more than 10000 results
+    "too many results",
+    "too many logs",
+    "too many blocks",
+    "exceeds max results",
+    "response size",  # log response size exceeded
+    "limited to",  # eth_getLogs is limited to a 10,000 range
+    "block range",  # block range is too wide, exceed maximum block range
+    "range too large",
+    "max range",
+    "query timeout",
+    "timed out",
+]
+
+
+def is_log_range_error(e: Exception) -> bool:
+    """
+    If eth_getLogs failed because there are too many logs in block range, or it takes too long.
+    Rate limit errors are not, or block range would shrink because provider is busy.
+    """
+    if classify_error(e) == "rate_limit":
+        return False
+    if isinstance(e, (requests.exceptions.Timeout, TimeoutError)):
+        return True
+    if isinstance(e, RpcHttpError) and e.status in [413, 502, 503, 504]:
+        return True
+    if isinstance(e, EthError):
+        return any(k in str(e.message).lower() for k in LOG_RANGE_ERROR_KEYWORDS)
+    return False
+
+
+class LogRangeSizer:
+    """
+    Block range of eth_getLogs requests of every contract.
+    Range grows while responses are small, and is halved if provider complains about too many results or timeout.
+    After a failure, range of the contract won't grow to the failed range again in this instance.
+    Learned ranges are saved to a json file in save path, so the next run can start with them.
+    """
+
+    log_range_file_name = "_log_range.json"
+    target_logs = 2000  # range stops growing if a response has more logs than half of this
+    max_growth = 4  # range grows at most 4 times of a request, if the response has very few logs
+
+    def __init__(self, chain: ChainType, save_path: str, initial_size: int = 500, max_size: int = 100000):
+        self.path = os.path.join(save_path, chain.value + LogRangeSizer.log_range_file_name)
+        self.initial_size = initial_size
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._sizes: Dict[str, int] = LogRangeSizer._load(self.path)
+        self._changed = set()
+        self._ceilings: Dict[str, int] = {}  # ranges must be less than failed ranges
+
+    @staticmethod
+    def _load(path: str) -> Dict[str, int]:
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except ValueError:
+            return {}
 
+    def get(self, address: str) -> int:
+        with self._lock:
+            return self._sizes.get(address.lower(), self.initial_size)
 
-def _query_tx_receipt(param):
-    tx_hash, client = param
-    resp = client.get_tx_receipt(tx_hash)
-    return resp
+    def _set(self, address: str, size: int):
+        size = min(size, self.max_size, self._ceilings.get(address.lower(), self.max_size + 1) - 1)
+        self._sizes[address.lower()] = max(size, 1)
+        self._changed.add(address.lower())
 
+    def on_success(self, address: str, blocks: int, log_count: int):
+        """
+        :param blocks: block count of the request
+        :param log_count: log count of the response
+        """
+        with self._lock:
+            size = self._sizes.get(address.lower(), self.initial_size)
+            if log_count > LogRangeSizer.target_logs:
+                self._set(address, min(size, blocks // 2))
+            elif log_count <= LogRangeSizer.target_logs // 2:
+                growth = min(LogRangeSizer.max_growth, LogRangeSizer.target_logs / 2 / max(log_count, 1))
+                if blocks * growth > size:
+                    self._set(address, int(blocks * growth))
+
+    def on_error(self, address: str, blocks: int):
+        with self._lock:
+            size = self._sizes.get(address.lower(), self.initial_size)
+            self._ceilings[address.lower()] = min(self._ceilings.get(address.lower(), blocks), blocks)
+            self._set(address, min(size, blocks // 2))
 
-def _query_tx(param):
-    tx_hash, client = param
-    resp = client.get_tx(tx_hash)
-    return resp
+    def save(self):
+        """
+        Save ranges changed by this instance, ranges of other contracts in file are kept.
+        """
+        with self._lock:
+            if len(self._changed) < 1:
+                return
+            sizes = LogRangeSizer._load(self.path)
+            sizes.update({address: self._sizes[address] for address in self._changed})
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(sizes, f, indent=2)
+            os.replace(tmp_path, self.path)
 
 
-def query_tx(client: EthRpcClient, tx_list: pd.Series, threads=10) -> pd.DataFrame:
-    param_list = [(tx_hash, client) for tx_hash in tx_list]
-    with ThreadPoolExecutor(max_workers=threads) as executor:
-        txes = list(tqdm(executor.map(_query_tx, param_list), ncols=60, position=1, leave=False, total=len(tx_list)))
+def query_tx(client: BaseRpcClient, tx_list: pd.Series, threads: int | None = None) -> pd.DataFrame:
+    """
+    :param threads: max requests in flight, default is concurrency of client
+    """
+    txes = client.send_many("eth_getTransactionByHash", [[tx_hash] for tx_hash in tx_list], threads)
 
     tx_list = []
     for tx in txes:
@@ -187,12 +866,11 @@ def query_tx(client: EthRpcClient, tx_list: pd.Series, threads=10) -> pd.DataFra
     return df
 
 
-def query_event_by_tx(client: EthRpcClient, tx_list: pd.Series, threads=10) -> pd.DataFrame:
-    param_list = [(tx_hash, client) for tx_hash in tx_list]
-    with ThreadPoolExecutor(max_workers=threads) as executor:
-        tx_receipts = list(
-            tqdm(executor.map(_query_tx_receipt, param_list), ncols=60, position=1, leave=False, total=len(tx_list))
-        )
+def query_event_by_tx(client: BaseRpcClient, tx_list: pd.Series, threads: int | None = None) -> pd.DataFrame:
+    """
+    :param threads: max requests in flight, default is concurrency of client
+    """
+    tx_receipts = client.send_many("eth_getTransactionReceipt", [[tx_hash] for tx_hash in tx_list], threads)
 
     logs_list = []
     for tx in tx_receipts:
@@ -216,9 +894,63 @@ def query_event_by_tx(client: EthRpcClient, tx_list: pd.Series, threads=10) -> p
     return df
 
 
+def _hex_to_int_array(values: List[str]) -> np.ndarray:
+    return np.fromiter((int(v, 16) for v in values), dtype=np.int64, count=len(values))
+
+
+def logs_to_frame(logs: List[Dict], contract_config: ContractConfig) -> pd.DataFrame:
+    """
+    Keep logs of contract and topics, and convert them to a dataframe, which is saved to temporary files.
+    Dataframe is built column by column, instead of converting every log to a dict.
+    """
+    topics = set(contract_config.topics)
+    addresses = set(contract_config.addresses)
+    logs = [
+        log
+        for log in logs
+        if len(log["topics"]) > 0
+        and log["topics"][0] in topics
+        and not log.get("removed", False)
+        and log["address"].lower() in addresses
+    ]
+    return pd.DataFrame(
+        {
+            "block_number": _hex_to_int_array([log["blockNumber"] for log in logs]),
+            "transaction_hash": [log["transactionHash"] for log in logs],
+            "transaction_index": _hex_to_int_array([log["transactionIndex"] for log in logs]),
+            "log_index": _hex_to_int_array([log["logIndex"] for log in logs]),
+            "address": [log["address"].lower() for log in logs],
+            "data": [log["data"] for log in logs],
+            "topics": [log["topics"] for log in logs],
+        }
+    )
+
+
+def _sort_logs(df: pd.DataFrame) -> pd.DataFrame:
+    return df.sort_values(["block_number", "transaction_index", "log_index"], kind="stable", ignore_index=True)
+
+
+def query_contract_event_by_tx(
+    client: BaseRpcClient, tx_list: List[str], contract_config: ContractConfig, threads: int | None = None
+) -> pd.DataFrame:
+    """
+    Get logs of a contract from receipts of transactions, columns are the same as temporary files of
+    query_event_by_height, but without block timestamp.
+
+    :param threads: max requests in flight, default is concurrency of client
+    """
+    tx_receipts = client.send_many("eth_getTransactionReceipt", [[tx_hash] for tx_hash in tx_list], threads)
+    logs = []
+    for tx_hash, tx in zip(tx_list, tx_receipts):
+        if tx is None:
+            raise RuntimeError(f"Receipt of transaction {tx_hash} is not found")
+        logs.extend(tx["logs"])
+    return _sort_logs(logs_to_frame(logs, contract_config))
+
+
 def query_event_by_height(
     chain: ChainType,
-    client: EthRpcClient,
+    client: BaseRpcClient,
     contract_config: ContractConfig,
     start_height: int,
     end_height: int,
@@ -228,6 +960,8 @@ def query_event_by_height(
     batch_size: int = 500,
     one_by_one: bool = False,
     skip_timestamp: bool = False,
+    range_sizer: LogRangeSizer = None,
+    interpolate_timestamp: bool = False,
 ) -> List[str]:
     """
     根据输入参数, 下载对应高度的log,
@@ -241,133 +975,378 @@ def query_event_by_height(
     :param height_cache: 高度-时间戳 缓存的路径
     :param save_path: 临时文件保存路径
     :param save_every_query: 多少次查询会保存一次临时文件. save_every_query * batch_size = 临时文件里的数据条数.
-    :param batch_size: 一次下载多少个block的log
-    :param one_by_one: 逐个下载每一个topic, 还是下载所有的topic再筛选掉不需要的.
+    :param batch_size: 一次下载多少个block的log, it's the initial block range of eth_getLogs,
+        range will be adjusted by range_sizer later, but blocks of a temporary file are always batch_size * save_every_query
+    :param one_by_one: 逐个下载每一个topic, 还是在一次请求中下载所有的topic(由节点筛选).
     :param skip_timestamp: skip query block timestamp
+    :param range_sizer: learned block ranges of eth_getLogs
+    :param interpolate_timestamp: compute timestamps of blocks in consecutive slots instead of querying them
     :return: 临时文件的文件名
     :rtype:
     """
 
-    collect_dt, logs_to_save, collect_start = None, [], None  # collect date, date log by day，collect start time
     tmp_file_full_path_list = []
     if not height_cache:
-        height_cache = HeightCacheManager(chain, save_path)
-    batch_count = start_blk = end_blk = 0
-    skip_until = -1
-    utils.print_log(f"Querying {contract_config.address} from {start_height} to {end_height}")
+        height_cache = get_height_cache(chain, save_path)
+    if not range_sizer:
+        range_sizer = LogRangeSizer(chain, save_path, batch_size)
+    file_blocks = batch_size * save_every_query
+    utils.print_log(f"Querying {contract_config.name} from {start_height} to {end_height}")
     with tqdm(total=(end_height - start_height + 1), ncols=60, position=1, leave=False) as pbar:
-        for height_slice in _cut([i for i in range(start_height, end_height + 1)], batch_size):
-            start = height_slice[0]
-            end = height_slice[-1]
-            if end <= skip_until:
-                batch_count += 1
-                pbar.update(n=len(height_slice))
-                continue
-            if batch_count % save_every_query == 0:
-                start_blk = start
-                tmp_end_blk = start + batch_size * save_every_query - 1
-                if tmp_end_blk >= end_height:
-                    tmp_end_blk = end_height
-                # 下载之前检测文件是否已经存在, 如果存在跳过下载
-                tmp_file_path = get_tmp_file_path(save_path, start_blk, tmp_end_blk, chain, contract_config.address)
-                if os.path.exists(tmp_file_path):
-                    skip_until = tmp_end_blk
-                    batch_count += 1
-                    pbar.update(n=len(height_slice))
-                    tmp_file_full_path_list.append(tmp_file_path)
-                    continue
+        for start_blk, end_blk in _iter_height_ranges(start_height, end_height, file_blocks):
             # 下载之前检测文件是否已经存在, 如果存在跳过下载
+            tmp_file_path = find_logs_file(
+                get_tmp_file_path(save_path, start_blk, end_blk, chain, contract_config.name)
+            )
+            if tmp_file_path is not None:
+                tmp_file_full_path_list.append(tmp_file_path)
+                pbar.update(n=end_blk - start_blk + 1)
+                continue
 
-            if one_by_one:
-                logs = []
-                for topic_hex in contract_config.topics:
-                    tmp_logs = client.get_logs(GetLogsParam(contract_config.address, start, end, [topic_hex]))
-                    logs.extend(tmp_logs)
-            else:
-                logs = client.get_logs(GetLogsParam(contract_config.address, start, end, None))
-            log_list = []
-            for log in logs:
-                log["blockNumber"] = int(log["blockNumber"], 16)
-                if len(log["topics"]) > 0 and (log["topics"][0] in contract_config.topics):
-                    if log["removed"]:
-                        continue
-                    # block_number, block_timestamp, transaction_hash, transaction_index, log_index, topics, data
-                    log_list.append(
-                        {
-                            "block_number": log["blockNumber"],
-                            "transaction_hash": log["transactionHash"],
-                            "transaction_index": log["transactionIndex"],
-                            "log_index": log["logIndex"],
-                            "data": log["data"],
-                            "topics": log["topics"],
-                        }
-                    )
-            for log in log_list:
-                log["log_index"] = int(log["log_index"], 16)
-                log["transaction_index"] = int(log["transaction_index"], 16)
-            if skip_timestamp:
-                logs_to_save.extend(log_list)
-            else:
-                with ThreadPoolExecutor(max_workers=10) as t:
-                    obj_lst = []
-                    for data in log_list:
-                        obj = t.submit(_fill_block_info, data, client, height_cache)
-                        obj_lst.append(obj)
-                    for future in as_completed(obj_lst):
-                        data = future.result()
-                        logs_to_save.append(data)
-
-            # if got enough blocks, save file
-            batch_count += 1
-            if batch_count % save_every_query == 0:
-                # save tmp file
-                logs_to_save = sorted(logs_to_save, key=itemgetter("block_number", "transaction_index", "log_index"))
-                end_blk = end
-                tmp_file_full_path_list.append(
-                    save_tmp_file(save_path, logs_to_save, start_blk, end_blk, chain, contract_config.address)
-                )
-                logs_to_save = []
-            pbar.update(n=len(height_slice))
-    if batch_count % save_every_query != 0 and skip_until < end:  # save tail queries
-        logs_to_save = sorted(logs_to_save, key=itemgetter("block_number", "transaction_index", "log_index"))
-        end_blk = end
-        tmp_file_full_path_list.append(
-            save_tmp_file(save_path, logs_to_save, start_blk, end_blk, chain, contract_config.address)
-        )
+            logs = _query_logs_adaptive(client, contract_config, start_blk, end_blk, range_sizer, one_by_one)
+
+            log_df = logs_to_frame(logs, contract_config)
+            if not skip_timestamp:
+                _fill_block_info(log_df, client, height_cache, chain, interpolate_timestamp)
+            log_df = _sort_logs(log_df)
+            tmp_file_full_path_list.append(
+                save_tmp_file(save_path, log_df, start_blk, end_blk, chain, contract_config.name)
+            )
+            pbar.update(n=end_blk - start_blk + 1)
     height_cache.save()
+    range_sizer.save()
     return tmp_file_full_path_list
 
 
-def load_tmp_file(full_path) -> List:
+def _query_logs_adaptive(
+    client: BaseRpcClient,
+    contract_config: ContractConfig,
+    start_height: int,
+    end_height: int,
+    range_sizer: LogRangeSizer,
+    one_by_one: bool,
+) -> List[Dict]:
+    """
+    Query logs between heights, with block ranges from range_sizer. Requests of a round are sent at the same time,
+    a round has as many ranges as concurrency of client, so ranges of later rounds can grow.
+    If a request failed because of too many logs or timeout, its range is cut in half and queried in the next round.
+    Topics are filtered by node, all topics are sent in one request unless one_by_one is set.
+    """
+    name = contract_config.name
+    address = contract_config.address
+    topics_list = [[t] for t in contract_config.topics] if one_by_one else [[contract_config.topics]]
+    round_size = max(client.concurrency, 1) * len(topics_list)
+    next_height = start_height
+    pending = []
+    logs = []
+    while len(pending) > 0 or next_height <= end_height:
+        size = range_sizer.get(name)
+        while next_height <= end_height and len(pending) < round_size:
+            to_height = min(next_height + size - 1, end_height)
+            pending.extend(GetLogsParam(address, next_height, to_height, topics) for topics in topics_list)
+            next_height = to_height + 1
+        results = client.send_many("eth_getLogs", [[get_logs_param(p)] for p in pending], return_exceptions=True)
+        failed = []
+        for param, result in zip(pending, results):
+            blocks = param.toBlock - param.fromBlock + 1
+            if not isinstance(result, Exception):
+                range_sizer.on_success(name, blocks, len(result))
+                logs.extend(result)
+            elif is_log_range_error(result) and blocks > 1:
+                range_sizer.on_error(name, blocks)
+                middle = param.fromBlock + blocks // 2
+                failed.append(GetLogsParam(address, param.fromBlock, middle - 1, param.topics))
+                failed.append(GetLogsParam(address, middle, param.toBlock, param.topics))
+            else:
+                raise result
+        pending = failed
+    return logs
+
+
+def estimate_event_by_height(
+    chain: ChainType,
+    contract_config: ContractConfig,
+    start_height: int,
+    end_height: int,
+    height_cache: HeightCacheManager,
+    save_path: str = "./",
+    save_every_query: int = 10,
+    batch_size: int = 500,
+    one_by_one: bool = False,
+    skip_timestamp: bool = False,
+) -> Tuple[int, int]:
+    """
+    Estimate requests of query_event_by_height without sending them, parameters are the same as query_event_by_height.
+    Heights whose temporary file has existed will be skipped.
+
+    :return: count of eth_getLogs calls, max count of block timestamp lookups.
+        Only blocks with logs need a timestamp, so the real lookup count is usually far less
+    """
+    get_logs_count = timestamp_count = 0
+    file_blocks = batch_size * save_every_query
+    range_size = LogRangeSizer(chain, save_path, batch_size).get(contract_config.name)
+    for start_blk, end_blk in _iter_height_ranges(start_height, end_height, file_blocks):
+        if find_logs_file(get_tmp_file_path(save_path, start_blk, end_blk, chain, contract_config.name)) is not None:
+            continue
+        query_count = math.ceil((end_blk - start_blk + 1) / range_size)
+        get_logs_count += query_count * len(contract_config.topics) if one_by_one else query_count
+        if not skip_timestamp:
+            heights = range(start_blk, end_blk + 1)
+            timestamp_count += len(heights) - len(height_cache.get_timestamps(heights))
+    return get_logs_count, timestamp_count
+
+
+# Logs in temporary files are saved in Arrow IPC files if pyarrow is installed, otherwise they are pickled dataframes
+LOGS_FILE_EXT = ".arrow" if pa is not None else ".pkl"
+LOGS_SCHEMA = (
+    pa.schema(
+        [
+            ("block_number", pa.int64()),
+            ("transaction_hash", pa.string()),
+            ("transaction_index", pa.int64()),
+            ("log_index", pa.int64()),
+            ("address", pa.string()),
+            ("data", pa.string()),
+            ("topics", pa.list_(pa.string())),
+            ("block_timestamp", pa.string()),  # only if timestamps are queried
+        ]
+    )
+    if pa is not None
+    else None
+)
+
+
+def find_logs_file(path: str) -> str | None:
+    """
+    Find a logs file, it might be saved in the other format, e.g. by a former run without pyarrow
+
+    :return: path of existing file, None if not found
+    """
+    base = path.removesuffix(LOGS_FILE_EXT)
+    for file_path in [path] + [base + ext for ext in (".pkl", ".arrow") if ext != LOGS_FILE_EXT]:
+        if os.path.exists(file_path):
+            return file_path
+    return None
+
+
+def save_logs_file(path: str, logs: pd.DataFrame):
+    """
+    Save logs of query_event_by_height, path should end with LOGS_FILE_EXT.
+    Logs are written to a temporary file and then renamed, so a broken file won't be found when resuming.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if not isinstance(logs, pd.DataFrame):
+        logs = pd.DataFrame(logs)
+    if pa is not None:
+        schema = LOGS_SCHEMA if "block_timestamp" in logs.columns else LOGS_SCHEMA.remove(len(LOGS_SCHEMA) - 1)
+        if len(logs.index) < 1:  # dtypes of empty columns can't be converted
+            table = schema.empty_table()
+        else:
+            table = pa.Table.from_pandas(logs.reindex(columns=schema.names), schema=schema, preserve_index=False)
+        feather.write_feather(table, tmp_path, compression="uncompressed")  # uncompressed files can be memory mapped
+    else:
+        with open(tmp_path, "wb") as f:
+            pickle.dump(logs, f)
+    os.replace(tmp_path, path)
+
+
+def _load_logs_table(path: str):
+    return feather.read_table(path, memory_map=True)
+
+
+def _table_to_df(table) -> pd.DataFrame:
+    # lists of arrow are converted to numpy arrays by to_pandas, and to_pylist is faster than converting them back
+    df = table.drop_columns(["topics"]).to_pandas()
+    df.insert(table.column_names.index("topics"), "topics", table.column("topics").to_pylist())
+    return df
+
+
+def load_tmp_file(full_path) -> pd.DataFrame:
+    if full_path.endswith(".arrow"):
+        return _table_to_df(_load_logs_table(full_path))
     with open(full_path, "rb") as f:
         data = pickle.load(f)
+    if isinstance(data, list):  # saved by former versions, logs are dicts
+        data = pd.DataFrame(data)
     return data
 
 
+def load_tmp_files(paths: List[str]) -> Iterator[pd.DataFrame]:
+    """
+    Load logs of temporary files lazily, a file is loaded when the former one has been taken.
+    Arrow files are memory mapped and concatenated without copy,
+    and converted to one dataframe at last, so only the final dataframe is allocated.
+    """
+    if len(paths) < 1 or not all(p.endswith(".arrow") for p in paths):
+        for p in paths:
+            yield load_tmp_file(p)
+        return
+    tables = [_load_logs_table(p) for p in paths]
+    if len({tuple(t.column_names) for t in tables}) > 1:  # files with and without timestamp
+        tables = [t.select(LOGS_SCHEMA.names[:-1]) for t in tables]
+    yield _table_to_df(pa.concat_tables(tables))
+
+
 def get_tmp_file_path(save_path, start, end, chain, address):
-    return os.path.join(save_path, f"{chain.name}-{address}-{start}-{end}.tmp.pkl")
+    return os.path.join(save_path, f"{chain.name}-{address}-{start}-{end}.tmp{LOGS_FILE_EXT}")
 
 
 def save_tmp_file(save_path, logs, start, end, chain, address):
     file_path = get_tmp_file_path(save_path, start, end, chain, address)
-    with open(file_path, "wb") as f:
-        pickle.dump(logs, f)
+    save_logs_file(file_path, logs)
     return file_path
 
 
-def _cut(obj, sec):
-    return [obj[i : i + sec] for i in range(0, len(obj), sec)]
+def _iter_height_ranges(start_height: int, end_height: int, size: int) -> Iterator[Tuple[int, int]]:
+    """
+    Split heights into ranges of size blocks lazily, both ends are included, and the last range might be shorter.
+    Ranges only depend on arguments, so temporary files of former runs are found again.
+    """
+    for start in range(start_height, end_height + 1, size):
+        yield start, min(start + size - 1, end_height)
+
+
+def _query_timestamps(client: BaseRpcClient, heights: List[int]) -> Dict[int, int]:
+    blocks = client.send_many("eth_getBlockByNumber", [[hex(h), False] for h in heights])
+    return {height: int(block["timestamp"], 16) for height, block in zip(heights, blocks)}
+
+
+def interpolate_timestamps(client: BaseRpcClient, heights: List[int], chain: ChainType) -> Dict[int, int]:
+    """
+    Get timestamps of sorted heights with fewer queries, on chains whose blocks are produced in fixed slots.
+
+    A block can only skip slots, so if timestamps of two blocks differ by exactly distance * slot seconds,
+    every block between them is in consecutive slots, and their timestamps can be computed.
+    Otherwise a slot is skipped between them, the middle height is queried, and both halves are checked again.
+    Heights before slots start, and heights of other chains, are queried one by one.
 
+    :return: timestamps of heights
+    """
+    interval = ChainTypeConfig[chain].get("block_interval")
+    since = ChainTypeConfig[chain].get("block_interval_since", 0)
+    if interval is None:
+        return _query_timestamps(client, heights)
+    timestamps = _query_timestamps(client, [h for h in heights if h < since])
+    slot_heights = [h for h in heights if h >= since]
+    if len(slot_heights) < 1:
+        return timestamps
+    timestamps.update(_query_timestamps(client, sorted({slot_heights[0], slot_heights[-1]})))
+    segments = [(0, len(slot_heights) - 1)]  # index of heights, timestamps of both ends are known
+    while len(segments) > 0:
+        to_query, next_segments = [], []
+        for i, j in segments:
+            if j - i < 2:
+                continue
+            start, end = slot_heights[i], slot_heights[j]
+            if timestamps[end] - timestamps[start] == (end - start) * interval:
+                for height in slot_heights[i + 1 : j]:
+                    timestamps[height] = timestamps[start] + (height - start) * interval
+            else:
+                middle = (i + j) // 2
+                to_query.append(slot_heights[middle])
+                next_segments.extend([(i, middle), (middle, j)])
+        timestamps.update(_query_timestamps(client, to_query))  # queries of a round are sent together
+        segments = next_segments
+    return timestamps
 
-def _fill_block_info(log, client: EthRpcClient, block_dict: HeightCacheManager):
-    height = log["block_number"]
-    if not block_dict.has(height):
-        block_dt = client.get_block_timestamp(height)
-        block_dict.set(height, block_dt)
-    log["block_timestamp"] = block_dict.get(height).astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-    log["block_dt"] = block_dict.get(height)
 
-    return log
+def _first_heights_at(
+    client: BaseRpcClient, targets: List[int], height_cache: HeightCacheManager
+) -> Tuple[Dict[int, int], int]:
+    """
+    Search first block whose timestamp is not before each target timestamp, all targets are searched together,
+    so every queried block narrows the range of all targets.
+
+    Each round guesses the height by interpolating timestamps of the known blocks around a target, and queries the
+    guess and the block before it, so a right guess finishes the search. If a guess doesn't halve the range,
+    the next guess is the middle. Blocks are looked up in height cache before querying.
+
+    :return: first height of each target, and the latest height. A target after the latest block gets latest + 1
+    """
+    latest = int(client.send("eth_blockNumber", []), 16)
+
+    def get_timestamps(heights: Iterable[int]) -> Dict[int, int]:
+        heights = set(heights)
+        timestamps = height_cache.get_timestamps(heights)
+        new_timestamps = _query_timestamps(client, sorted(h for h in heights if h not in timestamps))
+        height_cache.set_timestamps(new_timestamps)
+        timestamps.update(new_timestamps)
+        return timestamps
+
+    known = get_timestamps([0, latest])
+    widths = {target: math.inf for target in targets}  # width of search range in the last round
+    while True:
+        heights = sorted(known.keys())
+        stamps = [known[h] for h in heights]  # timestamps are not decreasing with height
+        result, guesses = {}, set()
+        for target in targets:
+            i = bisect.bisect_left(stamps, target)
+            low = heights[i - 1] if i > 0 else -1
+            high = heights[i] if i < len(heights) else latest + 1
+            if high - low <= 1:
+                result[target] = high
+                continue
+            if (high - low) * 2 > widths[target]:
+                guess = (low + high) // 2
+            else:
+                span = known[high] - known[low]
+                guess = low + math.ceil((target - known[low]) * (high - low) / span) if span > 0 else (low + high) // 2
+                guess = min(max(guess, low + 1), high - 1)
+            widths[target] = high - low
+            guesses.update(h for h in (guess - 1, guess) if low < h < high)
+        if len(guesses) < 1:
+            return result, latest
+        known.update(get_timestamps(guesses))  # guesses of a round are sent together
+
+
+def resolve_day_heights(
+    client: BaseRpcClient, days: List[date], height_cache: HeightCacheManager
+) -> Dict[date, Tuple[int, int]]:
+    """
+    Find height range of days by searching block timestamps, instead of querying etherscan.
+    Boundaries of all days are searched in one pass, and ranges of finished days are saved in height cache.
+    End of a day which is not finished is the latest height.
+
+    :return: height range of days, both ends are included
+    """
+    days = sorted(set(days))
+    boundaries = sorted(set(days) | {d + timedelta(days=1) for d in days})
+    targets = {d: int(datetime.combine(d, datetime.min.time(), tzinfo=UTC).timestamp()) for d in boundaries}
+    first_heights, latest = _first_heights_at(client, list(targets.values()), height_cache)
+    height_cache.save()
+    result, finished = {}, {}
+    for day in days:
+        end = first_heights[targets[day + timedelta(days=1)]] - 1
+        result[day] = (first_heights[targets[day]], end)
+        if end < latest:
+            finished[day] = result[day]
+    height_cache.set_day_heights(finished)
+    return result
+
+
+def _fill_block_info(
+    logs: pd.DataFrame,
+    client: BaseRpcClient,
+    block_dict: HeightCacheManager,
+    chain: ChainType | None = None,
+    interpolate: bool = False,
+):
+    """
+    Set block timestamp of logs, timestamps which are not in cache are queried at the same time
+
+    :param interpolate: compute timestamps of blocks in consecutive slots, see interpolate_timestamps
+    """
+    all_heights = set(logs["block_number"].tolist())
+    timestamps = block_dict.get_timestamps(all_heights)
+    heights = sorted(h for h in all_heights if h not in timestamps)
+    if interpolate and chain is not None:
+        new_timestamps = interpolate_timestamps(client, heights, chain)
+    else:
+        new_timestamps = _query_timestamps(client, heights)
+    block_dict.set_timestamps(new_timestamps)
+    timestamps.update(new_timestamps)
+    time_strings = {h: datetime.fromtimestamp(t, UTC).strftime("%Y-%m-%d %H:%M:%S") for h, t in timestamps.items()}
+    logs["block_timestamp"] = logs["block_number"].map(time_strings).astype(object)
 
 
 def set_position_id(row: pd.Series) -> str:
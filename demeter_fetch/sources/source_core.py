@@ -10,9 +10,14 @@ from typing import Dict, List
 import pandas as pd
 
 from .big_query import bigquery_aave, bigquery_pool, bigquery_proxy_lp, bigquery_proxy_transfer, bigquery_transaction
+from .big_query import bigquery_estimate, get_pool_sql, get_proxy_lp_sql, get_proxy_transfer_sql, get_aave_sql
 from .chifra import chifra_pool, chifra_proxy_lp, chifra_proxy_transfer, chifra_aave
-from .rpc import rpc_pool, rpc_proxy_lp, rpc_proxy_transfer, rpc_uni_tx, rpc_aave, rpc_squeeth
-from ..common import DataSource, NodeNames, DailyNode, DailyParam, AaveDailyNode, utils, get_depend_name
+from .rpc import rpc_pool, rpc_proxy_lp, rpc_proxy_transfer, rpc_uni_tx, rpc_aave, rpc_squeeth, rpc_estimate
+from .rpc import sweep_logs, rpc_proxy_lp_by_pool, get_day_heights, remove_swept_day, is_day_finished
+from .source_utils import ContractConfig
+from .. import ChainTypeConfig
+from ..common import DataSource, NodeNames, DailyNode, DailyParam, AaveDailyNode, utils, get_depend_name, KECCAK
+from ..common import FromConfig, WorkEstimate, metrics
 from ..common.nodes import AaveDailyParam
 
 
@@ -27,6 +32,62 @@ class EventLog:
     data = 0
 
 
+def _get_source_cache_key(
+    config: FromConfig, save_path: str, day: date, contract: ContractConfig, *extra: str
+) -> str | None:
+    """
+    Key of raw data in file cache, raw data is decided by chain, source, contract, topics and day.
+    Days which are not finished are not cached, or later runs will get part of the day from cache.
+    """
+    if not is_day_finished(config, save_path, day):
+        return None
+    return "|".join(
+        [
+            config.chain.name,
+            config.data_source.name,
+            contract.name,
+            ",".join(sorted(contract.topics)),
+            day.strftime("%Y-%m-%d"),
+            *extra,
+        ]
+    )
+
+
+def _is_day_cached(node: DailyNode | AaveDailyNode, day: date) -> bool:
+    cache_key = node._get_cache_key(day)
+    return cache_key is not None and node.file_cache.has(cache_key)
+
+
+def _resolve_rpc_days(node: DailyNode | AaveDailyNode, days: List[date]) -> List[date]:
+    """
+    Resolve height range of days which will be queried from rpc, all days are resolved in one pass.
+    Heights are resolved before checking file cache, because only finished days are cached, and they are found
+    in height cache of save path, which might be empty while file cache is shared by save paths.
+
+    :return: days to query, days in file cache are excluded
+    """
+    if node.from_config.data_source != DataSource.rpc:
+        return []
+    if len(days) > 0:
+        get_day_heights(node.from_config, node.to_path, days)
+    if node.file_cache is not None:
+        days = [d for d in days if not _is_day_cached(node, d)]
+    return days
+
+
+def _prepare_rpc_days(node: DailyNode | AaveDailyNode, days: List[date]):
+    query_days = _resolve_rpc_days(node, days)
+    if node.from_config.data_source != DataSource.rpc:
+        return
+    if not node.from_config.rpc.keep_tmp_files:  # swept files of cached days won't be loaded
+        for day in days:
+            if day not in query_days:
+                remove_swept_day(node.from_config, node.to_path, day, node._get_contract())
+    if node.from_config.rpc.sweep_range and len(query_days) > 0:
+        with metrics.record_work(node.name, "sweep"):
+            sweep_logs(node.from_config, node.to_path, query_days, node._get_contract())
+
+
 class UniSourcePool(DailyNode):
     name = NodeNames.uni_pool
 
@@ -41,6 +102,30 @@ class UniSourcePool(DailyNode):
                 df = chifra_pool(self.from_config, self.to_path, day)
         return df
 
+    def _get_contract(self) -> ContractConfig:
+        return ContractConfig(
+            self.from_config.uniswap_config.pool_address,
+            [KECCAK.SWAP.value, KECCAK.BURN.value, KECCAK.COLLECT.value, KECCAK.MINT.value],
+        )
+
+    def _prepare_days(self, days: List[date]):
+        _prepare_rpc_days(self, days)
+
+    def _prepare_estimate(self, days: List[date]):
+        _resolve_rpc_days(self, days)
+
+    def _get_cache_key(self, day: date) -> str | None:
+        return _get_source_cache_key(self.from_config, self.to_path, day, self._get_contract())
+
+    def _estimate_one_day(self, day: date) -> WorkEstimate | None:
+        match self.from_config.data_source:
+            case DataSource.big_query:
+                sql = get_pool_sql(self.from_config, day)
+                return WorkEstimate(bytes_scanned=bigquery_estimate(self.from_config, sql))
+            case DataSource.rpc:
+                return rpc_estimate(self.from_config, self.to_path, day, self._get_contract(), False, False)
+        return None
+
     def _get_file_name(self, param: DailyParam) -> str:
         return (
             f"{self.from_config.chain.name}-{self.from_config.uniswap_config.pool_address}-{param.day.strftime('%Y-%m-%d')}.raw"
@@ -53,20 +138,74 @@ class UniSourcePool(DailyNode):
 
 
 class UniSourceProxyLp(DailyNode):
+    """
+    Logs of uniswap position manager. If proxy_lp_by_pool of rpc is set, only logs in lp transactions of the pool
+    are queried, so this node depends on pool logs, and files are saved by pool.
+    """
+
     name = NodeNames.uni_proxy_lp
 
+    @property
+    def _by_pool(self) -> bool:
+        rpc_config = self.from_config.rpc
+        return self.from_config.data_source == DataSource.rpc and rpc_config is not None and rpc_config.proxy_lp_by_pool
+
+    def get_depend_classes(self) -> List:
+        if self._by_pool:
+            return [UniSourcePool]
+        return super().get_depend_classes()
+
     def _process_one_day(self, data: Dict[str, pd.DataFrame], day: date):
         df: pd.DataFrame | None = None
         match self.from_config.data_source:
             case DataSource.big_query:
                 df = bigquery_proxy_lp(self.from_config, day)
+            case DataSource.rpc if self._by_pool:
+                df = rpc_proxy_lp_by_pool(self.from_config, data[get_depend_name(NodeNames.uni_pool, self.id)])
             case DataSource.rpc:
                 df = rpc_proxy_lp(self.from_config, self.to_path, day)
             case DataSource.chifra:
                 df = chifra_proxy_lp(self.from_config, self.to_path, day)
         return df
 
+    def _get_contract(self) -> ContractConfig:
+        return ContractConfig(
+            ChainTypeConfig[self.from_config.chain]["uniswap_proxy_addr"],
+            [KECCAK.UNI_PROXY_DECREASE.value, KECCAK.UNI_PROXY_INCREASE.value, KECCAK.UNI_PROXY_COLLECT.value],
+        )
+
+    def _prepare_days(self, days: List[date]):
+        if not self._by_pool:
+            _prepare_rpc_days(self, days)
+
+    def _prepare_estimate(self, days: List[date]):
+        if not self._by_pool:
+            _resolve_rpc_days(self, days)
+
+    def _get_cache_key(self, day: date) -> str | None:
+        if self._by_pool:
+            return _get_source_cache_key(
+                self.from_config, self.to_path, day, self._get_contract(), self.from_config.uniswap_config.pool_address
+            )
+        return _get_source_cache_key(self.from_config, self.to_path, day, self._get_contract())
+
+    def _estimate_one_day(self, day: date) -> WorkEstimate | None:
+        match self.from_config.data_source:
+            case DataSource.big_query:
+                sql = get_proxy_lp_sql(self.from_config, day)
+                return WorkEstimate(bytes_scanned=bigquery_estimate(self.from_config, sql))
+            case DataSource.rpc if self._by_pool:
+                return None  # receipts to query are decided by pool logs
+            case DataSource.rpc:
+                return rpc_estimate(self.from_config, self.to_path, day, self._get_contract(), False, False)
+        return None
+
     def _get_file_name(self, param: DailyParam) -> str:
+        if self._by_pool:
+            return (
+                f"{self.from_config.chain.name}-{self.from_config.uniswap_config.pool_address}-proxy-lp-{param.day.strftime('%Y-%m-%d')}.raw"
+                + self._get_file_ext()
+            )
         return (
             f"{self.from_config.chain.name}-uniswap-proxy-lp-{param.day.strftime('%Y-%m-%d')}.raw"
             + self._get_file_ext()
@@ -87,6 +226,27 @@ class UniSourceProxyTransfer(DailyNode):
                 df = chifra_proxy_transfer(self.from_config, self.to_path, day)
         return df
 
+    def _get_contract(self) -> ContractConfig:
+        return ContractConfig(ChainTypeConfig[self.from_config.chain]["uniswap_proxy_addr"], [KECCAK.TRANSFER.value])
+
+    def _prepare_days(self, days: List[date]):
+        _resolve_rpc_days(self, days)
+
+    def _prepare_estimate(self, days: List[date]):
+        _resolve_rpc_days(self, days)
+
+    def _get_cache_key(self, day: date) -> str | None:
+        return _get_source_cache_key(self.from_config, self.to_path, day, self._get_contract())
+
+    def _estimate_one_day(self, day: date) -> WorkEstimate | None:
+        match self.from_config.data_source:
+            case DataSource.big_query:
+                sql = get_proxy_transfer_sql(self.from_config, day)
+                return WorkEstimate(bytes_scanned=bigquery_estimate(self.from_config, sql))
+            case DataSource.rpc:
+                return rpc_estimate(self.from_config, self.to_path, day, self._get_contract(), True, True)
+        return None
+
     def _get_file_name(self, param: DailyParam) -> str:
         return (
             f"{self.from_config.chain.name}-uniswap-proxy-transfer-{param.day.strftime('%Y-%m-%d')}.raw"
@@ -142,6 +302,43 @@ class AaveSource(AaveDailyNode):
             tokens_df[token_addr[0]] = clean_df
         return tokens_df
 
+    def _get_contract(self) -> ContractConfig:
+        return ContractConfig(
+            ChainTypeConfig[self.from_config.chain]["aave_v3_pool_addr"],
+            [
+                KECCAK.AAVE_REPAY.value,
+                KECCAK.AAVE_BORROW.value,
+                KECCAK.AAVE_SUPPLY.value,
+                KECCAK.AAVE_WITHDRAW.value,
+                KECCAK.AAVE_UPDATED.value,
+                KECCAK.AAVE_LIQUIDATION.value,
+            ],
+        )
+
+    def _prepare_days(self, days: List[date]):
+        _prepare_rpc_days(self, days)
+
+    def _prepare_estimate(self, days: List[date]):
+        _resolve_rpc_days(self, days)
+
+    def _get_cache_key(self, day: date) -> str | None:
+        return _get_source_cache_key(
+            self.from_config,
+            self.to_path,
+            day,
+            self._get_contract(),
+            ",".join(sorted(self.from_config.aave_config.tokens)),
+        )
+
+    def _estimate_one_day(self, day: date) -> WorkEstimate | None:
+        match self.from_config.data_source:
+            case DataSource.big_query:
+                sql = get_aave_sql(self.from_config, day, self.from_config.aave_config.tokens)
+                return WorkEstimate(bytes_scanned=bigquery_estimate(self.from_config, sql))
+            case DataSource.rpc:
+                return rpc_estimate(self.from_config, self.to_path, day, self._get_contract(), False, False)
+        return None
+
     def _get_file_name(self, param: AaveDailyParam) -> str:
         return (
             f"{self.from_config.chain.name}-aave_v3-{param.token}-{param.day.strftime('%Y-%m-%d')}.raw"
@@ -170,6 +367,30 @@ class SqueethSource(DailyNode):
 
         return df
 
+    def _get_contract(self) -> ContractConfig:
+        return ContractConfig(
+            ChainTypeConfig[self.from_config.chain]["squeeth_controller"], [KECCAK.SQUEETH_NORM_FACTOR_UPDATED.value]
+        )
+
+    def _prepare_days(self, days: List[date]):
+        if "squeeth_controller" in ChainTypeConfig[self.from_config.chain]:
+            _resolve_rpc_days(self, days)
+
+    def _prepare_estimate(self, days: List[date]):
+        self._prepare_days(days)
+
+    def _get_cache_key(self, day: date) -> str | None:
+        if "squeeth_controller" not in ChainTypeConfig[self.from_config.chain]:
+            return None
+        return _get_source_cache_key(self.from_config, self.to_path, day, self._get_contract())
+
+    def _estimate_one_day(self, day: date) -> WorkEstimate | None:
+        if self.from_config.data_source != DataSource.rpc:
+            return None
+        if "squeeth_controller" not in ChainTypeConfig[self.from_config.chain]:
+            return None
+        return rpc_estimate(self.from_config, self.to_path, day, self._get_contract(), True, True)
+
     def _get_file_name(self, param: DailyParam) -> str:
         return (
             f"{self.from_config.chain.name}-squeeth-controller-{param.day.strftime('%Y-%m-%d')}.raw"
@@ -1,3 +1,4 @@
+import hashlib
 import time
 from dataclasses import dataclass
 from datetime import date, datetime
@@ -9,8 +10,23 @@ from .. import ChainType
 
 @dataclass
 class ContractConfig:
-    address: str
-    topics: List[str]
+    address: str | List[str]  # logs of several contracts can be queried in one request
+    topics: List[str]  # topic0 of events, logs with any of them will be kept
+
+    @property
+    def addresses(self) -> List[str]:
+        return [a.lower() for a in ([self.address] if isinstance(self.address, str) else self.address)]
+
+    @property
+    def name(self) -> str:
+        """
+        Name in file names and logs, it's the address if there is only one
+        """
+        if isinstance(self.address, str):
+            return self.address
+        if len(self.address) == 1:
+            return self.address[0]
+        return "multi-" + hashlib.md5(",".join(sorted(self.addresses)).encode()).hexdigest()[:12]
 
 
 height_cache: Dict[date, Tuple[int, int]] = {}
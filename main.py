@@ -1,7 +1,7 @@
 import sys
 
 import demeter_fetch.common.utils as utils
-from demeter_fetch.core import get_commend_args, download
+from demeter_fetch.core import get_commend_args, download, plan
 from demeter_fetch.tools import date_to_height
 
 if __name__ == "__main__":
@@ -18,4 +18,6 @@ if __name__ == "__main__":
     elif args.tools is not None:
         if args.tools == "date_to_height":
             date_to_height(args)
+        elif args.tools == "plan":
+            plan(args.plan_config)
         pass
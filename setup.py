@@ -20,6 +20,11 @@ setup(
         "db-dtypes>=1.1.1",
         "argparse>=1.4.0",
     ],
+    extras_require={
+        "async": ["aiohttp>=3.9"],
+        "fast": ["orjson>=3.9"],
+        "arrow": ["pyarrow>=14"],
+    },
     entry_points={
         'console_scripts': [
             'demeter-fetch = demeter_fetch.main:main',
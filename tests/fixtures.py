@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2024-04-02 10:20
+# @Author  : 32ethers
+# @Description: Fake nodes and a local json rpc server shared by tests
+import json
+import math
+import threading
+import time
+import unittest
+from datetime import date, datetime, timezone, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List, Tuple
+
+import pandas as pd
+
+from demeter_fetch.common import Config, ToConfig, ToType, DailyNode
+from demeter_fetch.common._typing import ChainType, DappType, DataSource, FromConfig, KECCAK, RetryPolicy
+from demeter_fetch.common._typing import DEFAULT_RETRY_POLICIES, RpcConfig, UniswapConfig
+
+ADDRESS = "0x45dda9cb7c25131df268515131f647d726f50608"
+PROXY_ADDRESS = "0xc36442b4a4522e871399cd717abdd847ab11fe88"
+FAST_RETRY = {k: RetryPolicy(v.retries, 0.01, 0.05) for k, v in DEFAULT_RETRY_POLICIES.items()}
+
+
+class FakeNode:
+    """
+    Fake ethereum node, every address has a swap log in blocks whose height can be divided by 100,
+    and a transfer log in blocks whose height mod 100 is 50
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests: List[dict] = []
+        self.posts = 0
+        self.fail_once = set()  # params of requests which will fail at the first time
+        self.fail_always = set()
+        self.max_logs = 10000  # eth_getLogs fails if there are more logs
+        self.delay = 0  # seconds before response
+        self.http_errors: List[int] = []  # status of next posts, e.g. [429, 503]
+        self.error_message = "busy"
+        self.logs_returned = 0
+        self.skipped_slots: List[int] = []  # a slot is skipped before these heights
+        self.latest = 1000000  # latest height
+
+    def respond(self, request: dict) -> dict:
+        time.sleep(self.delay)
+        with self.lock:
+            self.requests.append(request)
+            key = json.dumps(request["params"])
+            if key in self.fail_once or key in self.fail_always:
+                self.fail_once.discard(key)
+                return {"jsonrpc": "2.0", "id": request["id"], "error": {"code": -32000, "message": self.error_message}}
+        result = self.handle(request["method"], request["params"])
+        if request["method"] == "eth_getLogs" and len(result) > self.max_logs:
+            message = f"query returned more than {self.max_logs} results"
+            return {"jsonrpc": "2.0", "id": request["id"], "error": {"code": -32005, "message": message}}
+        return {"jsonrpc": "2.0", "id": request["id"], "result": result}
+
+    def handle(self, method: str, params: List):
+        match method:
+            case "eth_blockNumber":
+                return hex(self.latest)
+            case "eth_getBlockByNumber":
+                height = int(params[0], 16)
+                slot = height + len([h for h in self.skipped_slots if h <= height])
+                return {"number": params[0], "timestamp": hex(1700000000 + slot * 12)}
+            case "eth_getTransactionByHash":
+                return {
+                    "hash": params[0],
+                    "blockNumber": "0x1",
+                    "transactionIndex": "0x0",
+                    "from": "0x1",
+                    "to": "0x2",
+                    "value": "0x10",
+                }
+            case "eth_getTransactionReceipt":
+                # a position is minted in every transaction, with a log of pool and two logs of position manager
+                height = int(params[0][2:])
+                return {
+                    "transactionHash": params[0],
+                    "logs": [
+                        {
+                            "address": address,
+                            "blockNumber": hex(height),
+                            "transactionHash": params[0],
+                            "transactionIndex": "0x0",
+                            "logIndex": hex(i),
+                            "data": "0x",
+                            "topics": [topic],
+                            "removed": False,
+                        }
+                        for i, (address, topic) in enumerate(
+                            [
+                                (ADDRESS, KECCAK.MINT.value),
+                                (PROXY_ADDRESS, KECCAK.UNI_PROXY_INCREASE.value),
+                                (PROXY_ADDRESS, KECCAK.TRANSFER.value),
+                            ]
+                        )
+                    ],
+                }
+            case "eth_getLogs":
+                start, end = int(params[0]["fromBlock"], 16), int(params[0]["toBlock"], 16)
+                address = params[0]["address"]
+                addresses = [address] if isinstance(address, str) else address
+                topic0 = (params[0]["topics"] or [None])[0]
+                logs = [
+                    {
+                        "address": a,
+                        "blockNumber": hex(h),
+                        "transactionHash": "0x" + str(h).zfill(64),
+                        "transactionIndex": "0x0",
+                        "logIndex": hex(i),
+                        "data": "0x",
+                        "topics": [KECCAK.SWAP.value if h % 100 == 0 else KECCAK.TRANSFER.value],
+                        "removed": False,
+                    }
+                    for h in range(start, end + 1)
+                    if h % 50 == 0
+                    for i, a in enumerate(addresses)
+                ]
+                if topic0 is not None:
+                    topic0 = [topic0] if isinstance(topic0, str) else topic0
+                    logs = [log for log in logs if log["topics"][0] in topic0]
+                with self.lock:
+                    self.logs_returned += len(logs)
+                return logs
+        raise RuntimeError(f"unknown method {method}")
+
+    def count(self, method: str) -> int:
+        with self.lock:
+            return len([r for r in self.requests if r["method"] == method])
+
+
+class RpcServer:
+    def __init__(self):
+        self.node = FakeNode()
+        node = self.node
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with node.lock:
+                    node.posts += 1
+                    status = node.http_errors.pop(0) if len(node.http_errors) > 0 else 200
+                if status != 200:
+                    self.send_response(status)
+                    self.send_header("Retry-After", "0")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if isinstance(request, list):  # batch, responses are in reverse order, client should map them by id
+                    body = json.dumps([node.respond(r) for r in reversed(request)]).encode()
+                else:
+                    body = json.dumps(node.respond(request)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def fake_height_from_date(day: date, *args) -> (int, int):
+    """
+    Height range of a day in FakeNode, block interval is 12 seconds
+    """
+
+    def first_height(d: date):
+        timestamp = datetime.combine(d, datetime.min.time(), tzinfo=timezone.utc).timestamp()
+        return math.ceil((timestamp - 1700000000) / 12)
+
+    return first_height(day), first_height(day + timedelta(days=1)) - 1
+
+
+class RpcServerTestCase(unittest.TestCase):
+    """
+    Start a local rpc server for every test
+    """
+
+    def setUp(self):
+        self.server = RpcServer()
+
+    def tearDown(self):
+        self.server.close()
+
+    def get_config(self, start: date = date(2023, 11, 15), end: date = date(2023, 11, 17), **kwargs) -> FromConfig:
+        """
+        :param kwargs: fields of RpcConfig
+        """
+        return FromConfig(
+            ChainType.ethereum,
+            DataSource.rpc,
+            DappType.uniswap,
+            start,
+            end,
+            uniswap_config=UniswapConfig(ADDRESS, False),
+            rpc=RpcConfig(self.server.url, retry=FAST_RETRY, **kwargs),
+        )
+
+
+class DayNumberNode(DailyNode):
+    name = "day_number"
+
+    def _process_one_day(self, data, day: date) -> pd.DataFrame:
+        return pd.DataFrame({"day": [day.day]})
+
+
+class DayPlusOneNode(DailyNode):
+    name = "day_plus_one"
+
+    def _process_one_day(self, data, day: date) -> pd.DataFrame:
+        df = data["day_number"]
+        df["day"] = df["day"] + 1
+        return df
+
+
+class PickleCountNode(DayNumberNode):
+    """
+    Count how many times it's pickled in this process, e.g. sent to child processes
+    """
+
+    pickled = 0
+
+    def __getstate__(self):
+        PickleCountNode.pickled += 1
+        return self.__dict__
+
+
+def get_day_number_node(save_path: str, multi_process: bool = False) -> DayNumberNode:
+    """
+    A daily node from 2024-01-01 to 2024-01-04, it doesn't request anything
+    """
+    node = DayNumberNode()
+    node.set_config(
+        Config(
+            FromConfig(
+                chain=ChainType.ethereum,
+                data_source=DataSource.rpc,
+                dapp_type=DappType.uniswap,
+                start=date(2024, 1, 1),
+                end=date(2024, 1, 4),
+            ),
+            ToConfig(ToType.tick, save_path, multi_process=multi_process, process_count=2),
+        )
+    )
+    return node
+
+
+def get_day_nodes(save_path: str, multi_process: bool = False) -> Tuple[DayNumberNode, DayPlusOneNode]:
+    """
+    :return: DayNumberNode, and DayPlusOneNode which depends on it
+    """
+    producer = get_day_number_node(save_path, multi_process)
+    consumer = DayPlusOneNode()
+    consumer.set_config(producer.config)
+    consumer.set_depend_instance([producer])
+    return producer, consumer
@@ -3,8 +3,18 @@
 # @Time    : 2024-01-08 12:04
 # @Author  : 32ethers
 # @Description:
+import json
+import os
+import tempfile
+import threading
+import time
 import unittest
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from typing import List, Dict, NamedTuple
+from unittest import mock
+
+import pandas as pd
 
 from demeter_fetch import (
     DappType,
@@ -17,12 +27,21 @@ from demeter_fetch import (
     UniswapConfig,
     TokenConfig,
 )
-from demeter_fetch.common import Node
-from demeter_fetch.core import get_relative_nodes
+from demeter_fetch.common import RpcConfig, DailyParam, WorkEstimate
+from demeter_fetch.common import Node, DailyNode, ResultCache, FileCache, RunManifest, metrics, TimeUtil
+from demeter_fetch.core import get_relative_nodes, NodeScheduler, PipelineScheduler, merge_nodes
+from demeter_fetch.core.downloader import _set_result_cache, download_by_configs
 from demeter_fetch.core.engine import get_root_node
+import demeter_fetch.common.manifest as manifest_module
+import demeter_fetch.core.frames as frames_module
+from demeter_fetch.core.frames import _iter_step_frames
+from demeter_fetch.core.planner import plan_node, plan_by_configs, _format_estimate
 from demeter_fetch.processor_squeeth import SqueethMinute
 from demeter_fetch.processor_uniswap import UniTick, UniUserLP
 from demeter_fetch.processor_uniswap.relative_price import UniRelativePrice
+from demeter_fetch.sources.rpc_utils import HeightCacheManager, estimate_event_by_height, save_tmp_file
+from demeter_fetch.sources.source_utils import ContractConfig
+from tests.fixtures import get_day_number_node, get_day_nodes, PickleCountNode
 
 
 class TreeTest(unittest.TestCase):
@@ -92,3 +111,429 @@ class TreeTest(unittest.TestCase):
                 "osqth_minute",
             ],
         )
+
+
+class DailyNodeTest(unittest.TestCase):
+    def check_work(self, multi_process: bool):
+        with tempfile.TemporaryDirectory() as save_path:
+            node = get_day_number_node(save_path, multi_process)
+            node.work()
+            for param, path in node.get_file_paths.items():
+                self.assertEqual(node.read_file(path)["day"][0], param.day.day)
+
+    def test_work(self):
+        self.check_work(False)
+
+    def test_work_multi_process(self):
+        self.check_work(True)
+
+    def test_send_node_once_per_process(self):
+        with tempfile.TemporaryDirectory() as save_path:
+            node = PickleCountNode()
+            node.set_config(get_day_number_node(save_path, True).config)
+            PickleCountNode.pickled = 0
+            node.work()
+            self.assertLessEqual(PickleCountNode.pickled, 2)  # 4 days in 2 processes
+            self.assertEqual([node.read_file(p)["day"][0] for p in node.get_file_paths.values()], [1, 2, 3, 4])
+
+
+class RecordNode(Node):
+    def __init__(self, name: str, records: List[str], lock: threading.Lock):
+        super().__init__()
+        self.name = name
+        self.records = records
+        self.lock = lock
+        self.config = Config(None, None, name)
+
+    def work(self):
+        with self.lock:
+            self.records.append("start " + self.name)
+        time.sleep(0.1)
+        with self.lock:
+            self.records.append("end " + self.name)
+
+
+class SchedulerTest(unittest.TestCase):
+    def get_nodes(self, records: List[str]) -> List[Node]:
+        lock = threading.Lock()
+        pool, proxy, tick = [RecordNode(n, records, lock) for n in ["pool", "proxy", "tick"]]
+        tick.set_depend_instance([pool, proxy])
+        return [pool, proxy, tick]
+
+    def test_run_independent_nodes(self):
+        records = []
+        NodeScheduler(self.get_nodes(records), 4).run()
+        self.assertEqual(set(records[0:2]), {"start pool", "start proxy"})
+        self.assertEqual(records[4:], ["start tick", "end tick"])
+
+    def test_node_concurrency(self):
+        records = []
+        nodes = self.get_nodes(records)
+        for n in nodes:
+            n.name = "source"
+        NodeScheduler(nodes, 4, {"source": 1}).run()
+        self.assertEqual(records, [f"{a} source" for a in ["start", "end"] * 3])
+
+    def test_pipeline(self):
+        records = []
+        lock = threading.Lock()
+        pool, proxy, tick = [RecordDailyNode(n, records, lock) for n in ["pool", "proxy", "tick"]]
+        tick.set_depend_instance([pool, proxy])
+        PipelineScheduler([pool, proxy, tick], 1).run()
+        self.assertEqual(
+            records,
+            [f"{n} {d}" for d in [1, 2] for n in ["pool", "proxy", "tick"]],
+        )
+
+
+class RecordDailyNode(DailyNode):
+    def __init__(self, name: str, records: List[str], lock: threading.Lock):
+        super().__init__()
+        self.name = name
+        self.records = records
+        self.lock = lock
+        self.set_config(
+            Config(
+                FromConfig(
+                    chain=ChainType.ethereum,
+                    data_source=DataSource.rpc,
+                    dapp_type=DappType.uniswap,
+                    start=date(2024, 1, 1),
+                    end=date(2024, 1, 2),
+                ),
+                ToConfig(ToType.tick, ""),
+                name,
+            )
+        )
+
+    def _work_one_day(self, day: date):
+        with self.lock:
+            self.records.append(f"{self.name} {day.day}")
+
+
+class ResultCacheTest(unittest.TestCase):
+    def test_pass_result_in_memory(self):
+        with tempfile.TemporaryDirectory() as save_path:
+            producer, consumer = get_day_nodes(save_path)
+            cache = ResultCache()
+            for node in [producer, consumer]:
+                node.result_cache = cache
+            producer.consumer_count = 1
+            producer.persist = False
+
+            producer.work()
+            consumer.work()
+            self.assertEqual(len(cache), 0)
+            for param, path in producer.get_file_paths.items():
+                self.assertFalse(os.path.exists(path))
+            for param, path in consumer.get_file_paths.items():
+                self.assertEqual(consumer.read_file(path)["day"][0], param.day.day + 1)
+
+    def test_skip_days_of_finished_consumers(self):
+        with tempfile.TemporaryDirectory() as save_path:
+            producer, consumer = get_day_nodes(save_path)
+            producer.config.to_config.skip_existed = True
+            _set_result_cache([producer, consumer], [consumer], producer.config.to_config)
+            PipelineScheduler([producer, consumer], 1).run()
+
+            os.remove(consumer.get_file_path(DailyParam(date(2024, 1, 3))))
+            days = []
+            process_one_day = producer._process_one_day
+            producer._process_one_day = lambda data, day: days.append(day) or process_one_day(data, day)
+            PipelineScheduler([producer, consumer], 1).run()
+            self.assertEqual(days, [date(2024, 1, 3)])
+            self.assertEqual(len(producer.result_cache), 0)
+            self.assertEqual(consumer.read_file(consumer.get_file_path(DailyParam(date(2024, 1, 3))))["day"][0], 4)
+
+
+class FileCacheTest(unittest.TestCase):
+    def test_get_and_put(self):
+        with tempfile.TemporaryDirectory() as cache_path:
+            cache = FileCache(cache_path, 1024 * 1024)
+            self.assertIsNone(cache.get("a"))
+            cache.put("a", pd.DataFrame({"day": [1]}))
+            self.assertEqual(cache.get("a")["day"][0], 1)
+
+    def test_evict_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as cache_path:
+            cache = FileCache(cache_path, 1024 * 1024)
+            for key in ["a", "b", "c"]:
+                cache.put(key, "x" * 300 * 1024)
+                time.sleep(0.01)
+            cache.get("a")
+            cache.put("d", "x" * 300 * 1024)
+            self.assertIsNotNone(cache.get("a"))
+            self.assertIsNone(cache.get("b"))
+            self.assertIsNotNone(cache.get("c"))
+            self.assertIsNotNone(cache.get("d"))
+
+
+class MergeNodesTest(unittest.TestCase):
+    def get_nodes(self, pool_address: str, proxy_lp_by_pool: bool = False) -> List[Node]:
+        root = get_root_node(DappType.uniswap, ToType.tick)
+        root.set_config(
+            Config(
+                FromConfig(
+                    chain=ChainType.ethereum,
+                    data_source=DataSource.rpc,
+                    dapp_type=DappType.uniswap,
+                    start=date(2024, 1, 1),
+                    end=date(2024, 1, 2),
+                    uniswap_config=UniswapConfig(pool_address),
+                    rpc=RpcConfig("http://localhost:8545", proxy_lp_by_pool=proxy_lp_by_pool),
+                ),
+                ToConfig(ToType.tick, "."),
+            )
+        )
+        return get_relative_nodes(root)
+
+    def test_merge_shared_nodes(self):
+        nodes = merge_nodes([self.get_nodes("0x1"), self.get_nodes("0x2")])
+        self.assertEqual([n.name for n in nodes], ["uni_pool", "uni_proxy_LP", "uni_tick", "uni_pool", "uni_tick"])
+        self.assertTrue(nodes[4].depend_instance[1] is nodes[1])
+
+    def test_proxy_lp_by_pool(self):
+        nodes = merge_nodes([self.get_nodes("0x1", True), self.get_nodes("0x2", True)])
+        # proxy logs depend on pool, and are not shared by pools
+        self.assertEqual([n.name for n in nodes], ["uni_pool", "uni_proxy_LP", "uni_tick"] * 2)
+        self.assertTrue(nodes[1].depend_instance[0] is nodes[0])
+        self.assertIn("0x2-proxy-lp-2024-01-01", nodes[4].get_file_path(DailyParam(date(2024, 1, 1))))
+
+    def test_different_run_settings(self):
+        from_config = FromConfig(
+            chain=ChainType.ethereum,
+            data_source=DataSource.rpc,
+            dapp_type=DappType.uniswap,
+            start=date(2024, 1, 1),
+            end=date(2024, 1, 2),
+            uniswap_config=UniswapConfig("0x1"),
+            rpc=RpcConfig("http://localhost:8545"),
+        )
+        configs = [
+            Config(from_config, ToConfig(ToType.tick, ".", node_workers=2, keep_raw=True)),
+            Config(from_config, ToConfig(ToType.tick, ".", node_workers=4, keep_raw=True)),
+        ]
+        with self.assertRaises(RuntimeError) as ctx:
+            download_by_configs(configs)
+        self.assertIn("node_workers: [2, 4]", str(ctx.exception))
+        self.assertNotIn("keep_raw", str(ctx.exception))
+
+
+class ManifestTest(unittest.TestCase):
+    def test_skip_done_days(self):
+        with tempfile.TemporaryDirectory() as save_path:
+            node = get_day_number_node(save_path)
+            node.work()
+            paths = list(node.get_file_paths.values())
+            manifest = RunManifest(save_path)
+            self.assertEqual(manifest.get(paths[0]).rows, 1)
+            self.assertTrue(all(manifest.is_done(p, DataSource.rpc.name) for p in paths))
+            self.assertFalse(manifest.is_done(paths[0], DataSource.big_query.name))
+
+            with open(paths[1], "w") as f:  # e.g. changed by other program
+                f.write("day\n")
+            os.remove(paths[2])
+            mtime = os.path.getmtime(paths[0])
+            node.config.to_config.skip_existed = True
+            node.work()
+            self.assertEqual(os.path.getmtime(paths[0]), mtime)
+            self.assertEqual(node.read_file(paths[1])["day"][0], 2)
+            self.assertEqual(node.read_file(paths[2])["day"][0], 3)
+            self.assertFalse(any(f.endswith(".tmp") for f in os.listdir(save_path)))
+
+    def test_stale_files(self):
+        with tempfile.TemporaryDirectory() as save_path:
+            node = get_day_number_node(save_path)
+            node.work()
+            paths = list(node.get_file_paths.values())
+            manifest = RunManifest(save_path)
+            source = DataSource.rpc.name
+            with open(paths[0], "rb") as f:
+                content = f.read()
+            with open(paths[0], "wb") as f:  # same size, but different content
+                f.write(content.replace(b"1", b"7"))
+            self.assertFalse(manifest.is_done(paths[0], source))
+            os.utime(paths[1], (0, 0))  # content is not changed
+            self.assertTrue(manifest.is_done(paths[1], source))
+            with mock.patch.object(manifest_module, "CODE_VERSION", "0.0.1"):
+                self.assertFalse(manifest.is_done(paths[2], source))
+            # lines of former versions don't have mtime
+            record = manifest.get(paths[3])._asdict()
+            del record["mtime"]
+            with open(os.path.join(save_path, "manifest.jsonl"), "a") as f:
+                f.write(json.dumps(record) + "\n")
+            self.assertTrue(RunManifest(save_path).is_done(paths[3], source))
+
+
+class PlannerTest(unittest.TestCase):
+    def test_pending_days(self):
+        with tempfile.TemporaryDirectory() as save_path:
+            node = get_day_number_node(save_path)
+            node.config.to_config.skip_existed = True
+            node._work_one_day(date(2024, 1, 2))
+            plan = plan_node(node)
+            self.assertEqual(plan.days, [date(2024, 1, 1), date(2024, 1, 3), date(2024, 1, 4)])
+            self.assertIsNone(plan.estimate)
+
+    def test_plan_by_configs(self):
+        config = MergeNodesTest().get_nodes("0x1")[0].config
+        config.from_config.data_source = DataSource.chifra  # can not estimate, so nothing will be requested
+        plans = plan_by_configs([config])
+        self.assertEqual([p.node.name for p in plans], ["uni_pool", "uni_proxy_LP", "uni_tick"])
+        self.assertEqual(plans[2].depends, ["uni_pool", "uni_proxy_LP"])
+        self.assertEqual(len(plans[0].days), 2)
+
+    def test_estimate_get_logs(self):
+        contract = ContractConfig("0x1", ["0xa", "0xb"])
+        with tempfile.TemporaryDirectory() as save_path:
+            height_cache = HeightCacheManager(ChainType.ethereum, save_path)
+            height_cache.set(100, datetime(2024, 1, 1))
+            self.assertEqual(
+                estimate_event_by_height(ChainType.ethereum, contract, 100, 1099, height_cache, save_path, 2, 200),
+                (5, 999),
+            )
+            self.assertEqual(
+                estimate_event_by_height(
+                    ChainType.ethereum, contract, 100, 1099, height_cache, save_path, 2, 200, True, True
+                ),
+                (10, 0),
+            )
+            # heights in temporary files have been downloaded
+            save_tmp_file(save_path, [], 100, 499, ChainType.ethereum, "0x1")
+            self.assertEqual(
+                estimate_event_by_height(ChainType.ethereum, contract, 100, 1099, height_cache, save_path, 2, 200),
+                (3, 600),
+            )
+
+    def test_format_estimate(self):
+        self.assertEqual(
+            _format_estimate(WorkEstimate(get_logs_calls=5, timestamp_lookups=999)),
+            "eth_getLogs calls: 5, block timestamp lookups (worst case, every block has logs): 999",
+        )
+
+
+class ReadDayNode(Node):
+    """
+    A non-daily node with a file for every day, a file is generated from file of the same day of depend
+    """
+
+    name = "read_day"
+
+    @property
+    def get_file_paths(self) -> Dict[NamedTuple, str]:
+        days = TimeUtil.get_date_array(self.from_config.start, self.from_config.end)
+        return {DailyParam(d): self.get_file_path(DailyParam(d)) for d in days}
+
+    def _process_one(self, data: Dict[str, List[str]], param: NamedTuple) -> pd.DataFrame:
+        depend = self.depend_instance[0]
+        return depend.read_file(depend.get_file_path(param))
+
+
+class MetricsTest(unittest.TestCase):
+    def check_records(self, multi_process: bool):
+        collector = metrics.MetricsCollector()
+        metrics.set_metrics(collector)
+        with tempfile.TemporaryDirectory() as save_path:
+            producer, consumer = get_day_nodes(save_path, multi_process)
+            producer.work()
+            consumer.work()
+        self.assertEqual(
+            [r.param for r in collector.records[:4]], ["2024-01-01", "2024-01-02", "2024-01-03", "2024-01-04"]
+        )
+        summary = collector.summary()
+        self.assertEqual(summary["day_number"]["count"], 4)
+        self.assertEqual(summary["day_number"]["rows_out"], 4)
+        self.assertEqual(summary["day_plus_one"]["rows_in"], 4)
+        self.assertGreater(summary["day_plus_one"]["bytes_read"], 0)
+        self.assertGreater(summary["day_plus_one"]["bytes_written"], 0)
+        self.assertEqual(set(summary["day_plus_one"]["sections"].keys()), {"read", "process", "save"})
+        return collector
+
+    def test_records(self):
+        self.check_records(False)
+
+    def test_bytes_read_of_params(self):
+        collector = metrics.MetricsCollector()
+        metrics.set_metrics(collector)
+        with tempfile.TemporaryDirectory() as save_path:
+            producer = get_day_number_node(save_path)
+            producer.work()
+            node = ReadDayNode()
+            node.set_config(producer.config)
+            node.set_depend_instance([producer])
+            node.work()
+            sizes = [os.path.getsize(p) for p in producer.get_file_paths.values()]
+        self.assertEqual([r.bytes_read for r in collector.records if r.node == "read_day"], sizes)
+
+    def test_record_failed_node(self):
+        collector = metrics.MetricsCollector()
+        metrics.set_metrics(collector)
+        with self.assertRaises(RuntimeError):
+            with metrics.record_node("failed"):
+                time.sleep(0.01)
+                raise RuntimeError("failed")
+        self.assertGreater(collector.summary()["failed"]["seconds"], 0)
+
+    def test_records_multi_process(self):
+        self.check_records(True)
+
+    def test_save_report(self):
+        collector = self.check_records(False)
+        with tempfile.TemporaryDirectory() as save_path:
+            collector.save_report(os.path.join(save_path, "report.csv"))
+            df = pd.read_csv(os.path.join(save_path, "report.csv"))
+            self.assertEqual(len(df.index), 8)
+            self.assertIn("read_seconds", df.columns)
+
+            collector.save_report(os.path.join(save_path, "report.json"))
+            with open(os.path.join(save_path, "report.json")) as f:
+                report = json.load(f)
+            self.assertEqual(report["nodes"]["day_number"]["count"], 4)
+
+            collector.save_prometheus(os.path.join(save_path, "metrics.prom"))
+            with open(os.path.join(save_path, "metrics.prom")) as f:
+                self.assertIn('demeter_fetch_node_rows_out{node="day_number"} 4', f.read())
+
+
+class FramesTest(unittest.TestCase):
+    def check_frames(self, multi_process: bool):
+        with tempfile.TemporaryDirectory() as save_path:
+            producer, consumer = get_day_nodes(save_path, multi_process)
+            frames = list(_iter_step_frames(consumer, [producer, consumer], consumer.config))
+            self.assertEqual([p.day for p, _ in frames], TimeUtil.get_date_array(date(2024, 1, 1), date(2024, 1, 4)))
+            self.assertEqual([df["day"][0] for _, df in frames], [2, 3, 4, 5])
+            self.assertEqual(os.listdir(save_path), [])
+
+    def test_frames(self):
+        self.check_frames(False)
+
+    def test_frames_multi_process(self):
+        self.check_frames(True)
+
+    def test_non_daily_node(self):
+        node = RecordNode("record", [], threading.Lock())
+        node.set_config(get_day_number_node(".").config)
+        with self.assertRaises(RuntimeError):
+            next(_iter_step_frames(node, [node], node.config))
+
+    def test_bounded_days_in_flight(self):
+        with tempfile.TemporaryDirectory() as save_path:
+            producer, consumer = get_day_nodes(save_path, True)
+            with mock.patch.object(frames_module, "ProcessPoolExecutor", CountingExecutor):
+                CountingExecutor.submitted = 0
+                iterator = _iter_step_frames(consumer, [producer, consumer], consumer.config)
+                self.assertEqual(next(iterator)[1]["day"][0], 2)
+                # two processes, one day has been yielded
+                self.assertEqual(CountingExecutor.submitted, 3)
+                time.sleep(0.5)
+                self.assertEqual(CountingExecutor.submitted, 3)
+                self.assertEqual([df["day"][0] for _, df in iterator], [3, 4, 5])
+                self.assertEqual(CountingExecutor.submitted, 4)
+
+
+class CountingExecutor(ProcessPoolExecutor):
+    submitted = 0
+
+    def submit(self, *args, **kwargs):
+        CountingExecutor.submitted += 1
+        return super().submit(*args, **kwargs)
@@ -0,0 +1,781 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2024-03-29 10:40
+# @Author  : 32ethers
+# @Description: Test rpc clients with a local json rpc server
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
+import unittest
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, datetime, timezone, timedelta
+from functools import partial
+from unittest import mock
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+import demeter_fetch.sources.rpc as rpc_source
+import demeter_fetch.sources.rpc_utils as rpc
+from demeter_fetch.sources.rpc_pool import RpcClientPool, PoolEndpoint
+from demeter_fetch.common._typing import ChainType, KECCAK
+from demeter_fetch.sources.source_utils import ContractConfig
+from demeter_fetch.sources.source_core import UniSourcePool, UniSourceProxyTransfer
+from demeter_fetch.core.planner import plan_node
+from demeter_fetch.common import FileCache, Config, ToConfig, ToType
+from tests.fixtures import ADDRESS, FAST_RETRY, RpcServer, RpcServerTestCase, fake_height_from_date
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class RpcClientTest(RpcServerTestCase):
+    batch_size = 1
+
+    def get_client(self) -> rpc.BaseRpcClient:
+        return rpc.EthRpcClient(self.server.url, concurrency=4, batch_size=self.batch_size, retry_policies=FAST_RETRY)
+
+    def test_send_many(self):
+        client = self.get_client()
+        blocks = client.send_many("eth_getBlockByNumber", [[hex(h), False] for h in range(10)])
+        self.assertEqual([int(b["number"], 16) for b in blocks], list(range(10)))
+        client.close()
+
+    def test_query_event_by_height(self):
+        client = self.get_client()
+        with tempfile.TemporaryDirectory() as save_path:
+            height_cache = rpc.HeightCacheManager(ChainType.ethereum, save_path)
+            files = rpc.query_event_by_height(
+                ChainType.ethereum,
+                client,
+                ContractConfig(ADDRESS, [KECCAK.SWAP.value]),
+                1001,
+                2499,
+                height_cache,
+                save_path,
+                save_every_query=2,
+                batch_size=500,
+            )
+            self.assertEqual(len(files), 2)
+            self.assertTrue(files[0].endswith("1001-2000.tmp" + rpc.LOGS_FILE_EXT))
+            logs = pd.concat([rpc.load_tmp_file(f) for f in files]).to_dict("records")
+            self.assertEqual([log["block_number"] for log in logs], list(range(1100, 2500, 100)))
+            self.assertEqual(logs[0]["block_timestamp"], "2023-11-15 01:53:20")
+            self.assertEqual(self.server.node.count("eth_getLogs"), 3)
+            self.assertEqual(self.server.node.count("eth_getBlockByNumber"), 14)
+        client.close()
+
+    def query_logs(self, client, save_path: str, batch_size: int) -> List[dict]:
+        files = rpc.query_event_by_height(
+            ChainType.ethereum,
+            client,
+            ContractConfig(ADDRESS, [KECCAK.SWAP.value]),
+            1001,
+            2499,
+            save_path=save_path,
+            save_every_query=2,
+            batch_size=batch_size,
+            skip_timestamp=True,
+        )
+        return pd.concat([rpc.load_tmp_file(f) for f in files]).to_dict("records")
+
+    def test_split_range_on_too_many_logs(self):
+        client = self.get_client()
+        self.server.node.max_logs = 2
+        with tempfile.TemporaryDirectory() as save_path:
+            logs = self.query_logs(client, save_path, 500)
+            self.assertEqual([log["block_number"] for log in logs], list(range(1100, 2500, 100)))
+            with open(os.path.join(save_path, "ethereum_log_range.json")) as f:
+                self.assertLessEqual(json.load(f)[ADDRESS], 250)
+        client.close()
+
+    def test_grow_range(self):
+        client = self.get_client()
+        with tempfile.TemporaryDirectory() as save_path:
+            self.query_logs(client, save_path, 100)
+            # range grows after the first round, then every temporary file(200 blocks) needs one request
+            self.assertEqual(self.server.node.count("eth_getLogs"), 2 + 7)
+            sizer = rpc.LogRangeSizer(ChainType.ethereum, save_path, 100)
+            self.assertEqual(sizer.get(ADDRESS), 800)
+        client.close()
+
+    def test_not_split_range_on_rate_limit(self):
+        client = self.get_client()
+        self.server.node.error_message = "Too many requests, please slow down"
+        self.server.node.fail_always = {
+            json.dumps(
+                [{"address": ADDRESS, "fromBlock": hex(1001), "toBlock": hex(1500), "topics": [[KECCAK.SWAP.value]]}]
+            )
+        }
+        with tempfile.TemporaryDirectory() as save_path:
+            with self.assertRaises(rpc.EthError):
+                self.query_logs(client, save_path, 500)
+            self.assertEqual(rpc.LogRangeSizer(ChainType.ethereum, save_path, 500).get(ADDRESS), 500)
+        client.close()
+
+    def test_log_range_errors(self):
+        range_messages = [
+            "query returned more than 10000 results",
+            "Log response size exceeded. You can make eth_getLogs requests with up to a 2K block range",
+            "eth_getLogs is limited to a 10,000 range",
+            "block range is too wide",
+        ]
+        for message in range_messages:
+            self.assertTrue(rpc.is_log_range_error(rpc.EthError(-32005, message)), message)
+        for message in ["Too many requests", "rate limited to 10 requests per second", "execution reverted"]:
+            self.assertFalse(rpc.is_log_range_error(rpc.EthError(-32005, message)), message)
+        self.assertFalse(rpc.is_log_range_error(rpc.EthError(429, "slow down, the range is fine")))
+
+    def test_raise_other_errors(self):
+        client = self.get_client()
+        self.server.node.fail_always = {
+            json.dumps(
+                [{"address": ADDRESS, "fromBlock": hex(1001), "toBlock": hex(1500), "topics": [[KECCAK.SWAP.value]]}]
+            )
+        }
+        with tempfile.TemporaryDirectory() as save_path:
+            with self.assertRaises(rpc.EthError):
+                self.query_logs(client, save_path, 500)
+        client.close()
+
+    def test_filter_topics_by_node(self):
+        client = self.get_client()
+        with tempfile.TemporaryDirectory() as save_path:
+            logs = self.query_logs(client, save_path, 500)
+            self.assertEqual([log["block_number"] for log in logs], list(range(1100, 2500, 100)))
+            # transfer logs are not sent
+            self.assertEqual(self.server.node.logs_returned, len(logs))
+            self.assertEqual(self.server.node.count("eth_getLogs"), 3)
+        client.close()
+
+    def test_query_addresses_in_one_request(self):
+        client = self.get_client()
+        other = "0x88e6a0c2ddd26feeb64f039a2c41296fcb3f5640"
+        contract = ContractConfig([ADDRESS, other], [KECCAK.SWAP.value, KECCAK.TRANSFER.value])
+        with tempfile.TemporaryDirectory() as save_path:
+            files = rpc.query_event_by_height(
+                ChainType.ethereum, client, contract, 1001, 1500, save_path=save_path, skip_timestamp=True
+            )
+            self.assertEqual(len(files), 1)
+            self.assertIn(contract.name, files[0])
+            logs = rpc.load_tmp_file(files[0]).to_dict("records")
+            self.assertEqual(len(logs), 20)
+            self.assertEqual({log["address"] for log in logs}, {ADDRESS, other})
+            self.assertEqual(self.server.node.count("eth_getLogs"), 1)
+        client.close()
+
+    def test_retry_http_errors(self):
+        client = self.get_client()
+        self.server.node.http_errors = [429, 503]
+        blocks = client.send_many("eth_getBlockByNumber", [[hex(h), False] for h in range(3)])
+        self.assertEqual([int(b["number"], 16) for b in blocks], list(range(3)))
+        client.close()
+
+    def test_retry_rate_limit_error(self):
+        client = self.get_client()
+        self.server.node.error_message = "Your app has exceeded its compute units per second capacity"
+        self.server.node.fail_once = {json.dumps([hex(1), False])}
+        self.assertEqual(int(client.send("eth_getBlockByNumber", [hex(1), False])["number"], 16), 1)
+        client.close()
+
+    def test_not_retry_get_logs_range_errors(self):
+        param = {"address": ADDRESS, "fromBlock": hex(1001), "toBlock": hex(1500), "topics": None}
+        with mock.patch.object(rpc, "REQUEST_TIMEOUT", 0.3):
+            client = self.get_client()
+            self.server.node.http_errors = [503]
+            with self.assertRaises(rpc.RpcHttpError):
+                client.send("eth_getLogs", [param])
+            self.server.node.delay = 1
+            with self.assertRaises(Exception) as context:
+                client.send("eth_getLogs", [param])
+        self.assertEqual(rpc.classify_error(context.exception), "timeout")
+        self.assertEqual(self.server.node.posts, 2)  # they are split by query_event_by_height instead
+        client.close()
+
+    def test_no_retry(self):
+        client = self.get_client()
+        client.retry_policies = {}
+        self.server.node.http_errors = [503]
+        with self.assertRaises(rpc.RpcHttpError):
+            client.send("eth_getBlockByNumber", [hex(1), False])
+        client.close()
+
+    def test_query_tx(self):
+        client = self.get_client()
+        df = rpc.query_tx(client, pd.Series(["0x1", "0x2", "0x3"]))
+        self.assertEqual(df["transaction_hash"].tolist(), ["0x1", "0x2", "0x3"])
+        client.close()
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class AsyncRpcClientTest(RpcClientTest):
+    def get_client(self) -> rpc.BaseRpcClient:
+        return rpc.AsyncEthRpcClient(
+            self.server.url, concurrency=4, batch_size=self.batch_size, retry_policies=FAST_RETRY
+        )
+
+    def test_share_between_threads(self):
+        client = self.get_client()
+        results = [None] * 4
+
+        def query(index):
+            results[index] = client.send_many("eth_getBlockByNumber", [[hex(h), False] for h in range(index * 10)])
+
+        threads = [threading.Thread(target=query, args=(i,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([len(r) for r in results], [0, 10, 20, 30])
+        client.close()
+
+
+class BatchRpcClientTest(RpcClientTest):
+    batch_size = 4
+
+    def test_post_count(self):
+        client = self.get_client()
+        blocks = client.send_many("eth_getBlockByNumber", [[hex(h), False] for h in range(10)])
+        self.assertEqual([int(b["number"], 16) for b in blocks], list(range(10)))
+        self.assertEqual(self.server.node.posts, 3)
+        client.close()
+
+    def test_retry_failed_items(self):
+        client = self.get_client()
+        self.server.node.error_message = "rate limit exceeded"
+        self.server.node.fail_once = {json.dumps([hex(1), False]), json.dumps([hex(6), False])}
+        blocks = client.send_many("eth_getBlockByNumber", [[hex(h), False] for h in range(8)])
+        self.assertEqual([int(b["number"], 16) for b in blocks], list(range(8)))
+        self.assertEqual(self.server.node.posts, 4)
+        self.assertEqual(self.server.node.count("eth_getBlockByNumber"), 10)  # only failed items are sent again
+        client.close()
+
+    def test_raise_after_retry(self):
+        client = self.get_client()
+        node = self.server.node
+        node.error_message = "rate limit exceeded"
+        node.fail_always = {json.dumps([hex(h), False]) for h in range(2)}
+        with self.assertRaises(rpc.EthError):
+            client.send_many("eth_getBlockByNumber", [[hex(h), False] for h in range(2)])
+        self.assertEqual(node.posts, rpc.BATCH_RETRY + 1)
+        client.close()
+
+    def test_not_retry_rpc_errors(self):
+        client = self.get_client()
+        node = self.server.node
+        node.fail_once = {json.dumps([hex(1), False])}
+        params_list = [[hex(h), False] for h in range(4)]
+        results = client.send_many("eth_getBlockByNumber", params_list, return_exceptions=True)
+        self.assertIsInstance(results[1], rpc.EthError)
+        self.assertEqual([int(results[h]["number"], 16) for h in [0, 2, 3]], [0, 2, 3])
+        self.assertEqual(node.posts, 1)
+        client.close()
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class AsyncBatchRpcClientTest(BatchRpcClientTest, AsyncRpcClientTest):
+    pass
+
+
+class RpcClientPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.servers = [RpcServer(), RpcServer()]
+
+    def tearDown(self):
+        for server in self.servers:
+            server.close()
+
+    def get_pool(self, weights=(1, 1)) -> RpcClientPool:
+        return RpcClientPool(
+            [
+                PoolEndpoint(rpc.EthRpcClient(s.url, retry_policies={}), w, name=s.url)
+                for s, w in zip(self.servers, weights)
+            ],
+            concurrency=4,
+        )
+
+    def test_spread(self):
+        pool = self.get_pool()
+        blocks = pool.send_many("eth_getBlockByNumber", [[hex(h), False] for h in range(40)])
+        self.assertEqual([int(b["number"], 16) for b in blocks], list(range(40)))
+        self.assertGreater(self.servers[0].node.count("eth_getBlockByNumber"), 0)
+        self.assertGreater(self.servers[1].node.count("eth_getBlockByNumber"), 0)
+        pool.close()
+
+    def test_fail_over(self):
+        pool = self.get_pool(weights=(1, 1000000))
+        self.servers[1].close()
+        blocks = pool.send_many("eth_getBlockByNumber", [[hex(h), False] for h in range(20)])
+        self.assertEqual([int(b["number"], 16) for b in blocks], list(range(20)))
+        self.assertEqual(self.servers[0].node.count("eth_getBlockByNumber"), 20)
+        self.assertGreater(pool.endpoints[1].error_count, 0)
+        self.assertGreater(pool.endpoints[1].ejected_until, time.monotonic())
+        self.servers[1] = RpcServer()  # for tear down
+        pool.close()
+
+    def test_raise_json_rpc_error(self):
+        pool = self.get_pool()
+        for server in self.servers:
+            server.node.fail_always = {json.dumps([hex(1), False])}
+        with self.assertRaises(rpc.EthError):
+            pool.send("eth_getBlockByNumber", [hex(1), False])
+        self.assertEqual(pool.endpoints[0].error_count + pool.endpoints[1].error_count, 0)
+        pool.close()
+
+    def test_hedge(self):
+        pool = self.get_pool(weights=(1000000, 1))
+        self.servers[0].node.delay = 1
+        start = time.monotonic()
+        with mock.patch.object(RpcClientPool, "hedge_min_delay", 0.1):
+            with mock.patch.object(RpcClientPool, "default_latency", 0.05):
+                block = pool.send("eth_getBlockByNumber", [hex(5), False])
+        self.assertEqual(int(block["number"], 16), 5)
+        self.assertLess(time.monotonic() - start, 0.9)
+        self.assertEqual(self.servers[1].node.count("eth_getBlockByNumber"), 1)
+        pool.close()
+
+    def test_not_hedge_without_slot(self):
+        pool = RpcClientPool(
+            [PoolEndpoint(rpc.EthRpcClient(s.url, retry_policies={}), w) for s, w in zip(self.servers, (1000000, 1))],
+            concurrency=1,
+        )
+        self.servers[0].node.delay = 0.5
+        with mock.patch.object(RpcClientPool, "hedge_min_delay", 0.1):
+            with mock.patch.object(RpcClientPool, "default_latency", 0.05):
+                block = pool.send("eth_getBlockByNumber", [hex(5), False])
+        self.assertEqual(int(block["number"], 16), 5)
+        self.assertEqual(self.servers[1].node.count("eth_getBlockByNumber"), 0)
+        pool.close()
+
+    def test_shared_concurrency(self):
+        pool = self.get_pool()
+        for server in self.servers:
+            server.node.delay = 0.02
+        lock = threading.Lock()
+        in_flight = [0, 0]  # current, max
+        call_endpoint = pool._call_endpoint
+
+        def counting_call(*args):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight)
+            try:
+                return call_endpoint(*args)
+            finally:
+                with lock:
+                    in_flight[0] -= 1
+
+        pool._call_endpoint = counting_call
+        params = [[hex(h), False] for h in range(20)]
+        with ThreadPoolExecutor(max_workers=3) as executor:  # e.g. three nodes run at the same time
+            results = list(executor.map(lambda _: pool.send_many("eth_getBlockByNumber", params), range(3)))
+        self.assertEqual([[int(b["number"], 16) for b in r] for r in results], [list(range(20))] * 3)
+        self.assertLessEqual(in_flight[1], 4)
+        pool.close()
+
+    def test_token_bucket(self):
+        bucket = rpc.TokenBucket(20)
+        start = time.monotonic()
+        for i in range(30):
+            bucket.acquire()
+        self.assertGreater(time.monotonic() - start, 0.45)
+
+    def test_rate_limiter(self):
+        limiter = rpc.RateLimiter(requests_per_second=100, compute_units_per_second=75)
+        self.assertEqual(limiter.reserve("eth_getLogs"), 0)
+        self.assertAlmostEqual(limiter.reserve("eth_getLogs"), 1, delta=0.05)
+        self.assertAlmostEqual(limiter.reserve("eth_blockNumber"), 1 + 10 / 75, delta=0.05)
+
+
+class DayHeightTest(RpcServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.save_path = self.tmp_dir.name
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmp_dir.cleanup()
+
+    def test_resolve_days(self):
+        days = [date(2023, 11, 15) + timedelta(days=i) for i in range(30)]
+        day_heights = rpc_source.get_day_heights(self.get_config(), self.save_path, days)
+        self.assertEqual(day_heights, {d: fake_height_from_date(d) for d in days})
+        self.assertLess(self.server.node.count("eth_getBlockByNumber"), 200)
+        # saved in height cache
+        self.assertEqual(
+            rpc_source.get_day_heights(self.get_config(), self.save_path, days[3:5]),
+            {d: fake_height_from_date(d) for d in days[3:5]},
+        )
+        self.assertEqual(self.server.node.count("eth_blockNumber"), 1)
+
+    def test_skipped_slots(self):
+        self.server.node.skipped_slots = [1000, 1001, 5000]
+        day_heights = rpc_source.get_day_heights(self.get_config(), self.save_path, [date(2023, 11, 15)])
+        # 2023-11-16 starts at slot 7734, and three slots are skipped before it
+        self.assertEqual(day_heights, {date(2023, 11, 15): (534, 7730)})
+
+    def test_unfinished_day(self):
+        self.server.node.latest = 5000
+        day = date(2023, 11, 15)
+        self.assertEqual(rpc_source.get_day_height(self.get_config(), self.save_path, day), (534, 5000))
+        self.server.node.latest = 20000
+        self.assertEqual(rpc_source.get_day_height(self.get_config(), self.save_path, day), (534, 7733))
+
+    def test_cache_finished_days(self):
+        self.server.node.latest = 5000
+        config = self.get_config()
+        node = UniSourcePool()
+        node.set_config(Config(config, ToConfig(ToType.raw, self.save_path)))
+        day = date(2023, 11, 15)
+        rpc_source.get_day_height(config, self.save_path, day)
+        self.assertFalse(rpc_source.is_day_finished(config, self.save_path, day))
+        self.assertIsNone(node._get_cache_key(day))
+        self.server.node.latest = 20000
+        rpc_source.get_day_height(config, self.save_path, day)
+        self.assertTrue(rpc_source.is_day_finished(config, self.save_path, day))
+        self.assertIsNotNone(node._get_cache_key(day))
+
+    def test_plan_resolves_all_days(self):
+        node = UniSourcePool()
+        node.set_config(Config(self.get_config(), ToConfig(ToType.raw, self.save_path)))
+        plan = plan_node(node)
+        self.assertEqual(len(plan.days), 3)
+        self.assertIsNotNone(plan.estimate)
+        # heights of the three days are resolved in one pass, then read from height cache
+        self.assertEqual(self.server.node.count("eth_blockNumber"), 1)
+
+    def test_proxy_transfer_prepare_days(self):
+        node = UniSourceProxyTransfer()
+        node.set_config(Config(self.get_config(), ToConfig(ToType.raw, self.save_path)))
+        days = [date(2023, 11, 15), date(2023, 11, 16)]
+        node._prepare_days(days)
+        self.assertTrue(all(rpc_source.is_day_finished(node.from_config, self.save_path, d) for d in days))
+
+    def test_etherscan_fallback(self):
+        self.server.node.fail_always.add("[]")  # eth_blockNumber
+        day = date(2023, 11, 15)
+        with mock.patch.object(rpc_source, "get_height_from_date", fake_height_from_date):
+            self.assertEqual(rpc_source.get_day_height(self.get_config(), self.save_path, day), (534, 7733))
+            self.assertTrue(rpc_source.is_day_finished(self.get_config(), self.save_path, day))
+            with self.assertRaises(Exception):
+                rpc_source.get_day_height(
+                    self.get_config(etherscan_fallback=False), self.save_path, day + timedelta(days=1)
+                )
+
+
+class SweepTest(RpcServerTestCase):
+
+    def query_days(self, save_path: str, sweep_range: bool) -> Tuple[List[pd.DataFrame], int]:
+        """
+        :return: dataframes of days, and eth_getLogs calls
+        """
+        config = self.get_config(sweep_range=sweep_range)
+        days = [date(2023, 11, 15), date(2023, 11, 16), date(2023, 11, 17)]
+        calls = self.server.node.count("eth_getLogs")
+        if sweep_range:
+            topics = [KECCAK.SWAP.value, KECCAK.BURN.value, KECCAK.COLLECT.value, KECCAK.MINT.value]
+            rpc_source.sweep_logs(config, save_path, days, ContractConfig(ADDRESS, topics))
+        dfs = [rpc_source.rpc_pool(config, save_path, day) for day in days]
+        # temporary files are removed
+        self.assertEqual([f for f in os.listdir(save_path) if ".tmp." in f or ".sweep." in f], [])
+        return dfs, self.server.node.count("eth_getLogs") - calls
+
+    def test_sweep(self):
+        with tempfile.TemporaryDirectory() as save_path:
+            self.query_days(save_path, False)  # learn block range of eth_getLogs
+            daily_dfs, daily_calls = self.query_days(save_path, False)
+            swept_dfs, swept_calls = self.query_days(save_path, True)
+        for daily_df, swept_df in zip(daily_dfs, swept_dfs):
+            self.assertEqual(len(daily_df.index), 72)
+            pd.testing.assert_frame_equal(daily_df.reset_index(drop=True), swept_df.reset_index(drop=True))
+        self.assertEqual(daily_calls, 6)  # a day has 7200 blocks, and a temporary file has 5000 blocks
+        self.assertLess(swept_calls, daily_calls)
+
+    def test_load_day_without_sweep(self):
+        config = self.get_config(sweep_range=True)
+        with tempfile.TemporaryDirectory() as save_path:
+            df = rpc_source.rpc_pool(config, save_path, date(2023, 11, 16))
+        self.assertEqual(df["block_number"].tolist(), list(range(7800, 14901, 100)))
+
+    def test_skip_cached_days(self):
+        config = self.get_config(sweep_range=True)
+        node = UniSourcePool()
+        node.set_config(Config(config, ToConfig(ToType.raw, ".")))
+        days = [date(2023, 11, 15), date(2023, 11, 16), date(2023, 11, 17)]
+        with tempfile.TemporaryDirectory() as save_path:
+            node.to_path = save_path
+            node.file_cache = FileCache(os.path.join(save_path, "cache"), 1024 * 1024)
+            rpc_source.get_day_heights(config, save_path, days[:1])  # only finished days are cached
+            node.file_cache.put(node._get_cache_key(days[0]), pd.DataFrame())
+            # left by a former run
+            swept_path = rpc_source.get_swept_day_path(save_path, config.chain, node._get_contract(), days[0])
+            rpc.save_logs_file(swept_path, pd.DataFrame())
+            node._prepare_days(days)
+            swept_days = [
+                d
+                for d in days
+                if os.path.exists(rpc_source.get_swept_day_path(save_path, config.chain, node._get_contract(), d))
+            ]
+            self.assertEqual(swept_days, days[1:])
+
+    def test_cache_of_other_save_path(self):
+        config = self.get_config(sweep_range=True)
+        days = [date(2023, 11, 15), date(2023, 11, 16), date(2023, 11, 17)]
+        with tempfile.TemporaryDirectory() as cache_path, tempfile.TemporaryDirectory() as save_path:
+            file_cache = FileCache(cache_path, 1024 * 1024)
+            with tempfile.TemporaryDirectory() as former_path:  # cached by a run with another save path
+                node = UniSourcePool()
+                node.set_config(Config(config, ToConfig(ToType.raw, former_path)))
+                rpc_source.get_day_heights(config, former_path, days[:1])
+                file_cache.put(node._get_cache_key(days[0]), pd.DataFrame({"block_number": [1]}))
+            node = UniSourcePool()
+            node.set_config(Config(config, ToConfig(ToType.raw, save_path)))
+            node.file_cache = file_cache
+            node._prepare_days(days)
+            swept_days = [
+                d
+                for d in days
+                if os.path.exists(rpc_source.get_swept_day_path(save_path, config.chain, node._get_contract(), d))
+            ]
+            self.assertEqual(swept_days, days[1:])
+            self.assertEqual(node._process_with_cache(days[0], None)["block_number"].tolist(), [1])
+
+
+class ProxyLpByPoolTest(RpcServerTestCase):
+
+    def test_query_receipts_of_lp_transactions(self):
+        config = self.get_config(end=date(2023, 11, 15), proxy_lp_by_pool=True)
+        tx_hashes = ["0x" + str(h).zfill(64) for h in [100, 200, 200, 300]]
+        pool_df = pd.DataFrame(
+            {
+                "block_number": [100, 200, 200, 300],
+                "block_timestamp": pd.to_datetime(
+                    ["2023-11-15 00:00:01"] + ["2023-11-15 00:00:02"] * 2 + ["2023-11-15 00:00:03"]
+                ),
+                "transaction_hash": tx_hashes,
+                "transaction_index": [0, 0, 0, 0],
+                "log_index": [0, 0, 1, 0],
+                "topics": [[KECCAK.SWAP.value], [KECCAK.MINT.value], [KECCAK.COLLECT.value], [KECCAK.BURN.value]],
+                "data": ["0x"] * 4,
+            }
+        )
+        df = rpc_source.rpc_proxy_lp_by_pool(config, pool_df)
+        self.assertEqual(self.server.node.count("eth_getTransactionReceipt"), 2)
+        self.assertEqual(self.server.node.count("eth_getLogs"), 0)
+        self.assertEqual(df["transaction_hash"].tolist(), tx_hashes[1:2] + tx_hashes[3:])
+        self.assertEqual(df["block_timestamp"].tolist(), ["2023-11-15 00:00:02", "2023-11-15 00:00:03"])
+        self.assertEqual(df["topics"].tolist(), [[KECCAK.UNI_PROXY_INCREASE.value]] * 2)
+        self.assertEqual(df.columns.tolist()[:3], ["block_number", "block_timestamp", "transaction_hash"])
+
+    def test_day_without_pool_logs(self):
+        config = self.get_config(end=date(2023, 11, 15), proxy_lp_by_pool=True)
+        columns = ["block_number", "block_timestamp", "transaction_hash", "transaction_index", "log_index"]
+        pool_df = pd.DataFrame(columns=columns + ["topics", "data"])
+        df = rpc_source.rpc_proxy_lp_by_pool(config, pool_df)
+        self.assertEqual(len(df.index), 0)
+        self.assertEqual(df.columns.tolist(), columns + ["topics", "data"])
+        self.assertEqual(self.server.node.count("eth_getTransactionReceipt"), 0)
+
+
+class TmpFileTest(unittest.TestCase):
+    def test_load_tmp_file_of_former_versions(self):
+        with tempfile.TemporaryDirectory() as save_path:
+            logs = [{"block_number": 1, "transaction_hash": "0x1", "log_index": 0, "block_dt": datetime(2024, 1, 1)}]
+            path = os.path.join(save_path, f"ethereum-{ADDRESS}-1-10.tmp.pkl")
+            with open(path, "wb") as f:
+                pickle.dump(logs, f)
+            self.assertEqual(
+                rpc.find_logs_file(rpc.get_tmp_file_path(save_path, 1, 10, ChainType.ethereum, ADDRESS)), path
+            )
+            df = rpc_source._logs_to_df([rpc.load_tmp_file(path)])
+        self.assertEqual(df.columns.tolist(), ["block_number", "transaction_hash", "log_index"])
+
+    def test_broken_write(self):
+        with tempfile.TemporaryDirectory() as save_path:
+            path = rpc.get_tmp_file_path(save_path, 1, 10, ChainType.ethereum, ADDRESS)
+            writer = (rpc.feather, "write_feather") if rpc.pa is not None else (rpc.pickle, "dump")
+            with mock.patch.object(*writer, side_effect=KeyboardInterrupt):
+                with self.assertRaises(KeyboardInterrupt):
+                    rpc.save_tmp_file(save_path, self.get_logs(True), 1, 10, ChainType.ethereum, ADDRESS)
+            self.assertIsNone(rpc.find_logs_file(path))
+
+    def test_concat_sorted_files(self):
+        logs = self.get_logs(True)
+        df = rpc_source._logs_to_df([logs.iloc[:1], logs.iloc[1:]])
+        self.assertEqual(df.index.tolist(), [0, 1])
+        df = rpc_source._logs_to_df([logs.iloc[1:], logs.iloc[:1]])
+        self.assertEqual(df["block_number"].tolist(), [1, 2])
+        same_block = logs.assign(block_number=[1, 1], log_index=[6, 5])
+        self.assertEqual(rpc_source._logs_to_df([same_block])["log_index"].tolist(), [5, 6])
+
+    def test_release_assembled_frames(self):
+        refs = []
+        alive = []
+
+        def iter_frames():
+            for i in range(4):
+                df = self.get_logs(i % 2 == 0).assign(block_number=[i * 2 + 1, i * 2 + 2])
+                # frames before the former one have been taken and released
+                alive.append([r() is not None for r in refs[:-1]])
+                refs.append(weakref.ref(df))
+                yield df
+
+        df = rpc_source._logs_to_df(iter_frames())
+        self.assertEqual(alive, [[], [], [False], [False, False]])
+        self.assertEqual(df["block_number"].tolist(), list(range(1, 9)))
+        self.assertEqual(df.index.tolist(), list(range(8)))
+        self.assertNotIn("block_timestamp", df.columns)  # not all files have timestamp
+
+    def test_single_frame_without_copy(self):
+        logs = self.get_logs(True).iloc[1:]
+        df = rpc_source._logs_to_df(iter([logs]))
+        self.assertTrue(np.shares_memory(df["block_number"].to_numpy(), logs["block_number"].to_numpy()))
+        self.assertEqual(df.index.tolist(), [0])
+
+    def get_logs(self, with_timestamp: bool) -> pd.DataFrame:
+        df = pd.DataFrame(
+            {
+                "block_number": [1, 2],
+                "transaction_hash": ["0x1", "0x2"],
+                "transaction_index": [0, 3],
+                "log_index": [5, 6],
+                "address": [ADDRESS, ADDRESS],
+                "data": ["0x", "0x01"],
+                "topics": [[KECCAK.SWAP.value], [KECCAK.MINT.value, "0x02"]],
+            }
+        )
+        if with_timestamp:
+            df["block_timestamp"] = ["2023-11-15 00:00:00", "2023-11-15 00:00:12"]
+        return df
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as save_path:
+            for with_timestamp in [True, False]:
+                logs = self.get_logs(with_timestamp)
+                path = rpc.save_tmp_file(save_path, logs, 1, 10, ChainType.ethereum, ADDRESS)
+                pd.testing.assert_frame_equal(rpc.load_tmp_file(path), logs)
+                self.assertEqual(rpc.load_tmp_file(path)["topics"].tolist(), logs["topics"].tolist())
+            empty_path = rpc.save_tmp_file(save_path, logs.iloc[:0], 11, 20, ChainType.ethereum, ADDRESS)
+            self.assertEqual(len(rpc.load_tmp_file(empty_path).index), 0)
+
+    @unittest.skipIf(rpc.pa is None, "pyarrow is not installed")
+    def test_concat_arrow_files(self):
+        with tempfile.TemporaryDirectory() as save_path:
+            paths = [
+                rpc.save_tmp_file(save_path, self.get_logs(True), 1, 10, ChainType.ethereum, ADDRESS),
+                rpc.save_tmp_file(save_path, self.get_logs(True).iloc[:0], 11, 20, ChainType.ethereum, ADDRESS),
+                rpc.save_tmp_file(save_path, self.get_logs(True), 21, 30, ChainType.ethereum, ADDRESS),
+            ]
+            frames = list(rpc.load_tmp_files(paths))
+            self.assertEqual(len(frames), 1)
+            expected = pd.concat([self.get_logs(True)] * 2, ignore_index=True)
+            pd.testing.assert_frame_equal(frames[0], expected)
+            # files without timestamp
+            paths.append(rpc.save_tmp_file(save_path, self.get_logs(False), 31, 40, ChainType.ethereum, ADDRESS))
+            self.assertEqual(len(next(rpc.load_tmp_files(paths)).index), 6)
+
+
+def _save_heights(save_path: str, start: int):
+    cache = rpc.HeightCacheManager(ChainType.ethereum, save_path)
+    cache.set_timestamps({h: 1700000000 + h * 12 for h in range(start, start + 100)})
+    cache.close()
+
+
+class HeightCacheTest(unittest.TestCase):
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as save_path:
+            cache = rpc.HeightCacheManager(ChainType.ethereum, save_path)
+            cache.set(10, datetime(2024, 1, 1, tzinfo=timezone.utc))
+            cache.set_timestamps({11: 1704067212, 20: 1704067320})
+            self.assertTrue(cache.has(11))
+            cache.save()
+            cache.close()
+            cache = rpc.HeightCacheManager(ChainType.ethereum, save_path)
+            self.assertEqual(cache.get(10), datetime(2024, 1, 1, tzinfo=timezone.utc))
+            self.assertEqual(cache.get_timestamps(range(11, 20)), {11: 1704067212})
+            self.assertIsNone(cache.get(12))
+            cache.close()
+
+    def test_sparse_heights(self):
+        with tempfile.TemporaryDirectory() as save_path:
+            cache = rpc.HeightCacheManager(ChainType.ethereum, save_path)
+            cache.set_timestamps({h: 1700000000 + h * 12 for h in range(0, 3000, 2)})
+            cache.save()
+            cache.set_timestamps({5: 1700000060})
+            heights = {0, 5, 7, 1998} | set(range(2000, 2600, 2))  # more heights than a query can have
+            expected = {h: 1700000000 + h * 12 for h in heights if h != 7}
+            self.assertEqual(cache.get_timestamps(heights), expected)
+            self.assertEqual(cache.get_timestamps([2998, 3000]), {2998: 1700035976})
+            cache.close()
+
+    def test_save_path_not_exist(self):
+        with tempfile.TemporaryDirectory() as save_path:
+            save_path = os.path.join(save_path, "new")
+            cache = rpc.HeightCacheManager(ChainType.ethereum, save_path)
+            cache.set_timestamps({1: 1700000012})
+            cache.set_day_heights({date(2023, 11, 15): (534, 7733)})
+            cache.save()
+            self.assertEqual(cache.get_timestamps([1]), {1: 1700000012})
+            self.assertEqual(cache.get_day_heights([date(2023, 11, 15)]), {date(2023, 11, 15): (534, 7733)})
+            cache.close()
+            self.assertFalse(os.path.exists(save_path))
+
+    def test_import_legacy_file(self):
+        with tempfile.TemporaryDirectory() as save_path:
+            legacy_path = os.path.join(save_path, "ethereum_height_timestamp.pkl")
+            with open(legacy_path, "wb") as f:
+                pickle.dump({5: datetime(2024, 1, 1, tzinfo=timezone.utc)}, f)
+            cache = rpc.HeightCacheManager(ChainType.ethereum, save_path)
+            self.assertEqual(cache.get_timestamps([5]), {5: 1704067200})
+            self.assertFalse(os.path.exists(legacy_path))
+            cache.close()
+
+    def test_write_in_processes(self):
+        with tempfile.TemporaryDirectory() as save_path:
+            with ProcessPoolExecutor(max_workers=4) as executor:
+                list(executor.map(partial(_save_heights, save_path), range(0, 800, 100)))
+            cache = rpc.HeightCacheManager(ChainType.ethereum, save_path)
+            self.assertEqual(len(cache.get_timestamps(range(0, 1000))), 800)
+            cache.close()
+
+
+class HeightRangeTest(unittest.TestCase):
+    def test_iter_height_ranges(self):
+        self.assertEqual(list(rpc._iter_height_ranges(100, 350, 100)), [(100, 199), (200, 299), (300, 350)])
+        self.assertEqual(list(rpc._iter_height_ranges(100, 100, 100)), [(100, 100)])
+        self.assertEqual(list(rpc._iter_height_ranges(101, 100, 100)), [])
+        # ranges are generated when they are needed
+        self.assertEqual(next(rpc._iter_height_ranges(0, 10**15, 5000)), (0, 4999))
+
+
+class InterpolateTimestampTest(RpcServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = rpc.EthRpcClient(self.server.url, retry_policies=FAST_RETRY)
+
+    def tearDown(self):
+        self.client.close()
+        super().tearDown()
+
+    def test_interpolate(self):
+        self.server.node.skipped_slots = [20000500, 20000501, 20000800]
+        heights = list(range(20000000, 20001000, 5))
+        timestamps = rpc.interpolate_timestamps(self.client, heights, ChainType.ethereum)
+        self.assertEqual(timestamps, rpc._query_timestamps(self.client, heights))
+        # exact queries after interpolation
+        self.assertLess(self.server.node.count("eth_getBlockByNumber") - len(heights), 40)
+
+    def test_no_interpolation_before_slots(self):
+        timestamps = rpc.interpolate_timestamps(self.client, [100, 200, 300], ChainType.ethereum)
+        self.assertEqual(timestamps, {h: 1700000000 + h * 12 for h in [100, 200, 300]})
+        self.assertEqual(self.server.node.count("eth_getBlockByNumber"), 3)
+        rpc.interpolate_timestamps(self.client, [100, 200, 300], ChainType.arbitrum)
+        self.assertEqual(self.server.node.count("eth_getBlockByNumber"), 6)